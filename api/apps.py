@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+
+"""Configure the GraphQL API app."""
+
+from django.apps import AppConfig  # type: ignore[import]
+
+
+class ApiConfig(AppConfig):
+    """Connect the signal receivers of the API app."""
+
+    name = 'api'
+
+    def ready(self):  # noqa: D102
+        from api import signals  # noqa: F401, WPS433
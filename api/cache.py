@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+"""
+Cache of GraphQL responses.
+
+Responses are cached per process in a size bound LRU and keyed by the
+normalised query document, the variables, the operation name and the host
+the request was made for (which determines the Wagtail site).
+
+All processes share a generation file. Publishing or unpublishing pages and
+changing form fields bumps the generation, and every process drops its
+cached responses when it notices the change on its next lookup.
+"""
+
+import collections
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+
+from django.conf import settings  # type: ignore[import]
+from graphql.language import ast as gqlast  # type: ignore[import]
+from graphql.language import visitor as gqlvisitor  # type: ignore[import]
+from graphql.language.parser import parse  # type: ignore[import]
+from graphql.language.printer import print_ast  # type: ignore[import]
+
+
+class Generation(object):
+    """Shared counter that changes whenever cached content goes stale."""
+
+    def __init__(self, path):  # noqa: D107
+        self.path = path
+
+    def current(self):
+        """Return a value that changes with every bump."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def bump(self):
+        """Mark everything cached so far as stale."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}'
+        with open(tmp_path, 'w') as generation_file:
+            generation_file.write(str(time.time_ns()))
+        os.replace(tmp_path, self.path)
+
+
+class ResponseCache(object):
+    """LRU of serialised responses bound by entry count and size."""
+
+    def __init__(self, max_entries, max_bytes, generation):  # noqa: D107
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.generation = generation
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._seen_generation = generation.current()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_generation(self):
+        current = self.generation.current()
+        if current != self._seen_generation:
+            self._entries.clear()
+            self._size = 0
+            self._seen_generation = current
+
+    def get(self, key):
+        """Return cached response or ``None``."""
+        with self._lock:
+            self._check_generation()
+            response = self._entries.get(key)
+            if response is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return response
+
+    def set(self, key, response):  # noqa: WPS125
+        """Cache a response and evict the least recently used ones."""
+        size = len(response)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._check_generation()
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = response
+            self._size += size
+            while (
+                len(self._entries) > self.max_entries
+                or self._size > self.max_bytes
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def invalidate(self):
+        """Drop the cached responses of all processes."""
+        self.generation.bump()
+        with self._lock:
+            self._check_generation()
+
+    def stats(self):
+        """Return hit and miss counters and the current size."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._entries),
+            'bytes': self._size,
+        }
+
+
+class _UncacheableFinder(gqlvisitor.Visitor):
+    """Find operations whose result must not be cached."""
+
+    def __init__(self):  # noqa: D107
+        self.found = False
+
+    def enter_OperationDefinition(self, node, *args):  # noqa: N802, D102
+        if node.operation != 'query':
+            self.found = True
+
+    def enter_Argument(self, node, *args):  # noqa: N802, D102
+        # Preview tokens resolve unpublished revisions.
+        if node.name.value == 'token':
+            self.found = True
+
+
+@functools.lru_cache(maxsize=1024)
+def normalise_query(query):
+    """
+    Return the normalised document, or ``None`` if it must not be cached.
+
+    Whitespace, comments and formatting differences are normalised away by
+    printing the parsed document. Documents that do not parse, mutations,
+    subscriptions and preview queries are not cacheable.
+
+    """  # noqa: DAR101, DAR201
+    try:
+        document = parse(query)
+    except Exception:
+        return None
+    finder = _UncacheableFinder()
+    gqlvisitor.visit(document, finder)
+    if finder.found or not any(
+        isinstance(definition, gqlast.OperationDefinition)
+        for definition in document.definitions
+    ):
+        return None
+    return print_ast(document)
+
+
+def make_key(query, variables, operation_name, host):
+    """Return cache key of a request, or ``None`` if it is not cacheable."""
+    normalised = normalise_query(query or '')
+    if normalised is None:
+        return None
+    key_data = json.dumps(
+        [normalised, variables or {}, operation_name, host],
+        sort_keys=True,
+        separators=(',', ':'),
+    )
+    return hashlib.sha256(key_data.encode()).hexdigest()
+
+
+response_cache = ResponseCache(
+    max_entries=settings.API_GRAPHQL_CACHE_MAX_ENTRIES,
+    max_bytes=settings.API_GRAPHQL_CACHE_MAX_BYTES,
+    generation=Generation(settings.API_GRAPHQL_CACHE_GENERATION_FILE),
+)
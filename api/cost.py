@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""
+Static cost and depth analysis of GraphQL queries.
+
+Queries are analysed before they are executed. Every field that returns an
+object costs its weight (1 unless configured otherwise in
+``API_GRAPHQL_FIELD_WEIGHTS``), scalar fields are free. Fields returning
+lists, e.g. grapple fields with ``is_list=True``, multiply the cost of their
+selections by the ``limit`` argument if one is given and by
+``API_GRAPHQL_DEFAULT_LIST_SIZE`` otherwise. Queries deeper than
+``API_GRAPHQL_MAX_DEPTH`` or more expensive than ``API_GRAPHQL_MAX_COST`` are
+rejected.
+"""
+
+import collections
+
+from django.conf import settings  # type: ignore[import]
+from graphql.language import ast as gqlast  # type: ignore[import]
+from graphql.type import definition as gqldef  # type: ignore[import]
+
+QueryCost = collections.namedtuple('QueryCost', ['cost', 'depth'])
+
+LIST_SIZE_ARGUMENTS = ('limit', 'first', 'perPage')
+
+
+class CostAnalyser(object):
+    """Compute cost and depth of an operation of a document."""
+
+    def __init__(self, schema, document_ast, variables=None):  # noqa: D107
+        self.schema = schema
+        self.variables = variables or {}
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document_ast.definitions
+            if isinstance(definition, gqlast.FragmentDefinition)
+        }
+        self.operations = [
+            definition
+            for definition in document_ast.definitions
+            if isinstance(definition, gqlast.OperationDefinition)
+        ]
+        self.weights = settings.API_GRAPHQL_FIELD_WEIGHTS
+        self.default_list_size = settings.API_GRAPHQL_DEFAULT_LIST_SIZE
+
+    def analyse(self, operation_name=None):
+        """Return cost and depth of the operation that would be executed."""
+        operation = self.get_operation(operation_name)
+        if operation is None:
+            return QueryCost(cost=0, depth=0)
+        root_type = {
+            'query': self.schema.get_query_type,
+            'mutation': self.schema.get_mutation_type,
+            'subscription': self.schema.get_subscription_type,
+        }[operation.operation]()
+        return self.analyse_selection_set(
+            operation.selection_set,
+            root_type,
+            visited_fragments=frozenset(),
+        )
+
+    def get_operation(self, operation_name):  # noqa: D102
+        for operation in self.operations:
+            if operation_name is None or (
+                operation.name and operation.name.value == operation_name
+            ):
+                return operation
+        return None
+
+    def analyse_selection_set(self, selection_set, parent_type, visited_fragments):
+        """Return summed cost and maximum depth of the selections."""
+        cost = 0
+        depth = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, gqlast.Field):
+                field_cost = self.analyse_field(
+                    selection,
+                    parent_type,
+                    visited_fragments,
+                )
+                cost += field_cost.cost
+                depth = max(depth, field_cost.depth)
+                continue
+            if isinstance(selection, gqlast.FragmentSpread):
+                name = selection.name.value
+                if name in visited_fragments or name not in self.fragments:
+                    continue
+                fragment = self.fragments[name]
+                visited = visited_fragments | {name}
+            else:
+                fragment = selection
+                visited = visited_fragments
+            fragment_type = parent_type
+            if fragment.type_condition is not None:
+                fragment_type = self.schema.get_type(
+                    fragment.type_condition.name.value,
+                )
+            fragment_cost = self.analyse_selection_set(
+                fragment.selection_set,
+                fragment_type or parent_type,
+                visited,
+            )
+            cost += fragment_cost.cost
+            depth = max(depth, fragment_cost.depth)
+        return QueryCost(cost=cost, depth=depth)
+
+    def analyse_field(self, field_node, parent_type, visited_fragments):
+        """Return cost and depth of a field including its selections."""
+        fields = getattr(parent_type, 'fields', None) or {}
+        field_definition = fields.get(field_node.name.value)
+        if field_definition is None or field_node.selection_set is None:
+            # Scalars, introspection and unknown fields (left to validation).
+            return QueryCost(cost=0, depth=1)
+        field_type = field_definition.type
+        multiplier = 1
+        while isinstance(field_type, (gqldef.GraphQLNonNull, gqldef.GraphQLList)):
+            if isinstance(field_type, gqldef.GraphQLList):
+                multiplier *= self.get_list_size(field_node)
+            field_type = field_type.of_type
+        weight = self.weights.get(
+            f'{parent_type.name}.{field_node.name.value}',
+            1,
+        )
+        children = self.analyse_selection_set(
+            field_node.selection_set,
+            field_type,
+            visited_fragments,
+        )
+        return QueryCost(
+            cost=weight * multiplier + multiplier * children.cost,
+            depth=children.depth + 1,
+        )
+
+    def get_list_size(self, field_node):
+        """Return the requested list size or the configured default."""
+        for argument in field_node.arguments or []:
+            if argument.name.value not in LIST_SIZE_ARGUMENTS:
+                continue
+            value_node = argument.value
+            if isinstance(value_node, gqlast.Variable):
+                size = self.variables.get(value_node.name.value)
+            elif isinstance(value_node, gqlast.IntValue):
+                size = value_node.value
+            else:
+                size = None
+            try:
+                return max(int(size), 0)
+            except (TypeError, ValueError):
+                return self.default_list_size
+        return self.default_list_size
+
+
+def check(query_cost):
+    """Return error message if the query exceeds a limit, else ``None``."""
+    max_depth = settings.API_GRAPHQL_MAX_DEPTH
+    max_cost = settings.API_GRAPHQL_MAX_COST
+    if max_depth is not None and query_cost.depth > max_depth:
+        return f'Query depth {query_cost.depth} exceeds maximum of {max_depth}.'
+    if max_cost is not None and query_cost.cost > max_cost:
+        return f'Query cost {query_cost.cost} exceeds maximum of {max_cost}.'
+    return None
+
+
+def as_extension(query_cost):
+    """Return cost information for the response extensions."""
+    return {
+        'cost': query_cost.cost,
+        'maxCost': settings.API_GRAPHQL_MAX_COST,
+        'depth': query_cost.depth,
+        'maxDepth': settings.API_GRAPHQL_MAX_DEPTH,
+    }
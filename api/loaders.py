@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+"""
+Request-scoped DataLoaders for GraphQL resolvers.
+
+Resolving a relation for every object of a list fires one query per object.
+The loaders collect the keys requested while a level of the query is
+resolved and fetch all of them with one ``IN`` query. Loaders are cached on
+the request (the GraphQL context), so nothing is shared between requests.
+"""
+
+import collections
+
+from promise import Promise  # type: ignore[import]
+from promise.dataloader import DataLoader  # type: ignore[import]
+
+
+class RelatedListLoader(DataLoader):
+    """Load the objects that point to each key through ``field_name``."""
+
+    def __init__(self, queryset, field_name):  # noqa: D107
+        super().__init__()
+        self.queryset = queryset
+        self.field_name = field_name
+
+    def batch_load_fn(self, keys):  # noqa: D102
+        grouped = collections.defaultdict(list)
+        related_objects = self.queryset.filter(
+            **{f'{self.field_name}__in': keys},
+        )
+        for related_object in related_objects:
+            grouped[getattr(related_object, self.field_name)].append(
+                related_object,
+            )
+        return Promise.resolve([grouped.get(key, []) for key in keys])
+
+
+class ObjectLoader(DataLoader):
+    """Load objects by primary key."""
+
+    def __init__(self, queryset):  # noqa: D107
+        super().__init__()
+        self.queryset = queryset
+
+    def batch_load_fn(self, keys):  # noqa: D102
+        objects = self.queryset.in_bulk(keys)
+        return Promise.resolve([objects.get(key) for key in keys])
+
+
+def get_loader(context, key, factory):
+    """Return loader cached on the context, creating it if needed."""
+    if context is None:
+        return factory()
+    loaders = getattr(context, 'graphql_loaders', None)
+    if loaders is None:
+        loaders = {}
+        context.graphql_loaders = loaders
+    if key not in loaders:
+        loaders[key] = factory()
+    return loaders[key]
+
+
+def related_list(context, queryset, field_name):
+    """Return loader of the objects in ``queryset`` related by ``field_name``."""
+    return get_loader(
+        context,
+        ('related_list', queryset.model._meta.label, field_name),
+        lambda: RelatedListLoader(queryset, field_name),
+    )
+
+
+def object_by_pk(context, queryset):
+    """Return loader of the objects in ``queryset`` by primary key."""
+    return get_loader(
+        context,
+        ('object_by_pk', queryset.model._meta.label),
+        lambda: ObjectLoader(queryset),
+    )
+
+
+def load_related_list(info, queryset, field_name, key):
+    """Load the objects related to ``key`` in the current GraphQL request."""
+    return related_list(info.context, queryset, field_name).load(key)
+
+
+def load_object(info, queryset, pk):
+    """Load an object by primary key in the current GraphQL request."""
+    if pk is None:
+        return None
+    return object_by_pk(info.context, queryset).load(pk)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""Register the GraphQL queries exported by the frontend build."""
+
+import json
+import os
+
+from django.core.management.base import BaseCommand  # type: ignore[import]
+from django.core.management.base import CommandError  # type: ignore[import]
+
+from api import persisted
+
+QUERY_FILE_EXTENSIONS = ('.graphql', '.gql')
+
+
+class Command(BaseCommand):
+    """Register persisted queries from manifest and query files."""
+
+    help = (  # noqa: WPS125
+        'Register persisted GraphQL queries. Accepts JSON manifests mapping '
+        'sha256 hashes to queries (or lists of queries), .graphql files and '
+        'directories containing either.'
+    )
+
+    def add_arguments(self, parser):  # noqa: D102
+        parser.add_argument('paths', nargs='+')
+
+    def handle(self, *args, **options):  # noqa: D102
+        queries = []
+        for path in options['paths']:
+            queries.extend(self.collect(path))
+        registered = 0
+        for query in queries:
+            registered += persisted.register(query)
+        self.stdout.write(
+            f'Registered {registered} new of {len(queries)} queries.',
+        )
+
+    def collect(self, path):
+        """Return queries found at the path."""
+        if os.path.isdir(path):
+            queries = []
+            for dirpath, _, filenames in os.walk(path):
+                for filename in sorted(filenames):
+                    if filename.endswith(QUERY_FILE_EXTENSIONS + ('.json',)):
+                        queries.extend(
+                            self.collect(os.path.join(dirpath, filename)),
+                        )
+            return queries
+        with open(path, encoding='utf-8') as query_file:
+            content = query_file.read()
+        if path.endswith(QUERY_FILE_EXTENSIONS):
+            return [content]
+        return self.read_manifest(path, json.loads(content))
+
+    def read_manifest(self, path, manifest):
+        """Return queries of a manifest after checking their hashes."""
+        if isinstance(manifest, list):
+            return manifest
+        for sha256_hash, query in manifest.items():
+            if persisted.get_hash(query) != sha256_hash:
+                raise CommandError(
+                    f'Hash {sha256_hash} in {path} does not match its query.',
+                )
+        return list(manifest.values())
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+"""Define API models."""
+
+from django.db import models as djm  # type: ignore[import]
+
+
+class PersistedQuery(djm.Model):
+    """GraphQL query document registered under its sha256 hash."""
+
+    SOURCE_BUILD = 'build'
+    # Queries clients used to persist automatically. They are no longer
+    # stored, and existing rows are not trusted as registered.
+    SOURCE_CLIENT = 'client'
+    SOURCE_CHOICES = [
+        (SOURCE_BUILD, 'Frontend build'),
+        (SOURCE_CLIENT, 'Client'),
+    ]
+
+    sha256_hash = djm.CharField(max_length=64, unique=True)
+    query = djm.TextField()
+    source = djm.CharField(max_length=16, choices=SOURCE_CHOICES)
+    created_at = djm.DateTimeField(auto_now_add=True)
+
+    class Meta:  # noqa: D106, WPS306
+        verbose_name_plural = 'persisted queries'
+
+    def __str__(self):  # noqa: D105
+        return self.sha256_hash
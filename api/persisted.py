@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+"""
+Automatic persisted queries.
+
+Clients may send the sha256 hash of a query document instead of (or in
+addition to) the document itself, following the automatic persisted query
+protocol of Apollo::
+
+    {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": "..."}}}
+
+Unknown hashes are answered with ``PersistedQueryNotFound``, after which the
+client retries with hash and document. Documents sent by clients are never
+stored in the database: once parsed and validated, they are kept in an LRU
+keyed by their hash, which also lets repeated queries skip parsing and
+validation. The LRU is per process, so a client may be asked for a document
+again by another worker.
+
+Queries exported by the frontend build are registered in the database with
+``manage.py register_persisted_queries``. With
+``API_GRAPHQL_PERSISTED_QUERIES_ONLY`` only these are executed.
+"""
+
+import collections
+import functools
+import hashlib
+import json
+import threading
+
+from django import http as djhttp  # type: ignore[import]
+from django.conf import settings  # type: ignore[import]
+from graphene_django import views as gdviews  # type: ignore[import]
+from graphql import backend as gqlbackend  # type: ignore[import]
+from graphql.backend import core as gqlcore  # type: ignore[import]
+from graphql.execution import ExecutionResult  # type: ignore[import]
+from graphql.language.parser import parse  # type: ignore[import]
+from graphql.validation import validate  # type: ignore[import]
+
+from api import models
+
+NOT_FOUND_MESSAGE = 'PersistedQueryNotFound'
+
+
+def get_hash(query):
+    """Return sha256 hex digest of a query document."""
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+class DocumentCache(object):
+    """LRU of parsed and validated documents keyed by their hash."""
+
+    def __init__(self, max_entries):  # noqa: D107
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return cached document or ``None``."""
+        with self._lock:
+            document = self._entries.get(key)
+            if document is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return document
+
+    def set(self, key, document):  # noqa: WPS125
+        """Cache a document and evict the least recently used ones."""
+        with self._lock:
+            self._entries[key] = document
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):  # noqa: D102
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+document_cache = DocumentCache(settings.API_GRAPHQL_DOCUMENT_CACHE_SIZE)
+
+# Hashes of registered queries seen by this process. Registered queries are
+# never deleted, so they are kept for good.
+registered_hashes = set()
+
+
+class CachingBackend(gqlcore.GraphQLCoreBackend):
+    """GraphQL backend that parses and validates each document only once."""
+
+    def document_from_string(self, schema, document_string):
+        """Return cached document, or parse and validate the string."""  # noqa: DAR101, DAR201
+        key = get_hash(document_string)
+        document = document_cache.get(key)
+        if document is not None:
+            return document
+        document_ast = parse(document_string)
+        validation_errors = validate(schema, document_ast)
+        if validation_errors:
+            return gqlbackend.GraphQLDocument(
+                schema=schema,
+                document_string=document_string,
+                document_ast=document_ast,
+                execute=lambda *args, **kwargs: ExecutionResult(
+                    errors=validation_errors,
+                    invalid=True,
+                ),
+            )
+        document = gqlbackend.GraphQLDocument(
+            schema=schema,
+            document_string=document_string,
+            document_ast=document_ast,
+            execute=functools.partial(
+                gqlcore.execute_and_validate,
+                schema,
+                document_ast,
+                validate=False,
+                **self.execute_params,
+            ),
+        )
+        document_cache.set(key, document)
+        return document
+
+
+def get_requested_hash(request, data):
+    """Return the persisted query hash sent with the request, if any."""
+    extensions = request.GET.get('extensions') or data.get('extensions')
+    if not extensions:
+        return None
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            raise gdviews.HttpError(
+                djhttp.HttpResponseBadRequest(),
+                'Extensions are invalid JSON.',
+            )
+    persisted_query = extensions.get('persistedQuery') or {}
+    return persisted_query.get('sha256Hash')
+
+
+def get_registered_queries():
+    """Return queryset of the queries registered by the frontend build."""
+    return models.PersistedQuery.objects.filter(
+        source=models.PersistedQuery.SOURCE_BUILD,
+    )
+
+
+def lookup(sha256_hash):
+    """Return the cached or registered query of a hash or ``None``."""
+    document = document_cache.get(sha256_hash)
+    if document is not None:
+        return document.document_string
+    return get_registered_queries().filter(
+        sha256_hash=sha256_hash,
+    ).values_list('query', flat=True).first()
+
+
+def is_registered(sha256_hash):
+    """Return whether the frontend build registered the query of a hash."""
+    if sha256_hash in registered_hashes:
+        return True
+    if get_registered_queries().filter(sha256_hash=sha256_hash).exists():
+        registered_hashes.add(sha256_hash)
+        return True
+    return False
+
+
+def register(query):
+    """Register a query of the frontend build, return whether it is new."""
+    _, created = models.PersistedQuery.objects.update_or_create(
+        sha256_hash=get_hash(query),
+        defaults={
+            'query': query,
+            'source': models.PersistedQuery.SOURCE_BUILD,
+        },
+    )
+    return created
+
+
+def reject_unregistered():
+    """Raise error response for queries that are not registered."""
+    raise gdviews.HttpError(
+        djhttp.HttpResponseBadRequest(),
+        'Only registered persisted queries are allowed.',
+    )
+
+
+def resolve_query(query, sha256_hash):
+    """
+    Return the query document to execute.
+
+    Queries sent with their hash are not stored here: the backend caches
+    their document once it is valid.
+
+    Raises:
+        HttpError: If the hash is unknown, does not match the query or the
+            query is not registered while only persisted queries are allowed.
+
+    """  # noqa: DAR101, DAR201
+    persisted_only = settings.API_GRAPHQL_PERSISTED_QUERIES_ONLY
+    if sha256_hash is None:
+        if persisted_only and query and not is_registered(get_hash(query)):
+            reject_unregistered()
+        return query
+    if not query:
+        if persisted_only and not is_registered(sha256_hash):
+            reject_unregistered()
+        query = lookup(sha256_hash)
+        if query is None:
+            raise gdviews.HttpError(djhttp.HttpResponse(), NOT_FOUND_MESSAGE)
+        return query
+    if get_hash(query) != sha256_hash:
+        raise gdviews.HttpError(
+            djhttp.HttpResponseBadRequest(),
+            'Provided sha256Hash does not match query.',
+        )
+    if persisted_only and not is_registered(sha256_hash):
+        reject_unregistered()
+    return query
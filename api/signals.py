@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+"""
+Invalidate the GraphQL response cache when content changes.
+
+The generation is bumped once the change commits. Bumped before, a request
+in between could cache the old content again under the new generation.
+"""
+
+from django.db import transaction  # type: ignore[import]
+from django.db.models import signals as djsignals  # type: ignore[import]
+from wagtail.core import models as wtm  # type: ignore[import]
+from wagtail.core import signals as wtsignals  # type: ignore[import]
+
+from api import cache
+from forms import models as forms_models
+
+
+def invalidate_response_cache(sender, **kwargs):
+    """Drop cached GraphQL responses of all processes on commit."""
+    transaction.on_commit(cache.response_cache.invalidate)
+
+
+def invalidate_on_page_delete(sender, instance, **kwargs):
+    """Drop cached GraphQL responses when a live page is deleted."""
+    if isinstance(instance, wtm.Page) and instance.live:
+        transaction.on_commit(cache.response_cache.invalidate)
+
+
+wtsignals.page_published.connect(invalidate_response_cache)
+wtsignals.page_unpublished.connect(invalidate_response_cache)
+# Deleting a page of any type deletes its Page row. A receiver for every
+# sender would keep Django from deleting other models without fetching them.
+djsignals.post_delete.connect(invalidate_on_page_delete, sender=wtm.Page)
+djsignals.post_save.connect(
+    invalidate_response_cache,
+    sender=forms_models.FormField,
+)
+djsignals.post_delete.connect(
+    invalidate_response_cache,
+    sender=forms_models.FormField,
+)
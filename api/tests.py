@@ -0,0 +1,570 @@
+# -*- coding: utf-8 -*-
+
+"""Test for the API app."""
+
+from http import HTTPStatus
+import json
+import os
+import sqlite3
+
+from django.core import management as djmgmt  # type: ignore[import]
+from django.db import connection as djconnection  # type: ignore[import]
+from django.db import connections  # type: ignore[import]
+from django.test import utils as djtu  # type: ignore[import]
+from django.core.management.base import CommandError  # type: ignore[import]
+import pytest  # type: ignore[import]
+
+from api import cache
+from api import cost
+from api import models
+from api import persisted
+from contact_form_prototype import routers
+from content.models import SomePage
+from forms.models import FormPage
+from home.models import HomePage
+
+PAGES_QUERY = '{ pages { id title } }'
+
+
+@pytest.fixture
+def graphql(client):
+    """Return function that POSTs a GraphQL query and returns the response."""
+    def _graphql(query, variables=None, extensions=None, **extra):  # noqa: WPS430
+        payload = {'query': query, 'variables': variables}
+        if extensions is not None:
+            payload['extensions'] = extensions
+        return client.post(
+            '/graphql',
+            json.dumps(payload),
+            content_type='application/json',
+            **extra,
+        )
+    return _graphql
+
+
+@pytest.fixture
+def response_cache(monkeypatch, tmp_path):
+    """Replace the response cache with an empty one."""
+    response_cache = cache.ResponseCache(
+        max_entries=10,
+        max_bytes=1024 * 1024,
+        generation=cache.Generation(str(tmp_path / 'generation')),
+    )
+    monkeypatch.setattr(cache, 'response_cache', response_cache)
+    return response_cache
+
+
+class TestResponseCache(object):
+    """Test caching of GraphQL responses."""
+
+    def test_repeated_query_is_hit(
+        self,
+        contact_form_page,
+        graphql,
+        response_cache,
+        django_assert_num_queries,
+    ):  # noqa: D102
+        first = graphql(PAGES_QUERY)
+
+        with django_assert_num_queries(0):
+            second = graphql('query {\n  pages {\n    id\n    title\n  }\n}')
+
+        assert first['X-Cache'] == 'MISS'
+        assert second['X-Cache'] == 'HIT'
+        assert second.content == first.content
+        assert b'Contact' in second.content
+
+    def test_variables_and_host_are_part_of_key(
+        self,
+        contact_form_page,
+        graphql,
+        response_cache,
+    ):  # noqa: D102
+        graphql(PAGES_QUERY)
+
+        other_variables = graphql(PAGES_QUERY, variables={'unused': 1})
+        other_host = graphql(PAGES_QUERY, HTTP_HOST='other.example.com')
+
+        assert other_variables['X-Cache'] == 'MISS'
+        assert other_host['X-Cache'] == 'MISS'
+
+    def test_publish_invalidates(
+        self,
+        contact_form_page,
+        graphql,
+        response_cache,
+        run_on_commit,
+    ):  # noqa: D102
+        graphql(PAGES_QUERY)
+        contact_form_page.title = 'Get in touch'
+
+        contact_form_page.save_revision().publish()
+        before_commit = graphql(PAGES_QUERY)
+        run_on_commit()
+        res = graphql(PAGES_QUERY)
+
+        assert before_commit['X-Cache'] == 'HIT'
+
+        assert res['X-Cache'] == 'MISS'
+        assert b'Get in touch' in res.content
+
+    def test_form_field_change_invalidates(
+        self,
+        contact_form_page,
+        graphql,
+        response_cache,
+        run_on_commit,
+    ):  # noqa: D102
+        graphql(PAGES_QUERY)
+
+        contact_form_page.form_fields.first().save()
+        run_on_commit()
+
+        assert graphql(PAGES_QUERY)['X-Cache'] == 'MISS'
+
+    def test_invalidation_reaches_other_processes(
+        self,
+        response_cache,
+    ):  # noqa: D102
+        other_process = cache.ResponseCache(
+            max_entries=10,
+            max_bytes=1024,
+            generation=cache.Generation(response_cache.generation.path),
+        )
+        other_process.set('key', '{}')
+
+        response_cache.invalidate()
+
+        assert other_process.get('key') is None
+
+    def test_preview_and_invalid_queries_bypass(
+        self,
+        graphql,
+        response_cache,
+        db,
+    ):  # noqa: D102
+        preview = graphql('{ page(id: 1, token: "abc") { id } }')
+        invalid = graphql('{ pages { ')
+
+        assert preview['X-Cache'] == 'BYPASS'
+        assert invalid['X-Cache'] == 'BYPASS'
+        assert invalid.status_code == HTTPStatus.BAD_REQUEST
+
+    def test_errors_are_not_cached(
+        self,
+        graphql,
+        response_cache,
+        db,
+    ):  # noqa: D102
+        graphql('{ pages { doesNotExist } }')
+
+        assert graphql('{ pages { doesNotExist } }')['X-Cache'] == 'MISS'
+
+    def test_lru_is_bound_by_entries_and_bytes(
+        self,
+        response_cache,
+    ):  # noqa: D102
+        response_cache.max_entries = 2
+        response_cache.max_bytes = 10
+        response_cache.set('a', '1234')
+        response_cache.set('b', '1234')
+        response_cache.get('a')
+
+        response_cache.set('c', '1234')
+
+        assert response_cache.get('b') is None
+        assert response_cache.get('a') == '1234'
+        assert response_cache.stats()['bytes'] == 8
+
+
+def persisted_query(sha256_hash):
+    """Return extensions of a persisted query request."""
+    return {'persistedQuery': {'version': 1, 'sha256Hash': sha256_hash}}
+
+
+class TestPersistedQueries(object):
+    """Test automatic persisted queries."""
+
+    @pytest.fixture(autouse=True)
+    def empty_document_cache(self, settings):  # noqa: D102
+        settings.API_GRAPHQL_CACHE = False
+        persisted.document_cache.clear()
+        persisted.registered_hashes.clear()
+        yield persisted.document_cache
+        persisted.document_cache.clear()
+        persisted.registered_hashes.clear()
+
+    def test_unknown_hash_not_found(self, graphql, db):  # noqa: D102
+        res = graphql(None, extensions=persisted_query('0' * 64))
+
+        assert res.status_code == HTTPStatus.OK
+        assert res.json()['errors'][0]['message'] == 'PersistedQueryNotFound'
+
+    def test_query_with_hash_is_cached_not_stored(self, graphql, db):  # noqa: D102, E501
+        sha256_hash = persisted.get_hash(PAGES_QUERY)
+
+        first = graphql(PAGES_QUERY, extensions=persisted_query(sha256_hash))
+        second = graphql(None, extensions=persisted_query(sha256_hash))
+
+        assert not models.PersistedQuery.objects.exists()
+        assert second.status_code == HTTPStatus.OK
+        assert second.content == first.content
+        assert 'pages' in second.json()['data']
+
+    def test_invalid_query_with_hash_is_forgotten(self, graphql, db):  # noqa: D102, E501
+        query = '{ pages { doesNotExist } }'
+        sha256_hash = persisted.get_hash(query)
+
+        graphql(query, extensions=persisted_query(sha256_hash))
+        res = graphql(None, extensions=persisted_query(sha256_hash))
+
+        assert res.json()['errors'][0]['message'] == 'PersistedQueryNotFound'
+        assert not models.PersistedQuery.objects.exists()
+
+    def test_hash_mismatch_bad_request(self, graphql, db):  # noqa: D102
+        res = graphql(PAGES_QUERY, extensions=persisted_query('0' * 64))
+
+        assert res.status_code == HTTPStatus.BAD_REQUEST
+
+    def test_repeated_query_skips_parse_and_validation(
+        self,
+        graphql,
+        db,
+        empty_document_cache,
+        monkeypatch,
+    ):  # noqa: D102
+        graphql(PAGES_QUERY)
+        monkeypatch.setattr(persisted, 'parse', None)
+        monkeypatch.setattr(persisted, 'validate', None)
+
+        res = graphql(PAGES_QUERY)
+
+        assert res.status_code == HTTPStatus.OK
+        assert empty_document_cache.misses == 1
+
+    def test_invalid_documents_are_not_cached(
+        self,
+        graphql,
+        db,
+        empty_document_cache,
+    ):  # noqa: D102
+        res = graphql('{ pages { doesNotExist } }')
+
+        assert res.status_code == HTTPStatus.BAD_REQUEST
+        assert empty_document_cache.get(
+            persisted.get_hash('{ pages { doesNotExist } }'),
+        ) is None
+
+    def test_persisted_only_rejects_unregistered(
+        self,
+        graphql,
+        db,
+        settings,
+    ):  # noqa: D102
+        settings.API_GRAPHQL_PERSISTED_QUERIES_ONLY = True
+        persisted.register(PAGES_QUERY)
+
+        registered = graphql(PAGES_QUERY)
+        unregistered = graphql('{ pages { id } }')
+
+        assert registered.status_code == HTTPStatus.OK
+        assert unregistered.status_code == HTTPStatus.BAD_REQUEST
+        assert models.PersistedQuery.objects.count() == 1
+
+    def test_persisted_only_rejects_client_persisted(
+        self,
+        graphql,
+        db,
+        settings,
+    ):  # noqa: D102
+        query = '{ pages { id } }'
+        sha256_hash = persisted.get_hash(query)
+        graphql(query, extensions=persisted_query(sha256_hash))
+        models.PersistedQuery.objects.create(
+            sha256_hash=sha256_hash,
+            query=query,
+            source=models.PersistedQuery.SOURCE_CLIENT,
+        )
+        settings.API_GRAPHQL_PERSISTED_QUERIES_ONLY = True
+
+        with_query = graphql(query, extensions=persisted_query(sha256_hash))
+        by_hash = graphql(None, extensions=persisted_query(sha256_hash))
+
+        assert with_query.status_code == HTTPStatus.BAD_REQUEST
+        assert by_hash.status_code == HTTPStatus.BAD_REQUEST
+
+    def test_register_command(self, db, tmp_path):  # noqa: D102
+        query_file = tmp_path / 'queries' / 'pages.graphql'
+        query_file.parent.mkdir()
+        query_file.write_text(PAGES_QUERY)
+        manifest = tmp_path / 'manifest.json'
+        other_query = '{ pages { id } }'
+        manifest.write_text(json.dumps({
+            persisted.get_hash(other_query): other_query,
+        }))
+
+        djmgmt.call_command(
+            'register_persisted_queries',
+            str(query_file.parent),
+            str(manifest),
+        )
+
+        assert set(
+            models.PersistedQuery.objects.values_list('source', flat=True),
+        ) == {models.PersistedQuery.SOURCE_BUILD}
+        assert persisted.lookup(persisted.get_hash(PAGES_QUERY)) == PAGES_QUERY
+
+    def test_register_command_checks_hashes(self, db, tmp_path):  # noqa: D102
+        manifest = tmp_path / 'manifest.json'
+        manifest.write_text(json.dumps({'0' * 64: PAGES_QUERY}))
+
+        with pytest.raises(CommandError):
+            djmgmt.call_command('register_persisted_queries', str(manifest))
+
+
+RELATIONS_QUERY = """
+{
+  pages {
+    id
+    ... on FormPage {
+      formFields { label }
+      usedOnPage { id }
+    }
+    ... on SomePage {
+      contactForm { id title }
+    }
+  }
+}
+"""
+
+
+class TestDataLoaders(object):
+    """Test batching of relation lookups across pages."""
+
+    @pytest.fixture(autouse=True)
+    def no_response_cache(self, settings):  # noqa: D102
+        settings.API_GRAPHQL_CACHE = False
+
+    def add_pages(self, count):  # noqa: D102
+        home_page = HomePage.objects.first()
+        for index in range(count):
+            form_page = FormPage(title=f'Form {index}')
+            home_page.add_child(instance=form_page)
+            form_page.form_fields.create(label='Email', field_type='email')
+            form_page.save()
+            home_page.add_child(instance=SomePage(
+                title=f'Page {index}',
+                intro='Intro',
+                contact_form=form_page,
+            ))
+
+    def count_queries(self, graphql):  # noqa: D102
+        with djtu.CaptureQueriesContext(djconnection) as context:
+            res = graphql(RELATIONS_QUERY)
+        assert res.status_code == HTTPStatus.OK
+        assert 'errors' not in res.json()
+        return len(context.captured_queries), res.json()['data']['pages']
+
+    def test_query_count_is_constant(self, graphql, db):  # noqa: D102
+        self.add_pages(2)
+        few_queries, _ = self.count_queries(graphql)
+
+        self.add_pages(8)
+        many_queries, pages = self.count_queries(graphql)
+
+        assert many_queries == few_queries
+        assert len(pages) == 22
+
+    def test_relations_are_resolved(self, graphql, db):  # noqa: D102
+        self.add_pages(2)
+
+        _, pages = self.count_queries(graphql)
+
+        form_pages = [page for page in pages if 'formFields' in page]
+        some_pages = [page for page in pages if 'contactForm' in page]
+        assert [
+            field['label'] for field in form_pages[0]['formFields']
+        ] == ['Email', 'Spammer Jammer']
+        assert form_pages[0]['usedOnPage'] == [{'id': some_pages[0]['id']}]
+        assert some_pages[1]['contactForm'] == {
+            'id': form_pages[1]['id'],
+            'title': 'Form 1',
+        }
+
+
+class TestQueryCost(object):
+    """Test static cost and depth limits."""
+
+    @pytest.fixture(autouse=True)
+    def cost_settings(self, settings):  # noqa: D102
+        settings.API_GRAPHQL_CACHE = False
+        settings.API_GRAPHQL_DEFAULT_LIST_SIZE = 10
+        settings.API_GRAPHQL_FIELD_WEIGHTS = {'FormPage.usedOnPage': 3}
+        return settings
+
+    def analyse(self, query, variables=None):  # noqa: D102
+        from graphene_django.settings import graphene_settings  # noqa: WPS433
+        from graphql.language.parser import parse  # noqa: WPS433
+
+        schema = graphene_settings.SCHEMA
+        return cost.CostAnalyser(schema, parse(query), variables).analyse()
+
+    def test_lists_multiply_selections(self):  # noqa: D102
+        query_cost = self.analyse(
+            '{ pages { id ... on FormPage { formFields { label } } } }',
+        )
+
+        # 10 pages, each with 10 form fields.
+        assert query_cost == cost.QueryCost(cost=10 + 10 * 10, depth=3)
+
+    def test_limit_argument_and_weights(self):  # noqa: D102
+        query_cost = self.analyse(
+            'query($limit: PositiveInt) { pages(limit: $limit) {'
+            ' ...Used } } fragment Used on FormPage { usedOnPage { id } }',
+            variables={'limit': 2},
+        )
+
+        assert query_cost == cost.QueryCost(cost=2 + 2 * 3 * 10, depth=3)
+
+    def test_cost_in_extensions(self, graphql, db):  # noqa: D102
+        res = graphql(PAGES_QUERY)
+
+        assert res.json()['extensions']['cost'] == {
+            'cost': 10,
+            'maxCost': 10000,
+            'depth': 2,
+            'maxDepth': 10,
+        }
+
+    def test_too_deep_query_rejected(self, graphql, db, settings):  # noqa: D102
+        settings.API_GRAPHQL_MAX_DEPTH = 3
+        nested = (
+            '{ pages { ... on FormPage { usedOnPage { ... on SomePage {'
+            ' contactForm { usedOnPage { id } } } } } } }'
+        )
+
+        with djtu.CaptureQueriesContext(djconnection) as context:
+            res = graphql(nested)
+
+        assert res.status_code == HTTPStatus.BAD_REQUEST
+        assert 'depth 5 exceeds' in res.json()['errors'][0]['message']
+        assert not context.captured_queries
+
+    def test_too_expensive_query_rejected(self, graphql, db, settings):  # noqa: D102
+        settings.API_GRAPHQL_MAX_COST = 50
+
+        res = graphql('{ pages { ... on FormPage { formFields { id } } } }')
+
+        assert res.status_code == HTTPStatus.BAD_REQUEST
+        assert res.json()['extensions']['cost']['cost'] == 110
+
+
+@pytest.fixture
+def replica(request, django_db_setup, django_db_blocker, monkeypatch, tmp_path):
+    """Add a ``replica`` database, copied before the test's transaction."""
+    path = str(tmp_path / 'replica.sqlite3')
+    with django_db_blocker.unblock():
+        source = sqlite3.connect(djconnection.settings_dict['NAME'], uri=True)
+        copy = sqlite3.connect(path)
+        source.backup(copy)
+        copy.close()
+        source.close()
+    request.getfixturevalue('db')
+    connections.databases['replica'] = {
+        'ENGINE': 'contact_form_prototype.sqlite',
+        'NAME': path,
+    }
+    monkeypatch.setattr(routers, 'get_replica_lag', lambda alias: 0)
+    routers.replica_health.reset()
+    yield 'replica'
+    connections['replica'].close()
+    del connections['replica']  # noqa: WPS420
+    del connections.databases['replica']  # noqa: WPS420
+    routers.replica_health.reset()
+
+
+class TestReplicaRouting(object):
+    """Test routing of GraphQL reads to the read replica."""
+
+    @pytest.fixture(autouse=True)
+    def graphql_settings(self, settings):  # noqa: D102
+        settings.API_GRAPHQL_CACHE = False
+        # The manifest only exists after collectstatic.
+        settings.STATICFILES_STORAGE = (
+            'django.contrib.staticfiles.storage.StaticFilesStorage'
+        )
+        return settings
+
+    def test_router(self, replica):  # noqa: D102
+        assert FormPage.objects.all().db == 'default'
+        with routers.replica_reads():
+            assert FormPage.objects.all().db == 'replica'
+            FormPage.objects.filter(pk=0).update(title='Nothing')
+
+            assert FormPage.objects.all().db == 'default'
+
+    def test_graphql_reads_from_replica(
+        self,
+        replica,
+        contact_form_page,
+        graphql,
+    ):  # noqa: D102
+        res = graphql(PAGES_QUERY)
+
+        assert res.status_code == HTTPStatus.OK
+        assert b'Contact' not in res.content
+        assert 'db_primary' not in res.cookies
+
+    def test_client_reads_from_primary_after_write(
+        self,
+        replica,
+        contact_form_page_w_email_field,
+        client,
+        graphql,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        res = client.post(
+            page.url,
+            {'email': 'someone@example.com', 'spammer_jammer': ''},
+        )
+
+        assert res.status_code == HTTPStatus.OK
+        assert res.cookies['db_primary']['max-age'] == 10
+        assert b'Contact' in graphql(PAGES_QUERY).content
+
+    @pytest.mark.parametrize('lag', [60, None])
+    def test_falls_back_to_primary(
+        self,
+        replica,
+        contact_form_page,
+        graphql,
+        monkeypatch,
+        lag,
+    ):  # noqa: D102
+        def get_replica_lag(alias):  # noqa: WPS430
+            if lag is None:
+                raise sqlite3.OperationalError('unable to open database file')
+            return lag
+
+        monkeypatch.setattr(routers, 'get_replica_lag', get_replica_lag)
+
+        assert b'Contact' in graphql(PAGES_QUERY).content
+
+    def test_sqlite_lag(self, tmp_path):  # noqa: D102
+        primary = tmp_path / 'primary.sqlite3'
+        copy = tmp_path / 'replica.sqlite3'
+        primary.write_bytes(b'')
+        copy.write_bytes(b'')
+        os.utime(primary, (1000, 1000))
+        os.utime(copy, (1000, 1000))
+
+        assert routers.get_sqlite_lag(str(primary), str(copy)) == 0
+
+        os.utime(primary, (2000, 2000))
+        wal = tmp_path / 'replica.sqlite3-wal'
+        wal.write_bytes(b'')
+        os.utime(wal, (1500, 1500))
+
+        assert routers.get_sqlite_lag(
+            str(primary), str(copy),
+        ) == pytest.approx(routers.time.time() - 1500, abs=5)
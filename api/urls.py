@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+
+"""Define URLs of the GraphQL API."""
+
+from django.urls import re_path  # type: ignore[import]
+from django.views.decorators import csrf as djvdcsrf  # type: ignore[import]
+
+from api import views
+
+urlpatterns = [
+    # Takes precedence over the plain view registered by grapple.
+    re_path(
+        r'^graphql',
+        djvdcsrf.csrf_exempt(views.GraphQLView.as_view()),
+        name='graphql',
+    ),
+]
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+"""Define the GraphQL view of the API."""
+
+from django.conf import settings  # type: ignore[import]
+from graphene_django import views as gdviews  # type: ignore[import]
+from graphql.error import GraphQLError  # type: ignore[import]
+from graphql.execution import ExecutionResult  # type: ignore[import]
+
+from api import cache
+from api import cost
+from api import persisted
+from contact_form_prototype import routers
+from monitoring import metrics
+
+document_backend = persisted.CachingBackend()
+
+
+class GraphQLView(gdviews.GraphQLView):
+    """GraphQL view with caching, persisted queries and cost limits."""
+
+    cache_status = None
+    execution_errors = False
+    resolved_params = None
+    query_cost = None
+
+    def dispatch(self, request, *args, **kwargs):  # noqa: D102
+        with metrics.graphql_seconds.time(), routers.replica_reads():
+            response = super().dispatch(request, *args, **kwargs)
+        failed = self.execution_errors or response.status_code >= 400
+        metrics.graphql_requests.inc(
+            outcome='error' if failed else 'ok',
+            cache=(self.cache_status or 'off').lower(),
+        )
+        if self.cache_status is not None:
+            response['X-Cache'] = self.cache_status
+        return response
+
+    def get_backend(self, request):
+        """Override method to reuse parsed and validated documents."""  # noqa: DAR101, DAR201
+        return document_backend
+
+    def get_graphql_params(self, request, data):
+        """Override method to resolve persisted query hashes."""  # noqa: DAR101, DAR201
+        if self.resolved_params is not None and self.resolved_params[0] is data:
+            return self.resolved_params[1]
+        query, variables, operation_name, request_id = super().get_graphql_params(
+            request,
+            data,
+        )
+        query = persisted.resolve_query(
+            query,
+            persisted.get_requested_hash(request, data),
+        )
+        params = (query, variables, operation_name, request_id)
+        self.resolved_params = (data, params)
+        return params
+
+    def get_response(self, request, data, show_graphiql=False):
+        """Override method to serve and store responses in the cache."""  # noqa: DAR101, DAR201
+        if show_graphiql or self.batch or not settings.API_GRAPHQL_CACHE:
+            return super().get_response(request, data, show_graphiql)
+        query, variables, operation_name, _ = self.get_graphql_params(
+            request,
+            data,
+        )
+        key = None
+        if not request.GET.get('pretty'):
+            key = cache.make_key(
+                query,
+                variables,
+                operation_name,
+                request.get_host(),
+            )
+        if key is None:
+            self.cache_status = 'BYPASS'
+            return super().get_response(request, data, show_graphiql)
+        cached = cache.response_cache.get(key)
+        if cached is not None:
+            self.cache_status = 'HIT'
+            return cached, 200
+        self.cache_status = 'MISS'
+        result, status_code = super().get_response(
+            request,
+            data,
+            show_graphiql,
+        )
+        if status_code == 200 and not self.execution_errors:
+            cache.response_cache.set(key, result)
+        return result, status_code
+
+    def execute_graphql_request(  # noqa: WPS211
+        self,
+        request,
+        data,
+        query,
+        variables,
+        operation_name,
+        show_graphiql=False,
+    ):
+        """Override method to enforce cost limits and remember failures."""  # noqa: DAR101, DAR201
+        if query:
+            rejection = self.analyse_cost(request, query, variables, operation_name)
+            if rejection is not None:
+                self.execution_errors = True
+                return rejection
+        execution_result = super().execute_graphql_request(
+            request,
+            data,
+            query,
+            variables,
+            operation_name,
+            show_graphiql,
+        )
+        if execution_result is not None and execution_result.errors:
+            self.execution_errors = True
+        return execution_result
+
+    def analyse_cost(self, request, query, variables, operation_name):
+        """Compute query cost and return a failed result if it is too high."""
+        try:
+            document = self.get_backend(request).document_from_string(
+                self.schema,
+                query,
+            )
+        except Exception:
+            # Syntax errors are reported by the regular execution.
+            return None
+        self.query_cost = cost.CostAnalyser(
+            self.schema,
+            document.document_ast,
+            variables,
+        ).analyse(operation_name)
+        error_message = cost.check(self.query_cost)
+        if error_message is None:
+            return None
+        return ExecutionResult(
+            errors=[GraphQLError(error_message)],
+            invalid=True,
+        )
+
+    def json_encode(self, request, response_data, pretty=False):
+        """Override method to add the query cost to the extensions."""  # noqa: DAR101, DAR201
+        if self.query_cost is not None:
+            response_data['extensions'] = {
+                'cost': cost.as_extension(self.query_cost),
+            }
+        return super().json_encode(request, response_data, pretty)
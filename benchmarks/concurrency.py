@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""
+Submit forms from many processes and threads at once and count lock errors.
+
+Every process is forked like a gunicorn worker and runs several threads,
+each posting submissions through the WSGI application as fast as it can::
+
+    python -m benchmarks.concurrency --processes 8 --threads 4
+    python -m benchmarks.concurrency --profile plain
+    python -m benchmarks.concurrency --single-writer
+
+``--profile plain`` uses Django's own SQLite backend instead of the profile
+of the settings, ``--single-writer`` enables ``FORMS_SINGLE_WRITER``. With
+``--check``, exits with status 1 if any submission failed or was not stored.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from urllib import parse as urlparse
+
+from benchmarks import support
+from benchmarks import suite
+
+
+def submit_all(page_path, options, process_number):
+    """Submit from the threads of one process, return statuses and errors."""
+    from django.core import signals as djsignals  # noqa: WPS433
+
+    timings = support.Timings('submit')
+    errors = []
+
+    def record_error(sender, request=None, **kwargs):  # noqa: WPS430
+        errors.append(repr(sys.exc_info()[1]))
+
+    djsignals.got_request_exception.connect(record_error, weak=False)
+
+    def submit(thread_number):  # noqa: WPS430
+        for number in range(options.submissions):
+            body = urlparse.urlencode({
+                'email': f'{process_number}-{thread_number}-{number}@example.com',
+                'spammer_jammer': '',
+            }).encode()
+            started = time.perf_counter()
+            timings.record(started, suite.call(
+                'POST',
+                page_path,
+                body,
+                'application/x-www-form-urlencoded',
+            ))
+
+    threads = [
+        threading.Thread(target=submit, args=(thread_number,))
+        for thread_number in range(options.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return timings.latencies, timings.statuses, errors
+
+
+def run(page, options):
+    """Submit from all processes, return the timings and the errors."""
+    from django.db import connections  # noqa: WPS433
+
+    # Forked processes must not share the connection of this one.
+    connections.close_all()
+    timings = support.Timings(options.profile)
+    errors = []
+    context = multiprocessing.get_context('fork')
+    with timings:
+        with context.Pool(options.processes) as pool:
+            results = pool.starmap(submit_all, [
+                (page.url, options, process_number)
+                for process_number in range(options.processes)
+            ])
+    for latencies, statuses, process_errors in results:
+        timings.latencies.extend(latencies)
+        timings.statuses.extend(statuses)
+        errors.extend(process_errors)
+    return timings, errors
+
+
+def get_parser():  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument(
+        '--submissions',
+        type=int,
+        default=50,
+        help='Submissions per thread.',
+    )
+    parser.add_argument(
+        '--profile',
+        choices=['settings', 'plain'],
+        default='settings',
+        help='SQLite profile of the settings or Django defaults.',
+    )
+    parser.add_argument('--single-writer', action='store_true')
+    parser.add_argument(
+        '--check',
+        action='store_true',
+        help='Exit with status 1 if a submission failed or is missing.',
+    )
+    return parser
+
+
+def main():  # noqa: D103
+    options = get_parser().parse_args()
+    os.environ['BENCHMARK_SQLITE_PROFILE'] = options.profile
+    os.environ.setdefault('BENCHMARK_EMAIL_DELAY', '0')
+    support.setup()
+    from django.conf import settings  # noqa: WPS433
+    from forms.models import Submission  # noqa: WPS433
+
+    settings.FORMS_SINGLE_WRITER = options.single_writer
+    page = support.create_form_page()
+    timings, errors = run(page, options)
+    stored = Submission.objects.filter(page=page).count()
+    succeeded = len(timings.statuses) - timings.failed()
+    lock_errors = sum('database is locked' in error for error in errors)
+    print(timings.report())  # noqa: WPS421
+    print(  # noqa: WPS421
+        f'single writer {options.single_writer}, stored {stored} of '
+        f'{succeeded} successful submissions, {len(errors)} errors, '
+        f'{lock_errors} lock errors',
+    )
+    for error in sorted(set(errors))[:5]:
+        print(f'  {error}')  # noqa: WPS421
+    if options.check and (errors or timings.failed() or stored != succeeded):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compare form submissions through the WSGI and the ASGI entry point.
+
+Every client uploads its body in chunks with a pause in between, like a
+slow mobile connection, and every notification email waits like a slow SMTP
+server. The WSGI application is driven by a fixed number of worker threads,
+as a sync server would; the ASGI application runs all clients concurrently
+on one event loop::
+
+    python -m benchmarks.entrypoints --submissions 500 --workers 8
+
+Both applications run in this process against a throwaway SQLite database.
+"""
+
+import argparse
+import asyncio
+from concurrent import futures
+import io
+import time
+from urllib import parse as urlparse
+
+from benchmarks import support
+
+CHUNKS = 4
+
+
+def get_body(number):
+    """Return urlencoded body of the n-th submission."""
+    return urlparse.urlencode({
+        'email': f'client-{number}@example.com',
+        'spammer_jammer': '',
+    }).encode()
+
+
+class SlowInput(io.RawIOBase):
+    """WSGI input stream that trickles the body in like a slow client."""
+
+    def __init__(self, body, delay):  # noqa: D107
+        self.chunks = [
+            body[index:index + len(body) // CHUNKS + 1]
+            for index in range(0, len(body), len(body) // CHUNKS + 1)
+        ]
+        self.delay = delay
+
+    def read(self, size=-1):  # noqa: D102, WPS110
+        chunks = []
+        while self.chunks:
+            time.sleep(self.delay)
+            chunks.append(self.chunks.pop(0))
+        return b''.join(chunks)
+
+
+def run_wsgi(page_path, options):
+    """Submit through the WSGI application with a pool of worker threads."""
+    from contact_form_prototype import wsgi  # noqa: WPS433
+
+    timings = support.Timings('wsgi')
+
+    def submit(number):  # noqa: WPS430
+        body = get_body(number)
+        environ = {
+            'REQUEST_METHOD': 'POST',
+            'PATH_INFO': page_path,
+            'SCRIPT_NAME': '',
+            'QUERY_STRING': '',
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'HTTP_HOST': 'localhost',
+            'REMOTE_ADDR': '127.0.0.1',
+            'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': SlowInput(body, options.client_delay),
+            'wsgi.url_scheme': 'http',
+        }
+        statuses = []
+        started = time.perf_counter()
+        response = wsgi.application(
+            environ,
+            lambda status, headers: statuses.append(int(status[:3])),
+        )
+        b''.join(response)
+        timings.record(started, statuses[0])
+
+    with timings:
+        with futures.ThreadPoolExecutor(options.workers) as executor:
+            list(executor.map(submit, range(options.submissions)))
+    return timings
+
+
+def run_asgi(page_path, options):
+    """Submit through the ASGI application with all clients concurrent."""
+    from contact_form_prototype import asgi  # noqa: WPS433
+
+    timings = support.Timings('asgi')
+
+    async def submit(number):  # noqa: WPS430
+        body = get_body(number)
+        size = len(body) // CHUNKS + 1
+        messages = [
+            {
+                'type': 'http.request',
+                'body': body[index:index + size],
+                'more_body': index + size < len(body),
+            }
+            for index in range(0, len(body), size)
+        ]
+        statuses = []
+
+        async def receive():  # noqa: WPS430
+            await asyncio.sleep(options.client_delay)
+            return messages.pop(0)
+
+        async def send(message):  # noqa: WPS430
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        scope = {
+            'type': 'http',
+            'method': 'POST',
+            'path': page_path,
+            'root_path': '',
+            'query_string': b'',
+            'headers': [
+                (b'host', b'localhost'),
+                (b'content-type', b'application/x-www-form-urlencoded'),
+                (b'content-length', str(len(body)).encode()),
+            ],
+            'client': ('127.0.0.1', 50000),
+            'server': ('localhost', 80),
+        }
+        started = time.perf_counter()
+        await asgi.application(scope, receive, send)
+        timings.record(started, statuses[0])
+
+    async def submit_all():  # noqa: WPS430
+        await asyncio.gather(*[
+            submit(number) for number in range(options.submissions)
+        ])
+
+    with timings:
+        asyncio.run(submit_all())
+    return timings
+
+
+def get_parser():  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--submissions', type=int, default=200)
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=8,
+        help='WSGI worker threads.',
+    )
+    parser.add_argument(
+        '--client-delay',
+        type=float,
+        default=0.05,
+        help='Seconds between the body chunks of a client.',
+    )
+    return parser
+
+
+def main():  # noqa: D103
+    options = get_parser().parse_args()
+    support.setup()
+    page = support.create_form_page()
+    for run in (run_wsgi, run_asgi):
+        print(run(page.url, options).report())  # noqa: WPS421
+
+
+if __name__ == '__main__':
+    main()
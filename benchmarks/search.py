@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compare the database and the FTS5 search backend on synthetic pages.
+
+Live pages with titles of random words are bulk inserted below the home
+page, indexed by the FTS5 backend, then both backends run the same queries
+the way the search view does, counting the results and fetching the first
+page of ten::
+
+    python -m benchmarks.search --pages 100000 --queries 200
+
+Then the FTS5 backend walks ``--depth`` pages of the commonest word's results,
+once by offset like Django's paginator and once by cursor.
+
+Word frequencies follow Zipf's law, so queries range from words in most
+titles to words in a handful of them.
+"""
+
+import argparse
+import random
+import time
+
+from benchmarks import support
+
+BACKENDS = (
+    ('db', 'wagtail.search.backends.db'),
+    ('fts5', 'default'),
+)
+
+
+def get_queries(rng, vocabulary, count):
+    """Return a mix of one and two word queries over all frequencies."""
+    queries = []
+    for _ in range(count):
+        # Ranks spread evenly on a log scale, from the commonest words on.
+        rank = int(len(vocabulary) ** rng.random()) - 1
+        query = vocabulary[rank]
+        if rng.random() < 0.3:  # noqa: WPS432
+            query = f'{query} {rng.choice(vocabulary[:100])}'
+        queries.append(query)
+    return queries
+
+
+def run(name, backend, queries):
+    """Search like the search view and time every query."""
+    from wagtail.core.models import Page  # noqa: WPS433
+
+    timings = support.Timings(name)
+    with timings:
+        for query in queries:
+            started = time.perf_counter()
+            results = Page.objects.live().search(query, backend=backend)
+            results.count()
+            list(results[:10])
+            timings.record(started, 200)
+    return timings
+
+
+def run_deep(name, query, depth, keyset):
+    """Fetch the pages of a query one after the other."""
+    from wagtail.core.models import Page  # noqa: WPS433
+    from search import pagination  # noqa: WPS433
+
+    results = Page.objects.live().search(query)
+    timings = support.Timings(name)
+    after = None
+    with timings:
+        for number in range(depth):
+            started = time.perf_counter()
+            if keyset:
+                page = pagination.paginate(results, 10, after=after)
+                after = pagination.decode_cursor(page.next_cursor)
+            else:
+                list(results[number * 10:(number + 1) * 10])
+            timings.record(started, 200)
+    return timings
+
+
+def get_parser():  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--pages', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--depth', type=int, default=200)
+    return parser
+
+
+def main():  # noqa: D103
+    options = get_parser().parse_args()
+    support.setup()
+    from wagtail.search.backends import get_search_backend  # noqa: WPS433
+
+    rng = random.Random(options.seed)
+    vocabulary = support.get_vocabulary(rng, options.vocabulary)
+    weights = support.get_weights(vocabulary)
+    started = time.perf_counter()
+    support.create_pages([
+        support.get_title(rng, vocabulary, weights)
+        for _ in range(options.pages)
+    ])
+    print(  # noqa: WPS421
+        f'Created {options.pages} pages in '
+        f'{time.perf_counter() - started:.1f} s',
+    )
+    started = time.perf_counter()
+    index = get_search_backend().get_index_for_model(None)
+    indexed = index.rebuild(chunk_size=5000)
+    print(  # noqa: WPS421
+        f'Indexed {indexed} objects in {time.perf_counter() - started:.1f} s',
+    )
+    queries = get_queries(rng, vocabulary, options.queries)
+    for name, backend in BACKENDS:
+        print(run(name, backend, queries).report())  # noqa: WPS421
+    for name, keyset in (('offset', False), ('keyset', True)):
+        print(run_deep(  # noqa: WPS421
+            name, vocabulary[0], options.depth, keyset,
+        ).report())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+"""Settings for the benchmarks: a throwaway database and slow email."""
+
+import os
+import tempfile
+
+from contact_form_prototype.settings.dev import *  # noqa: F401, F403, WPS347
+
+BENCHMARK_DIR = tempfile.mkdtemp(prefix='benchmarks-')
+
+DATABASES = {
+    'default': dict(
+        DATABASES['default'],  # noqa: F405
+        NAME=os.path.join(BENCHMARK_DIR, 'db.sqlite3'),
+    ),
+}
+if os.environ.get('BENCHMARK_SQLITE_PROFILE') == 'plain':
+    # Django's own backend with its defaults, to compare against.
+    DATABASES['default'].update(
+        ENGINE='django.db.backends.sqlite3',
+        CONN_MAX_AGE=0,
+        OPTIONS={},
+    )
+
+API_GRAPHQL_CACHE_GENERATION_FILE = os.path.join(
+    BENCHMARK_DIR, 'graphql-cache-generation',
+)
+SEARCH_CACHE_GENERATION_FILE = os.path.join(
+    BENCHMARK_DIR, 'search-cache-generation',
+)
+MONITORING_METRICS_DIR = os.path.join(BENCHMARK_DIR, 'metrics')
+FORMS_SINGLE_WRITER_LOCK_FILE = os.path.join(
+    BENCHMARK_DIR, 'submission-writer.lock',
+)
+WAGTAILSEARCH_BACKENDS = {
+    'default': SEARCH_FTS5_BACKEND,  # noqa: F405
+}
+
+EMAIL_BACKEND = 'benchmarks.support.SlowEmailBackend'
+BENCHMARK_EMAIL_DELAY = float(os.environ.get('BENCHMARK_EMAIL_DELAY', '0.05'))
+
+LOGGING['root']['level'] = 'WARNING'  # noqa: F405
+FORMS_RATE_LIMIT_REQUESTS = 0
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the main request paths and compare them against a baseline.
+
+A throwaway SQLite database is filled with ``--form-pages`` form pages of
+``--fields`` fields each, ``--submissions`` stored submissions and
+``--content-pages`` content pages linking to the forms. Then every scenario
+sends ``--requests`` requests, one after the other, through the WSGI
+application:
+
+``valid_post``
+    Valid submissions to the form pages.
+``spam_post``
+    Submissions with the honeypot field filled in.
+``graphql``
+    The queries Gatsby runs while building the site, without the response
+    cache.
+``search``
+    Searches of words from the content page titles.
+
+Throughput and p50/p99 latencies are written as JSON and compared against a
+stored baseline::
+
+    python -m benchmarks.suite --output results.json
+
+A scenario regresses when a latency percentile is more than ``--threshold``
+(and a millisecond) above the baseline, or throughput is as much below it.
+The command then exits with status 1. ``--save-baseline`` stores the
+results as the new baseline instead; baselines only compare to runs with the
+same fixture sizes on the same machine.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import time
+from urllib import parse as urlparse
+
+from benchmarks import support
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+FIXTURE_OPTIONS = (
+    'form_pages',
+    'fields',
+    'submissions',
+    'content_pages',
+    'vocabulary',
+    'requests',
+    'seed',
+)
+
+# Latencies may vary by this much whatever the threshold.
+MIN_DIFFERENCE_MS = 1.0
+
+GRAPHQL_QUERIES = (
+    """
+    {
+      pages {
+        id title slug urlPath depth pageType lastPublishedAt
+        seoTitle seoDescription
+      }
+    }
+    """,
+    """
+    {
+      pages {
+        id
+        ... on FormPage {
+          formFields { label }
+          usedOnPage { id }
+        }
+        ... on SomePage {
+          intro
+          contactForm { id title }
+        }
+      }
+    }
+    """,
+    """
+    query FormPage($id: Int) {
+      page(id: $id) {
+        id title
+        ... on FormPage {
+          intro thankYouText
+          formFields { label fieldType required choices defaultValue helpText }
+        }
+      }
+    }
+    """,
+)
+
+
+def call(method, path, body=b'', content_type='', query_string=''):
+    """Send a request through the WSGI application, return its status."""
+    from contact_form_prototype import wsgi  # noqa: WPS433
+
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': query_string,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'HTTP_HOST': 'localhost',
+        'REMOTE_ADDR': '127.0.0.1',
+        'CONTENT_TYPE': content_type,
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.url_scheme': 'http',
+    }
+    statuses = []
+    response = wsgi.application(
+        environ,
+        lambda status, headers: statuses.append(int(status[:3])),
+    )
+    b''.join(response)
+    return statuses[0]
+
+
+def create_fixtures(options, rng):
+    """Create the form pages, submissions and content pages."""
+    from content.models import SomePage  # noqa: WPS433
+    from forms.models import FormPage  # noqa: WPS433
+    from home.models import HomePage  # noqa: WPS433
+    from wagtail.search.backends import get_search_backend  # noqa: WPS433
+
+    home_page = HomePage.objects.first()
+    form_pages = []
+    for number in range(options.form_pages):
+        page = FormPage(
+            title=f'Contact {number}',
+            intro='<p>Get in touch.</p>',
+            from_address='contact-form@example.com',
+            to_address='staff@example.com',
+            subject='New form submission',
+        )
+        home_page.add_child(instance=page)
+        page.form_fields.create(
+            label='Email', field_type='email', required=True, sort_order=0,
+        )
+        for field in range(1, options.fields):
+            page.form_fields.create(
+                label=f'Field {field}',
+                field_type='singleline',
+                required=False,
+                sort_order=field,
+            )
+        page.save()
+        form_pages.append(page)
+
+    for page in form_pages:
+        page.get_submission_class().objects.bulk_create([
+            page.get_submission_class()(
+                page=page,
+                form_data=page.encode_form_data(
+                    get_form_data(options.fields, number),
+                ),
+            )
+            for number in range(options.submissions // len(form_pages))
+        ])
+
+    vocabulary = support.get_vocabulary(rng, options.vocabulary)
+    weights = support.get_weights(vocabulary)
+    for number, page in enumerate(form_pages):
+        share = options.content_pages // len(form_pages)
+        if number < options.content_pages % len(form_pages):
+            share += 1
+        support.create_pages(
+            [support.get_title(rng, vocabulary, weights) for _ in range(share)],
+            page_model=SomePage,
+            intro='<p>Some content.</p>',
+            contact_form=page.pk,
+        )
+    get_search_backend().get_index_for_model(None).rebuild(chunk_size=5000)
+    return form_pages, vocabulary
+
+
+def get_form_data(fields, number):
+    """Return form data of the n-th submission to a form page."""
+    form_data = {'email': f'client-{number}@example.com'}
+    for field in range(1, fields):
+        form_data[f'field_{field}'] = f'Value {number}'
+    return form_data
+
+
+def make_requests(options, rng, form_pages, vocabulary):
+    """Return ``(method, path, body, content_type, query)`` of scenarios."""
+    def post(page, number, spam):  # noqa: WPS430
+        form_data = get_form_data(options.fields, number)
+        form_data['spammer_jammer'] = 'Buy now' if spam else ''
+        return (
+            'POST',
+            page.url,
+            urlparse.urlencode(form_data).encode(),
+            'application/x-www-form-urlencoded',
+            '',
+        )
+
+    def graphql(number):  # noqa: WPS430
+        query = GRAPHQL_QUERIES[number % len(GRAPHQL_QUERIES)]
+        page = form_pages[number % len(form_pages)]
+        return (
+            'POST',
+            '/graphql',
+            json.dumps({'query': query, 'variables': {'id': page.pk}}).encode(),
+            'application/json',
+            '',
+        )
+
+    def search(number):  # noqa: WPS430
+        query = vocabulary[int(len(vocabulary) ** rng.random()) - 1]
+        return (
+            'GET',
+            '/search/',
+            b'',
+            '',
+            urlparse.urlencode({'query': query}),
+        )
+
+    count = options.requests
+    return {
+        'valid_post': [
+            post(form_pages[number % len(form_pages)], number, spam=False)
+            for number in range(count)
+        ],
+        'spam_post': [
+            post(form_pages[number % len(form_pages)], number, spam=True)
+            for number in range(count)
+        ],
+        'graphql': [graphql(number) for number in range(count)],
+        'search': [search(number) for number in range(count)],
+    }
+
+
+def run(name, requests, warmup):
+    """Send the requests of a scenario and time every one."""
+    for request in requests[:warmup]:
+        call(*request)
+    timings = support.Timings(name)
+    with timings:
+        for request in requests:
+            started = time.perf_counter()
+            timings.record(started, call(*request))
+    return timings
+
+
+def get_meta(options):
+    """Return what the results depend on besides the code."""
+    import django  # noqa: WPS433
+    import wagtail  # noqa: WPS433
+
+    return {
+        'options': {name: getattr(options, name) for name in FIXTURE_OPTIONS},
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'wagtail': wagtail.__version__,
+        'sqlite': sqlite3.sqlite_version,
+        'machine': platform.machine(),
+    }
+
+
+def is_slower(current, base, threshold):
+    """Return whether a latency regressed, ignoring sub-millisecond noise."""
+    return (
+        current > base * (1 + threshold) and
+        current - base > MIN_DIFFERENCE_MS
+    )
+
+
+def compare(results, baseline, threshold):
+    """Return descriptions of the regressions against a baseline."""
+    regressions = []
+    for name, current in results['scenarios'].items():
+        base = baseline['scenarios'].get(name)
+        if base is None:
+            continue
+        for metric in ('p50_ms', 'p99_ms'):
+            if is_slower(current[metric], base[metric], threshold):
+                regressions.append(
+                    f'{name}: {metric} {current[metric]:.2f} > '
+                    f'{base[metric]:.2f} (+{threshold:.0%})',
+                )
+        # Requests are sequential, throughput is the inverse mean latency.
+        if is_slower(
+            1000 / current['throughput'],
+            1000 / base['throughput'],
+            threshold,
+        ):
+            regressions.append(
+                f'{name}: throughput {current["throughput"]:.1f} < '
+                f'{base["throughput"]:.1f} (-{threshold:.0%})',
+            )
+        if current['failed'] > base['failed']:
+            regressions.append(
+                f'{name}: {current["failed"]} failed requests',
+            )
+    return regressions
+
+
+def get_parser():  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--form-pages', type=int, default=10)
+    parser.add_argument('--fields', type=int, default=5)
+    parser.add_argument('--submissions', type=int, default=10000)
+    parser.add_argument('--content-pages', type=int, default=500)
+    parser.add_argument('--vocabulary', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--output',
+        help='File to write the results to, instead of standard output.',
+    )
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.25,
+        help='Allowed relative regression, 0.25 for 25 %%.',
+    )
+    parser.add_argument(
+        '--save-baseline',
+        action='store_true',
+        help='Store the results as the baseline instead of comparing.',
+    )
+    return parser
+
+
+def main():  # noqa: D103, WPS210, WPS213
+    options = get_parser().parse_args()
+    # Notifications are sent synchronously; only measure the application.
+    os.environ.setdefault('BENCHMARK_EMAIL_DELAY', '0')
+    support.setup()
+    from django.conf import settings  # noqa: WPS433
+
+    settings.API_GRAPHQL_CACHE = False
+
+    rng = random.Random(options.seed)
+    started = time.perf_counter()
+    form_pages, vocabulary = create_fixtures(options, rng)
+    print(  # noqa: WPS421
+        f'Created fixtures in {time.perf_counter() - started:.1f} s',
+        file=sys.stderr,
+    )
+    results = {'meta': get_meta(options), 'scenarios': {}}
+    scenarios = make_requests(options, rng, form_pages, vocabulary)
+    for name, requests in scenarios.items():
+        timings = run(name, requests, options.warmup)
+        print(timings.report(), file=sys.stderr)  # noqa: WPS421
+        results['scenarios'][name] = timings.as_dict()
+
+    dump = json.dumps(results, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as output:
+            output.write(f'{dump}\n')
+    else:
+        print(dump)  # noqa: WPS421
+
+    if options.save_baseline:
+        with open(options.baseline, 'w') as baseline_file:
+            baseline_file.write(f'{dump}\n')
+        return
+    if not os.path.exists(options.baseline):
+        print('No baseline to compare to.', file=sys.stderr)  # noqa: WPS421
+        return
+    with open(options.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline['meta']['options'] != results['meta']['options']:
+        sys.exit('The baseline was measured with other fixture sizes.')
+    regressions = compare(results, baseline, options.threshold)
+    for regression in regressions:
+        print(f'Regression: {regression}', file=sys.stderr)  # noqa: WPS421
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+"""Helpers shared by the benchmarks."""
+
+import os
+import statistics
+import time
+
+import django  # type: ignore[import]
+from django.conf import settings  # type: ignore[import]
+from django.core.mail.backends import locmem  # type: ignore[import]
+
+
+def setup():
+    """Configure Django with the benchmark settings and migrate."""
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+    django.setup()
+    from django.core import management as djmgmt  # noqa: WPS433
+    djmgmt.call_command('migrate', verbosity=0)
+
+
+def create_form_page():
+    """Create a live form page with an email field and return it."""
+    from forms.models import FormPage  # noqa: WPS433
+    from home.models import HomePage  # noqa: WPS433
+
+    page = FormPage(
+        title='Contact',
+        from_address='contact-form@example.com',
+        to_address='staff@example.com',
+        subject='New form submission',
+    )
+    HomePage.objects.first().add_child(instance=page)
+    page.form_fields.create(label='Email', field_type='email', required=True)
+    page.save()
+    return page
+
+
+SYLLABLES = [
+    'ka', 'to', 'ri', 'mo', 'sen', 'la', 'vi', 'dor', 'un', 'pe', 'zu',
+    'shi', 'ber', 'an', 'co', 'tel', 'mi', 'ros', 'ga', 'ne',
+]
+
+
+def get_vocabulary(rng, size):
+    """Return ``size`` distinct pseudo words, commonest first."""
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    return sorted(words)
+
+
+def get_weights(vocabulary):
+    """Return word weights following Zipf's law."""
+    return [1 / rank for rank in range(1, len(vocabulary) + 1)]
+
+
+def get_title(rng, vocabulary, weights):  # noqa: D103
+    return ' '.join(rng.choices(vocabulary, weights, k=rng.randint(4, 10)))
+
+
+def create_pages(titles, page_model=None, batch_size=5000, **values):
+    """
+    Bulk insert live pages below the home page, return their ids.
+
+    Pages of a ``page_model`` other than ``Page`` get a row with the given
+    field ``values`` in its table. No signals are sent, so the pages still
+    need to be indexed for search.
+
+    """  # noqa: DAR101, DAR201
+    from django.contrib.contenttypes.models import ContentType  # noqa: WPS433
+    from django.db import connection as djconnection  # noqa: WPS433
+    from django.db import models as djm  # noqa: WPS433
+    from django.db import transaction  # noqa: WPS433
+    from wagtail.core.models import Page  # noqa: WPS433
+
+    page_model = page_model or Page
+    home = Page.objects.get(depth=2)
+    content_type = ContentType.objects.get_for_model(page_model)
+    first_id = (Page.objects.aggregate(last=djm.Max('pk'))['last'] or 0) + 1
+    columns = ['page_ptr_id'] + [
+        page_model._meta.get_field(name).column for name in values
+    ]
+    insert_sql = 'INSERT INTO {0} ({1}) VALUES ({2})'.format(
+        page_model._meta.db_table,
+        ', '.join(columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+    ids = []
+    for start in range(0, len(titles), batch_size):
+        pages = []
+        for number, title in enumerate(titles[start:start + batch_size], start):
+            slug = f'{page_model._meta.model_name}-{first_id + number}'
+            pages.append(Page(
+                id=first_id + number,
+                title=title,
+                draft_title=title,
+                slug=slug,
+                url_path=f'{home.url_path}{slug}/',
+                path=Page._get_path(
+                    home.path,
+                    home.depth + 1,
+                    home.numchild + number + 1,
+                ),
+                depth=home.depth + 1,
+                numchild=0,
+                live=True,
+                content_type=content_type,
+            ))
+        with transaction.atomic():
+            Page.objects.bulk_create(pages)
+            if page_model is not Page:
+                with djconnection.cursor() as cursor:
+                    cursor.executemany(insert_sql, [
+                        [page.pk, *values.values()] for page in pages
+                    ])
+        ids.extend(page.pk for page in pages)
+    Page.objects.filter(pk=home.pk).update(
+        numchild=home.numchild + len(titles),
+    )
+    return ids
+
+
+class SlowEmailBackend(locmem.EmailBackend):
+    """Keep messages in memory after waiting like a slow SMTP server."""
+
+    def send_messages(self, messages):  # noqa: D102
+        time.sleep(settings.BENCHMARK_EMAIL_DELAY)
+        return super().send_messages(messages)
+
+
+class Timings(object):
+    """Collect request latencies of a benchmark run."""
+
+    def __init__(self, name):  # noqa: D107
+        self.name = name
+        self.latencies = []
+        self.statuses = []
+        self.started = None
+        self.elapsed = None
+
+    def __enter__(self):  # noqa: D105
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):  # noqa: D105
+        self.elapsed = time.perf_counter() - self.started
+
+    def record(self, started, status):
+        """Record a finished request that started at ``started``."""
+        self.latencies.append(time.perf_counter() - started)
+        self.statuses.append(status)
+
+    def percentile(self, percent):
+        """Return the latency below which ``percent`` of requests finished."""
+        latencies = sorted(self.latencies)
+        return latencies[max(int(len(latencies) * percent / 100) - 1, 0)]
+
+    def failed(self):  # noqa: D102
+        return sum(status >= 400 for status in self.statuses)
+
+    def as_dict(self):
+        """Return the summary of the run, latencies in milliseconds."""
+        return {
+            'requests': len(self.latencies),
+            'throughput': round(len(self.latencies) / self.elapsed, 1),
+            'p50_ms': round(statistics.median(self.latencies) * 1000, 2),
+            'p99_ms': round(self.percentile(99) * 1000, 2),  # noqa: WPS432
+            'failed': self.failed(),
+        }
+
+    def report(self):
+        """Return one line summary of the run."""
+        latencies = self.latencies
+        p95 = self.percentile(95)  # noqa: WPS432
+        failed = self.failed()
+        return (
+            f'{self.name:<10} {len(latencies):>6} requests '
+            f'{len(latencies) / self.elapsed:>9.1f} req/s  '
+            f'p50 {statistics.median(latencies) * 1000:>8.1f} ms  '
+            f'p95 {p95 * 1000:>8.1f} ms  '
+            f'failed {failed}'
+        )
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+"""Fixtures shared by the tests of all apps."""
+
+from django import db as djdb  # type: ignore[import]
+from django import test as djt  # type: ignore[import]
+from django.contrib.auth import models as djam  # type: ignore[import]
+import pytest  # type: ignore[import]
+
+from api import cache as api_cache
+from home.models import HomePage
+from forms import idempotency
+from forms import ratelimit
+from forms.models import FormPage
+from search import cache as search_cache
+
+
+@pytest.fixture(autouse=True)
+def fresh_rate_limit_backend():  # noqa: D103
+    # Buckets and penalties would otherwise carry over between tests.
+    ratelimit.get_backend.cache_clear()
+    ratelimit.penalty_box.reset()
+    yield
+    ratelimit.get_backend.cache_clear()
+    ratelimit.penalty_box.reset()
+
+
+@pytest.fixture(autouse=True)
+def fresh_idempotency_store(settings, tmp_path):  # noqa: D103
+    # Responses would otherwise be replayed across tests.
+    settings.FORMS_IDEMPOTENCY_SQLITE_PATH = str(tmp_path / 'idem.sqlite3')
+    idempotency.get_store.cache_clear()
+    yield
+    idempotency.get_store.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def strict_query_budgets(settings):  # noqa: D103
+    # Requests over the query budget of their route fail the test.
+    settings.MONITORING_QUERY_BUDGETS_STRICT = True
+
+
+@pytest.fixture(autouse=True)
+def metrics_dir(settings, tmp_path):  # noqa: D103
+    # Metrics must not pile up across tests or in the project directory.
+    settings.MONITORING_METRICS_DIR = str(tmp_path / 'metrics')
+
+
+@pytest.fixture(autouse=True)
+def state_files(settings, monkeypatch, tmp_path):  # noqa: D103
+    # Cache generations and locks are shared with servers in the project
+    # directory, which tests must neither bump nor wait for.
+    settings.API_GRAPHQL_CACHE_GENERATION_FILE = str(
+        tmp_path / 'graphql-cache-generation',
+    )
+    settings.SEARCH_CACHE_GENERATION_FILE = str(
+        tmp_path / 'search-cache-generation',
+    )
+    settings.FORMS_SINGLE_WRITER_LOCK_FILE = str(tmp_path / 'writer.lock')
+    monkeypatch.setattr(
+        api_cache.response_cache,
+        'generation',
+        api_cache.Generation(settings.API_GRAPHQL_CACHE_GENERATION_FILE),
+    )
+    monkeypatch.setattr(
+        search_cache,
+        'generation',
+        api_cache.Generation(settings.SEARCH_CACHE_GENERATION_FILE),
+    )
+
+
+@pytest.fixture
+def contact_form_page(db):  # noqa: D103
+    # The first home page instance is created during migration. This
+    # feature comes predefined with the Wagtail starter.
+    home_page = HomePage.objects.first()
+    # Additional pages can now be added as child pages to this one.
+    contact_form_page = FormPage(
+        title='Contact',
+        from_address='contact-form@example.com',
+        to_address='staff@example.com',
+        subject='New form submission',
+    )
+    home_page.add_child(instance=contact_form_page)
+    contact_form_page.save()
+    assert FormPage.objects.count() == 1
+    return contact_form_page
+
+
+@pytest.fixture
+def contact_form_page_w_email_field(contact_form_page):  # noqa: D103
+    contact_form_page.form_fields.create(
+        label='Email',
+        field_type='email',
+        required=True,
+    )
+    contact_form_page.save()
+    return contact_form_page
+
+
+@pytest.fixture
+def run_on_commit():
+    """Return function that runs callbacks waiting for the test to commit."""
+    def _run_on_commit(using=djdb.DEFAULT_DB_ALIAS):  # noqa: WPS430
+        # The test transaction never commits, so Django never runs them.
+        connection = djdb.connections[using]
+        callbacks, connection.run_on_commit = connection.run_on_commit, []
+        for _, callback in callbacks:
+            callback()
+    return _run_on_commit
+
+
+@pytest.fixture
+def request_factory():  # noqa: D103
+    return djt.RequestFactory()
+
+
+@pytest.fixture
+def submit(request_factory):
+    """Return function that POSTs a non-spam email submission to a page."""
+    def _submit(page, email='someone@example.com'):  # noqa: WPS430
+        req = request_factory.post(
+            page.url,
+            {
+                'email': email,
+                'spammer_jammer': '',
+            },
+        )
+        req.user = djam.AnonymousUser()
+        return page.serve(req)
+    return _submit
@@ -0,0 +1,26 @@
+"""
+ASGI config for contact_form_prototype project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
+"""
+
+import os
+
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "contact_form_prototype.settings.dev")
+
+application = get_asgi_application()
+
+from forms.asgi import FormSubmissionApplication
+
+# Serve form page POSTs on the event loop and answer honeypot spam before it
+# reaches the Django middleware stack.
+application = FormSubmissionApplication(application)
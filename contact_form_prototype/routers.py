@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+"""
+Send GraphQL and search reads to a read replica.
+
+Writes and all other reads, e.g. of form submissions and in the admin, go
+to the ``default`` database. Reads in a :func:`replica_reads` block, which
+wraps the GraphQL and search views, go to the ``DATABASE_REPLICA_ALIAS``
+database if it is configured, unless:
+
+- the request wrote to the database before, so that it reads its own
+  writes;
+- the client wrote within the last ``DATABASE_REPLICA_STICKY_SECONDS``, as
+  recorded in a cookie by :class:`DatabaseRoutingMiddleware`, or by
+  :mod:`forms.asgi` for the form POSTs it serves;
+- the replica is unreachable or lags more than ``DATABASE_REPLICA_MAX_LAG``
+  seconds behind, checked at most every ``DATABASE_REPLICA_CHECK_INTERVAL``
+  seconds by every process.
+
+The replica can be a Postgres standby or, for local testing, a copy of the
+SQLite file, refreshed with ``sqlite3 db.sqlite3 '.backup replica.sqlite3'``.
+The lag of a SQLite copy is the time since it was refreshed, if the primary
+changed since then.
+"""
+
+import contextlib
+import contextvars
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings  # type: ignore[import]
+from django.db import connections  # type: ignore[import]
+from django.db import DEFAULT_DB_ALIAS  # type: ignore[import]
+
+logger = logging.getLogger(__name__)
+
+POSTGRESQL_LAG_SQL = """
+    SELECT CASE WHEN pg_is_in_recovery() THEN COALESCE(
+        EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+    ) ELSE 0 END
+"""
+
+
+class RoutingState(object):
+    """Whether the current request may read from the replica."""
+
+    def __init__(self, pinned=False):  # noqa: D107
+        self.replica_allowed = False
+        self.pinned = pinned
+        self.wrote = False
+
+
+routing_state = contextvars.ContextVar('routing_state')
+
+
+@contextlib.contextmanager
+def replica_reads():
+    """Let the reads of a block go to the replica."""
+    state = routing_state.get(None)
+    token = None
+    if state is None:
+        state = RoutingState()
+        token = routing_state.set(state)
+    allowed = state.replica_allowed
+    state.replica_allowed = True
+    try:
+        yield state
+    finally:
+        state.replica_allowed = allowed
+        if token is not None:
+            routing_state.reset(token)
+
+
+def get_modified_time(path):
+    """Return when a SQLite database or its write-ahead log last changed."""
+    times = [os.path.getmtime(path)]
+    if os.path.exists(f'{path}-wal'):
+        times.append(os.path.getmtime(f'{path}-wal'))
+    return max(times)
+
+
+def get_sqlite_lag(primary_path, replica_path):
+    """Return the age of a SQLite copy if the primary changed since."""
+    replica_modified = get_modified_time(replica_path)
+    if get_modified_time(primary_path) <= replica_modified:
+        return 0
+    return time.time() - replica_modified
+
+
+def get_replica_lag(alias):
+    """Return how many seconds a replica is behind the primary at most."""
+    connection = connections[alias]
+    if connection.vendor == 'sqlite':
+        return get_sqlite_lag(
+            connections[DEFAULT_DB_ALIAS].settings_dict['NAME'],
+            connection.settings_dict['NAME'],
+        )
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(POSTGRESQL_LAG_SQL)
+            return float(cursor.fetchone()[0])
+    return 0
+
+
+class ReplicaHealth(object):
+    """Periodic check of the replica lag, cached in this process."""
+
+    def __init__(self):  # noqa: D107
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):  # noqa: D102
+        self.checked_at = None
+        self.usable = False
+
+    def is_usable(self, alias):
+        """Return whether the replica is reachable and recent enough."""
+        with self._lock:
+            now = time.monotonic()
+            interval = settings.DATABASE_REPLICA_CHECK_INTERVAL
+            if self.checked_at is None or now - self.checked_at >= interval:
+                self.checked_at = now
+                self.usable = self.check(alias)
+            return self.usable
+
+    def check(self, alias):  # noqa: D102
+        try:
+            lag = get_replica_lag(alias)
+        except Exception as exc:
+            logger.warning(f'Reading from the primary, replica failed: {exc!r}')
+            return False
+        if lag > settings.DATABASE_REPLICA_MAX_LAG:
+            logger.warning(f'Reading from the primary, replica lags {lag:.1f} s.')
+            return False
+        return True
+
+
+replica_health = ReplicaHealth()
+
+
+def get_replica_alias():
+    """Return the alias of the replica, ``None`` if there is none."""
+    alias = settings.DATABASE_REPLICA_ALIAS
+    return alias if alias in connections else None
+
+
+class ReplicaRouter(object):
+    """Route the reads of :func:`replica_reads` blocks to the replica."""
+
+    def db_for_read(self, model, **hints):  # noqa: D102
+        state = routing_state.get(None)
+        if state is None or not state.replica_allowed or state.pinned:
+            return DEFAULT_DB_ALIAS
+        alias = get_replica_alias()
+        if alias is None or not replica_health.is_usable(alias):
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):  # noqa: D102
+        state = routing_state.get(None)
+        if state is not None:
+            state.wrote = True
+            state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Allow relations across aliases, they hold the same data."""
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Migrate the primary only, the replica is a copy."""
+        return db != settings.DATABASE_REPLICA_ALIAS
+
+
+def get_request_state(request):
+    """Return the routing state of a request, pinned if the client wrote lately."""
+    return RoutingState(
+        pinned=settings.DATABASE_REPLICA_STICKY_COOKIE in request.COOKIES,
+    )
+
+
+def pin_client(response, state):
+    """Set the sticky cookie if the request wrote and there is a replica."""
+    if state.wrote and get_replica_alias() is not None:
+        response.set_cookie(
+            settings.DATABASE_REPLICA_STICKY_COOKIE,
+            '1',
+            max_age=settings.DATABASE_REPLICA_STICKY_SECONDS,
+            httponly=True,
+            samesite='Lax',
+        )
+    return response
+
+
+class DatabaseRoutingMiddleware(object):
+    """Track writes of requests and pin clients that wrote to the primary."""
+
+    def __init__(self, get_response):  # noqa: D107
+        self.get_response = get_response
+
+    def __call__(self, request):  # noqa: D102
+        state = get_request_state(request)
+        token = routing_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routing_state.reset(token)
+        return pin_client(response, state)
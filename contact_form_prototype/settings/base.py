@@ -28,6 +28,8 @@ INSTALLED_APPS = [
     'search',
     'forms',
     'content',
+    'api',
+    'monitoring',
 
     'wagtail.contrib.forms',
     'wagtail.contrib.redirects',
@@ -56,6 +58,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'monitoring.timing.ServerTimingMiddleware',
+    'contact_form_prototype.routers.DatabaseRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -93,13 +97,52 @@ WSGI_APPLICATION = 'contact_form_prototype.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
+# SQLite profile for several worker processes: readers don't block the writer
+# in WAL mode, transactions take the write lock up front and wait for it up to
+# the busy timeout (see `contact_form_prototype.sqlite.base`), and connections
+# are kept open across requests.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'contact_form_prototype.sqlite',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            'begin': 'IMMEDIATE',
+            'pragmas': {
+                'journal_mode': 'WAL',
+                # Durable on checkpoints only, which is safe in WAL mode.
+                'synchronous': 'NORMAL',
+                'busy_timeout': 20000,  # milliseconds
+            },
+        },
     }
 }
 
+# Optional read replica for GraphQL and search reads, routed by
+# `contact_form_prototype.routers`. Set DATABASE_REPLICA_NAME to a copy of the
+# SQLite file, or define DATABASES['replica'] in local settings, e.g. for a
+# Postgres standby.
+if os.environ.get('DATABASE_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        'ENGINE': 'contact_form_prototype.sqlite',
+        'NAME': os.environ['DATABASE_REPLICA_NAME'],
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            'pragmas': {'query_only': 'ON', 'busy_timeout': 20000},
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['contact_form_prototype.routers.ReplicaRouter']
+DATABASE_REPLICA_ALIAS = 'replica'
+# Reads go to the primary while the replica is further behind.
+DATABASE_REPLICA_MAX_LAG = 5  # seconds
+DATABASE_REPLICA_CHECK_INTERVAL = 10  # seconds
+# Clients read from the primary for a while after they wrote, so that they
+# see their own writes.
+DATABASE_REPLICA_STICKY_SECONDS = 10
+DATABASE_REPLICA_STICKY_COOKIE = 'db_primary'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -157,6 +200,14 @@ LOGGING = {
         'handlers': ['console'],
         'level': 'WARNING',
     },
+    'loggers': {
+        # One structured line per request, see `monitoring.timing`.
+        'monitoring': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
 }
 
 # Static files (CSS, JavaScript, Images)
@@ -192,6 +243,133 @@ EMAIL_PORT = os.environ.get('EMAIL_PORT')
 EMAIL_USE_TLS = False
 
 
+# Forms
+# In write-behind mode, validated submissions are spooled to a local directory
+# and written to the database in batches by a background flusher.
+FORMS_WRITE_BEHIND = False
+FORMS_WRITE_BEHIND_SPOOL_DIR = os.path.join(BASE_DIR, 'var', 'submissions')
+FORMS_WRITE_BEHIND_BATCH_SIZE = 100
+FORMS_WRITE_BEHIND_FLUSH_INTERVAL = 2  # seconds
+FORMS_WRITE_BEHIND_MAX_DEPTH = 10000
+# How often every process lists the spool to check its depth.
+FORMS_WRITE_BEHIND_DEPTH_CHECK_INTERVAL = 1  # seconds
+FORMS_WRITE_BEHIND_RETRY_AFTER = 30  # seconds
+FORMS_WRITE_BEHIND_CLAIM_TIMEOUT = 300  # seconds
+# Disable to flush with `manage.py flush_submissions --loop` instead.
+FORMS_WRITE_BEHIND_AUTOFLUSH = True
+
+# Funnel the submission writes of all threads and worker processes through
+# one writer at a time, queued on a lock file, instead of letting them compete
+# for the SQLite write lock.
+FORMS_SINGLE_WRITER = False
+FORMS_SINGLE_WRITER_LOCK_FILE = os.path.join(BASE_DIR, 'var', 'submission-writer.lock')
+
+# With the outbox enabled, notification emails are only recorded during the
+# request and sent by `manage.py run_email_outbox`.
+FORMS_EMAIL_OUTBOX = False
+FORMS_EMAIL_OUTBOX_BATCH_SIZE = 50
+FORMS_EMAIL_OUTBOX_POLL_INTERVAL = 5  # seconds
+FORMS_EMAIL_OUTBOX_MAX_ATTEMPTS = 8
+FORMS_EMAIL_OUTBOX_BACKOFF = 30  # seconds, doubled on every failed attempt
+FORMS_EMAIL_OUTBOX_BACKOFF_MAX = 3600  # seconds
+
+# POSTs with a filled honeypot field are answered by the WSGI middleware in
+# `forms.honeypot` (or the ASGI application in `forms.asgi`), before sessions,
+# auth and page routing are involved. The excluded paths never receive form
+# page POSTs and are also skipped by the async submission path.
+FORMS_HONEYPOT_SHORT_CIRCUIT = True
+FORMS_HONEYPOT_EXCLUDED_PATHS = [
+    '/admin/',
+    '/django-admin/',
+    '/documents/',
+    '/graphql',
+    '/search/',
+]
+
+# Retried POSTs with the same Idempotency-Key header get the response of the
+# first one instead of creating another submission. With a content window,
+# identical POSTs of a client without a key are deduplicated as well. Expired
+# keys are deleted by `manage.py purge_idempotency_keys`.
+FORMS_IDEMPOTENCY = True
+FORMS_IDEMPOTENCY_SQLITE_PATH = os.path.join(BASE_DIR, 'var', 'idempotency.sqlite3')
+FORMS_IDEMPOTENCY_TTL = 24 * 60 * 60  # seconds
+FORMS_IDEMPOTENCY_CONTENT_WINDOW = None  # seconds, e.g. 300
+FORMS_IDEMPOTENCY_CLAIM_TIMEOUT = 60  # seconds
+
+# Submissions per client IP and form page, disabled by default. Form pages
+# can override the defaults. Behind a reverse proxy, set the proxy header
+# before enabling it: otherwise every client has the proxy's IP and all of
+# them share one limit. Use `forms.ratelimit.SQLiteBackend` to share the
+# limits between worker processes. Once throttled, a client's further POSTs
+# to the page are rejected before page routing (see `forms.ratelimit`).
+FORMS_RATE_LIMIT_BACKEND = 'forms.ratelimit.LocalMemoryBackend'
+FORMS_RATE_LIMIT_SQLITE_PATH = os.path.join(BASE_DIR, 'var', 'ratelimit.sqlite3')
+FORMS_RATE_LIMIT_REQUESTS = 0  # e.g. 10
+FORMS_RATE_LIMIT_PERIOD = 60  # seconds
+# META key of a header set by a trusted proxy, e.g. 'HTTP_X_FORWARDED_FOR'.
+FORMS_RATE_LIMIT_PROXY_HEADER = None
+
+# Directory `manage.py export_form_definitions` writes the form definitions
+# for frontend builds to.
+FORMS_DEFINITIONS_EXPORT_DIR = os.path.join(BASE_DIR, 'var', 'form-definitions')
+
+# Submissions fetched per query by the streaming CSV and NDJSON exports.
+FORMS_EXPORT_CHUNK_SIZE = 2000
+
+# Submissions older than this many days are deleted by
+# `manage.py purge_submissions`, unless a form page sets its own retention.
+# None keeps them forever.
+FORMS_RETENTION_DAYS = None
+FORMS_RETENTION_CHUNK_SIZE = 500
+FORMS_RETENTION_CHUNK_PAUSE = 0.05  # seconds between chunks
+FORMS_RETENTION_ARCHIVE_DIR = os.path.join(BASE_DIR, 'var', 'archive')
+
+# Under ASGI, form page POSTs are handled on the event loop by `forms.asgi`.
+# Database work and email run in thread pools of these sizes per process.
+FORMS_ASYNC_SUBMISSIONS = True
+FORMS_ASYNC_DATABASE_THREADS = 8
+FORMS_ASYNC_EMAIL_THREADS = 4
+
+
+# Search
+# Search hits are counted in memory per process and added to the daily hit
+# rows by a background thread, on exit and whenever the threshold is reached.
+SEARCH_HITS_BUFFERED = True
+SEARCH_HITS_FLUSH_INTERVAL = 60  # seconds
+SEARCH_HITS_FLUSH_THRESHOLD = 1000
+
+# Search results are paginated with cursors, see `search.pagination`. Counts
+# and first pages are cached in the default cache until the generation file
+# is bumped by content changes.
+SEARCH_RESULTS_PER_PAGE = 10
+SEARCH_CACHE_GENERATION_FILE = os.path.join(
+    BASE_DIR, 'var', 'search-cache-generation',
+)
+# Show the total number of results, counted once per query and generation.
+SEARCH_RESULT_COUNTS = False
+SEARCH_RESULT_COUNT_CACHE_TIMEOUT = 300  # seconds
+# The first page of queries searched this many times within the timeout is
+# cached for the timeout. A timeout of 0 disables the cache.
+SEARCH_FIRST_PAGE_CACHE_TIMEOUT = 30  # seconds
+SEARCH_FIRST_PAGE_CACHE_MIN_HITS = 3
+
+# Wagtail's database backend by default. Set SEARCH_FTS5=1 for full text
+# search on an SQLite FTS5 index, see `search.fts5`. The index only follows
+# changes made while it is enabled: run `manage.py rebuild_search_index` once
+# it is, until then searches find nothing.
+WAGTAILSEARCH_BACKENDS = {
+    'default': {
+        'BACKEND': 'wagtail.search.backends.db',
+    },
+}
+SEARCH_FTS5_BACKEND = {
+    'BACKEND': 'search.fts5',
+    'TITLE_WEIGHT': 2.0,
+}
+if os.environ.get('SEARCH_FTS5'):
+    WAGTAILSEARCH_BACKENDS['default'] = SEARCH_FTS5_BACKEND
+
+
 # Wagtail settings
 
 WAGTAIL_SITE_NAME = "contact_form_prototype"
@@ -210,3 +388,48 @@ GRAPPLE_APPS = {
     'forms': '',
     'content': '',
 }
+
+# API
+# Responses to GraphQL queries are cached per process. The generation file is
+# shared by all processes and bumped when content changes.
+API_GRAPHQL_CACHE = True
+API_GRAPHQL_CACHE_MAX_ENTRIES = 1000
+API_GRAPHQL_CACHE_MAX_BYTES = 64 * 1024 * 1024
+API_GRAPHQL_CACHE_GENERATION_FILE = os.path.join(
+    BASE_DIR, 'var', 'graphql-cache-generation',
+)
+# Number of parsed and validated query documents kept per process.
+API_GRAPHQL_DOCUMENT_CACHE_SIZE = 500
+# Only execute queries registered with `manage.py register_persisted_queries`.
+# Queries persisted automatically by clients are never registered.
+API_GRAPHQL_PERSISTED_QUERIES_ONLY = False
+# Queries are analysed before execution and rejected above these ceilings
+# (None disables a ceiling). See `api.cost` for how the cost is computed.
+API_GRAPHQL_MAX_DEPTH = 10
+API_GRAPHQL_MAX_COST = 10000
+# Assumed size of lists that are queried without a limit argument.
+API_GRAPHQL_DEFAULT_LIST_SIZE = 20
+# Weights of expensive fields, keyed by 'TypeName.fieldName'.
+API_GRAPHQL_FIELD_WEIGHTS = {
+    'FormPage.usedOnPage': 2,
+    'SomePage.contactForm': 2,
+}
+
+# Monitoring
+# Every request gets a Server-Timing header with its SQL query count, database,
+# template and total time, and is logged as JSON by `monitoring.timing`.
+MONITORING_SERVER_TIMING = True
+# Maximum SQL queries per route ('<method> <URL name>'). Requests over budget
+# are logged as warnings, or raise in strict mode (enabled in the tests).
+MONITORING_QUERY_BUDGETS = {
+    'POST wagtail_serve': 12,  # Form submissions
+    'POST graphql': 12,
+    'GET search': 4,
+}
+MONITORING_QUERY_BUDGETS_STRICT = False
+# Counters and histograms of all worker processes are kept in files in this
+# directory and served in the Prometheus text format at /metrics to requests
+# with an 'Authorization: Bearer <token>' header. Without a token, /metrics
+# is not found.
+MONITORING_METRICS_DIR = os.path.join(BASE_DIR, 'var', 'metrics')
+MONITORING_METRICS_TOKEN = os.environ.get('MONITORING_METRICS_TOKEN')
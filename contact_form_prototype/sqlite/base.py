@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+"""
+SQLite database backend for several concurrent writers.
+
+Django's SQLite backend starts transactions with a plain ``BEGIN``. Such a
+transaction starts out as a reader and fails with "database is locked" as
+soon as it writes while another connection writes, without waiting for the
+busy timeout. This backend takes two more ``OPTIONS``:
+
+``pragmas``
+    ``PRAGMA`` statements run on every new connection, e.g. the WAL journal
+    mode, so that readers and the writer don't block each other, and a busy
+    timeout.
+``begin``
+    Transaction type of ``BEGIN``. ``'IMMEDIATE'`` takes the write lock
+    when a transaction starts, waiting up to the busy timeout for it.
+"""
+
+from django.db.backends.sqlite3 import base as sqlite3_base  # type: ignore[import]
+
+CUSTOM_OPTIONS = ('pragmas', 'begin')
+
+
+class DatabaseWrapper(sqlite3_base.DatabaseWrapper):
+    """SQLite connection with pragmas and configurable transactions."""
+
+    def get_connection_params(self):
+        """Override method to keep the custom options from sqlite3."""  # noqa: DAR201
+        conn_params = super().get_connection_params()
+        for name in CUSTOM_OPTIONS:
+            conn_params.pop(name, None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        """Override method to run the pragmas on new connections."""  # noqa: DAR101, DAR201
+        conn = super().get_new_connection(conn_params)
+        pragmas = self.settings_dict['OPTIONS'].get('pragmas', {})
+        for name, pragma_value in pragmas.items():
+            conn.execute(f'PRAGMA {name} = {pragma_value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        begin = self.settings_dict['OPTIONS'].get('begin')
+        self.cursor().execute(f'BEGIN {begin}' if begin else 'BEGIN')
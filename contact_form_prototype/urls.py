@@ -10,6 +10,8 @@ from wagtail.documents import urls as wagtaildocs_urls
 
 from grapple import urls as grapple_urls
 
+from api import urls as api_urls
+from monitoring import urls as monitoring_urls
 from search import views as search_views
 
 urlpatterns = [
@@ -20,6 +22,8 @@ urlpatterns = [
 
     path('search/', search_views.search, name='search'),
 
+    path(r'', include(api_urls)),
+    path(r'', include(monitoring_urls)),
     path(r'', include(grapple_urls)),
 ]
 
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+"""
+Prime a process before it forks into workers.
+
+With ``preload_app`` (see ``gunicorn.conf.py``), the gunicorn master imports
+the application once and forks the workers from it. :func:`run` then also
+imports the remaining modules, builds the GraphQL schema and the edit
+handlers, compiles templates and fills the process caches of form classes,
+GraphQL documents and site root paths. Workers share all of it copy-on-write
+and no worker pays for it on its first request.
+
+Steps that need the database log a warning and are skipped if it is not
+ready. Database connections are closed afterwards, they must not be shared
+with the workers.
+"""
+
+import collections
+import logging
+import resource
+import time
+
+from django import urls as djurls  # type: ignore[import]
+from django.apps import apps as djapps  # type: ignore[import]
+from django.conf import settings  # type: ignore[import]
+from django.db import connections  # type: ignore[import]
+from django.template import engines  # type: ignore[import]
+from django.template import TemplateDoesNotExist  # type: ignore[import]
+
+logger = logging.getLogger(__name__)
+
+Step = collections.namedtuple('Step', ['name', 'seconds', 'rss', 'error'])
+
+TEMPLATES = (
+    'base.html',
+    '404.html',
+    '500.html',
+    'search/search.html',
+)
+
+
+def get_rss():
+    """Return the resident set size of this process in bytes."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # Peak instead of current size, in KiB on Linux and bytes on macOS.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def import_modules():
+    """Import the URL configuration, views, hooks and edit handlers."""
+    from wagtail.core import hooks  # noqa: WPS433
+    from wagtail.core.models import get_page_models  # noqa: WPS433
+
+    djapps.get_models()
+    djurls.get_resolver().url_patterns  # noqa: WPS428
+    hooks.search_for_hooks()
+    for page_model in get_page_models():
+        page_model.get_edit_handler()
+
+
+def build_schema():
+    """Build the GraphQL schema."""
+    from graphene_django.settings import graphene_settings  # noqa: WPS433
+
+    graphene_settings.SCHEMA  # noqa: WPS428
+
+
+def prime_graphql_documents():
+    """Parse and validate the persisted queries."""
+    from api import models  # noqa: WPS433
+    from api import views  # noqa: WPS433
+    from graphene_django.settings import graphene_settings  # noqa: WPS433
+
+    schema = graphene_settings.SCHEMA
+    queries = models.PersistedQuery.objects.order_by('-created_at')
+    for query in queries[:settings.API_GRAPHQL_DOCUMENT_CACHE_SIZE]:
+        views.document_backend.document_from_string(schema, query.query)
+
+
+def compile_templates():
+    """Load the templates of pages and views into the template loaders."""
+    from wagtail.core.models import get_page_models  # noqa: WPS433
+
+    names = set(TEMPLATES)
+    names.update(page_model.template for page_model in get_page_models())
+    for engine in engines.all():
+        for name in sorted(names):
+            try:
+                engine.get_template(name)
+            except TemplateDoesNotExist:
+                logger.debug(f'Template {name} does not exist.')
+
+
+def prime_form_classes():
+    """Compile the form classes of all live form pages."""
+    from forms.models import FormPage  # noqa: WPS433
+
+    for page in FormPage.objects.live():
+        page.get_compiled_form()
+
+
+def prime_sites():
+    """Cache the root paths of the sites."""
+    from wagtail.core.models import Site  # noqa: WPS433
+
+    Site.get_site_root_paths()
+
+
+STEPS = (
+    ('imports', import_modules),
+    ('schema', build_schema),
+    ('graphql documents', prime_graphql_documents),
+    ('templates', compile_templates),
+    ('form classes', prime_form_classes),
+    ('sites', prime_sites),
+)
+
+
+def run(steps=STEPS):
+    """Run the warmup steps and return their durations and RSS after them."""
+    results = [Step('start', 0, get_rss(), None)]
+    for name, step in steps:
+        started = time.perf_counter()
+        error = None
+        try:
+            step()
+        except Exception as exc:
+            logger.warning(f'Warmup step {name} failed: {exc!r}')
+            error = exc
+        seconds = time.perf_counter() - started
+        results.append(Step(name, seconds, get_rss(), error))
+    connections.close_all()
+    return results
+
+
+def format_report(results):
+    """Return one line summary of a warmup."""
+    steps = ', '.join(
+        f'{step.name} {step.seconds * 1000:.0f} ms'
+        + (' (failed)' if step.error else '')
+        for step in results[1:]
+    )
+    total = sum(step.seconds for step in results)
+    return (
+        f'Warmed up in {total * 1000:.0f} ms ({steps}), RSS '
+        f'{results[0].rss / 2 ** 20:.1f} MiB -> '
+        f'{results[-1].rss / 2 ** 20:.1f} MiB'
+    )
@@ -18,3 +18,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "contact_form_prototype.settings.dev")
 
 application = get_wsgi_application()
+
+from forms.honeypot import HoneypotMiddleware
+from forms.ratelimit import RateLimitMiddleware
+
+# Answer honeypot spam and throttled clients before they reach the Django
+# middleware stack.
+application = RateLimitMiddleware(HoneypotMiddleware(application))
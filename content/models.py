@@ -10,6 +10,8 @@ from wagtail.core import models as wtm
 from wagtail.core import fields as wtf
 from wagtail.admin import edit_handlers as wtah
 
+from api import loaders
+
 
 class SomePage(wtm.Page):
     """Simple page to hold a form."""
@@ -33,5 +35,14 @@ class SomePage(wtm.Page):
         gplm.GraphQLForeignKey(
             'contact_form',
             'forms.FormPage',
+            source='graphql_contact_form',
         ),
     ]
+
+    def graphql_contact_form(self, info, **kwargs):
+        """Resolve contact form batched with the other pages of the query."""
+        return loaders.load_object(
+            info,
+            self._meta.get_field('contact_form').related_model.objects.all(),
+            self.contact_form_id,
+        )
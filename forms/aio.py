@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bounded thread pools for the async form submission path.
+
+The ORM and smtplib block, so the async path in :mod:`forms.asgi` runs them
+in thread pools of a fixed size instead of on the event loop. The database
+pool bounds the number of connections a process opens, the email pool keeps
+slow SMTP servers from starving database work.
+
+Functions run in the context of the caller, so that the routing state of
+:mod:`contact_form_prototype.routers` applies, and the queries they run are
+added to the request's :data:`monitoring.timing.request_metrics`.
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+
+from django import db as djdb  # type: ignore[import]
+from django.conf import settings  # type: ignore[import]
+
+from monitoring import timing
+
+database_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=settings.FORMS_ASYNC_DATABASE_THREADS,
+    thread_name_prefix='forms-database',
+)
+email_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=settings.FORMS_ASYNC_EMAIL_THREADS,
+    thread_name_prefix='forms-email',
+)
+
+
+def call_with_connection(func, *args, **kwargs):
+    """Call function, closing connections that are due like a request would."""
+    djdb.close_old_connections()
+    metrics = timing.request_metrics.get(None)
+    try:
+        if metrics is None:
+            return func(*args, **kwargs)
+        with timing.record_queries(metrics):
+            return func(*args, **kwargs)
+    finally:
+        djdb.close_old_connections()
+
+
+async def run_in_executor(executor, func, *args, **kwargs):
+    """Await a blocking function running in one of the pools."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        executor,
+        functools.partial(
+            context.run,
+            call_with_connection,
+            func,
+            *args,
+            **kwargs,
+        ),
+    )
+
+
+async def database(func, *args, **kwargs):
+    """Await a function that uses the database."""
+    return await run_in_executor(database_executor, func, *args, **kwargs)
+
+
+async def email(func, *args, **kwargs):
+    """Await a function that sends email."""
+    return await run_in_executor(email_executor, func, *args, **kwargs)
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+"""
+ASGI application that serves form page POSTs on the event loop.
+
+Django 3.0 runs every view in a thread of its own, so under ASGI a slow
+client or SMTP server still holds a thread per submission. This application
+wraps Django's and takes over POSTs to form pages: the body is read and the
+form validated on the event loop, the ORM and email run in the bounded pools
+of :mod:`forms.aio` (see :meth:`forms.models.FormPage.aserve`). Throttled
+clients and honeypot spam are answered like
+:class:`forms.ratelimit.RateLimitMiddleware` and
+:class:`forms.honeypot.HoneypotMiddleware` do under WSGI. Every other
+request, and form POSTs this path cannot serve (e.g. pages with view
+restrictions), is passed on to Django with the buffered body.
+
+The Django middleware stack is not run for the requests served here. What
+it does for form POSTs is done here instead: the requests are timed and
+logged like by :class:`monitoring.timing.ServerTimingMiddleware`, routed and
+pinned to the primary like by
+:class:`contact_form_prototype.routers.DatabaseRoutingMiddleware`, and
+Wagtail's ``before_serve_page`` hooks are run. Form page POSTs are CSRF
+exempt and anonymous, the hooks get no session, and only the clickjacking
+and nosniff headers are added like the security middleware would.
+"""
+
+import io
+import time
+
+from django import http as djhttp  # type: ignore[import]
+from django import urls as djurls  # type: ignore[import]
+from django.conf import settings  # type: ignore[import]
+from django.contrib.auth import models as djam  # type: ignore[import]
+from django.core import exceptions as djexc  # type: ignore[import]
+from django.core.handlers import asgi as djasgi  # type: ignore[import]
+from wagtail.core import hooks as wthooks  # type: ignore[import]
+from wagtail.core import models as wtcm  # type: ignore[import]
+
+from contact_form_prototype import routers
+from forms import aio
+from forms import honeypot
+from forms import ratelimit
+from forms.models import FormPage
+from monitoring import metrics
+from monitoring import timing
+
+
+def get_header(scope, name):
+    """Return decoded value of a request header or an empty string."""
+    for header_name, header_value in scope.get('headers', []):
+        if header_name.lower() == name:
+            return header_value.decode('latin1')
+    return ''
+
+
+def get_page_path(request):
+    """Return the page path if Wagtail serves the request, else ``None``."""
+    try:
+        match = djurls.resolve(request.path_info)
+    except djurls.Resolver404:
+        return None
+    if match.url_name != 'wagtail_serve':
+        return None
+    request.resolver_match = match
+    return match.args[0] if match.args else match.kwargs.get('path', '')
+
+
+def get_form_page(request, path):
+    """Return the live form page at the path that can be served, or ``None``."""
+    try:
+        site = wtcm.Site.find_for_request(request)
+    except djexc.DisallowedHost:
+        return None
+    if site is None:
+        return None
+    path_components = [component for component in path.split('/') if component]
+    try:
+        page, args, kwargs = site.root_page.specific.route(
+            request,
+            path_components,
+        )
+    except djhttp.Http404:
+        return None
+    if not isinstance(page, FormPage) or args or kwargs:
+        return None
+    if page.get_view_restrictions().exists():
+        # Restrictions are checked by a hook that needs the session.
+        return None
+    return page
+
+
+def run_before_serve_hooks(page, request):
+    """Return the response of the first hook that gives one, or ``None``."""
+    for hook in wthooks.get_hooks('before_serve_page'):
+        response = hook(page, request, [], {})
+        if isinstance(response, djhttp.HttpResponse):
+            return response
+    return None
+
+
+def add_security_headers(response):
+    """Add the headers the skipped security middleware would add."""
+    response.setdefault('X-Frame-Options', settings.X_FRAME_OPTIONS)
+    if settings.SECURE_CONTENT_TYPE_NOSNIFF:
+        response.setdefault('X-Content-Type-Options', 'nosniff')
+    return response
+
+
+class FormSubmissionApplication(object):
+    """Wrap Django's ASGI application to serve form POSTs asynchronously."""
+
+    def __init__(self, application):  # noqa: D107
+        self.application = application
+        # Only used for its response encoding.
+        self.handler = djasgi.ASGIHandler()
+
+    async def __call__(self, scope, receive, send):  # noqa: D102
+        if scope['type'] != 'http' or not self.is_candidate(scope):
+            return await self.application(scope, receive, send)
+        body = await self.read_body(receive)
+        if body is None:
+            # The client disconnected.
+            return None
+        request = self.create_request(scope, body)
+        throttled = ratelimit.check_early(request.META)
+        if throttled is not None:
+            response = add_security_headers(throttled)
+            return await self.handler.send_response(response, send)
+        if settings.FORMS_HONEYPOT_SHORT_CIRCUIT:
+            honeypot.stats.increment('inspected')
+            if honeypot.is_filled(request):
+                honeypot.stats.increment('short_circuited')
+                metrics.form_posts.inc(outcome='spam')
+                return await self.respond_empty(send)
+            honeypot.stats.increment('passed')
+        response = None
+        if settings.FORMS_ASYNC_SUBMISSIONS:
+            path = get_page_path(request)
+            if path is not None:
+                response = await self.serve(request, path)
+        if response is None:
+            return await self.application(
+                scope,
+                self.replay(body, receive),
+                send,
+            )
+        return await self.handler.send_response(response, send)
+
+    async def serve(self, request, path):
+        """Serve the form page at the path, ``None`` if it is not one."""
+        state = routers.get_request_state(request)
+        routing_token = routers.routing_state.set(state)
+        request_metrics = None
+        if settings.MONITORING_SERVER_TIMING:
+            request_metrics = timing.RequestMetrics(timing.get_route(request))
+        metrics_token = timing.request_metrics.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.serve_page(request, path)
+        finally:
+            timing.request_metrics.reset(metrics_token)
+            routers.routing_state.reset(routing_token)
+        if response is None:
+            return None
+        if request_metrics is not None:
+            request_metrics.total_time = time.perf_counter() - started
+            timing.report(request, response, request_metrics)
+        return add_security_headers(routers.pin_client(response, state))
+
+    async def serve_page(self, request, path):
+        """Run the hooks and serve the page like Wagtail's serve view."""
+        page = await aio.database(get_form_page, request, path)
+        if page is None:
+            return None
+        response = await aio.database(run_before_serve_hooks, page, request)
+        if response is None:
+            response = await page.aserve(request)
+        return response
+
+    def is_candidate(self, scope):
+        """Return whether the request may be a form page POST to handle."""
+        if not (
+            settings.FORMS_HONEYPOT_SHORT_CIRCUIT
+            or settings.FORMS_ASYNC_SUBMISSIONS
+        ):
+            return False
+        return honeypot.is_form_post(
+            scope['method'],
+            scope['path'],
+            get_header(scope, b'content-type'),
+            get_header(scope, b'content-length'),
+        )
+
+    async def read_body(self, receive):
+        """Return the whole request body, ``None`` if the client left."""
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+
+    def create_request(self, scope, body):
+        """Return Django request for the scope and buffered body."""
+        request = djasgi.ASGIRequest(scope, io.BytesIO(body))
+        request.user = djam.AnonymousUser()
+        return request
+
+    def replay(self, body, receive):
+        """Return receive callable that hands out the buffered body first."""
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+        async def replayed_receive():  # noqa: WPS430
+            if messages:
+                return messages.pop()
+            return await receive()
+        return replayed_receive
+
+    async def respond_empty(self, send):
+        """Send the same empty success response as FormPage.handle_POST."""
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (name.encode('latin1'), header_value.encode('latin1'))
+                for name, header_value in honeypot.get_response_headers()
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': b''})
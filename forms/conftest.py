@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""Fixtures for the forms app tests."""
+
+from concurrent import futures
+import socketserver
+import threading
+
+from django import db as djdb  # type: ignore[import]
+import pytest  # type: ignore[import]
+
+from forms import aio
+
+
+class SMTPStandInHandler(socketserver.StreamRequestHandler):
+    """Speak just enough SMTP to accept messages."""
+
+    def reply(self, line):  # noqa: D102
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):  # noqa: D102
+        self.server.connections += 1
+        self.reply('220 localhost SMTP stand-in')
+        for raw_line in self.rfile:
+            command = raw_line.decode().strip().upper()
+            if command.startswith('DATA'):
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                message_lines = []
+                for data_line in self.rfile:
+                    if data_line in {b'.\r\n', b'.\n'}:
+                        break
+                    message_lines.append(data_line)
+                self.server.messages.append(b''.join(message_lines).decode())
+                self.reply('250 OK')
+            elif command.startswith('QUIT'):
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Local SMTP server that records connections and messages."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):  # noqa: D107
+        super().__init__(('127.0.0.1', 0), SMTPStandInHandler)
+        self.connections = 0
+        self.messages = []
+
+
+@pytest.fixture
+def smtp_stand_in(settings):  # noqa: D103
+    server = SMTPStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    settings.EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+    settings.EMAIL_HOST = '127.0.0.1'
+    settings.EMAIL_PORT = server.server_address[1]
+    settings.EMAIL_HOST_USER = None
+    settings.EMAIL_HOST_PASSWORD = None
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def shared_connection_executors(db, monkeypatch):
+    """Run the pools of the async path on the test's database connection."""
+    connection = djdb.connections[djdb.DEFAULT_DB_ALIAS]
+    connection.inc_thread_sharing()
+
+    def share_connection():  # noqa: WPS430
+        # Like LiveServerThread, so the threads see the test transaction.
+        djdb.connections[djdb.DEFAULT_DB_ALIAS] = connection
+
+    executor = futures.ThreadPoolExecutor(
+        max_workers=1,
+        initializer=share_connection,
+    )
+    monkeypatch.setattr(aio, 'database_executor', executor)
+    monkeypatch.setattr(aio, 'email_executor', executor)
+    yield executor
+    executor.shutdown()
+    connection.dec_thread_sharing()
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+"""
+Static export of form definitions for frontend builds.
+
+Each live form page is written to ``forms/<page id>-<hash>.json`` below the
+export directory, the hash being the sha256 of the file content. The
+``manifest.json`` next to it lists every form with its file, hash and
+``last_published_at``. A run only rebuilds the pages whose
+``last_published_at`` differs from the manifest. Publishing without changing
+the form keeps its file name, so the frontend build can skip every file
+whose name it has seen before.
+"""
+
+import collections
+import hashlib
+import json
+import os
+
+from django.conf import settings  # type: ignore[import]
+
+from forms.models import FormField, FormPage
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+FORMS_DIRECTORY = 'forms'
+# Keep IN clauses below the SQLite variable limit.
+QUERY_CHUNK_SIZE = 500
+
+ExportResult = collections.namedtuple(
+    'ExportResult',
+    ['written', 'unchanged', 'skipped', 'removed'],
+)
+
+
+def encode(document):
+    """Return canonical JSON encoding of a document."""
+    return json.dumps(
+        document,
+        ensure_ascii=False,
+        separators=(',', ':'),
+        sort_keys=True,
+    ).encode('utf-8')
+
+
+def split_choices(choices):
+    """Return choices as a list, split like the Wagtail form builder does."""
+    if not choices:
+        return []
+    return [choice.strip() for choice in choices.split(',')]
+
+
+def get_field_definition(field):
+    """Return the exported definition of a form field."""
+    return {
+        'name': field.clean_name,
+        'label': field.label,
+        'fieldType': field.field_type,
+        'required': field.required,
+        'choices': split_choices(field.choices),
+        'defaultValue': field.default_value,
+        'helpText': field.help_text,
+    }
+
+
+def get_definition(page, fields):
+    """Return the exported definition of a form page."""
+    return {
+        'version': FORMAT_VERSION,
+        'id': page.pk,
+        'title': page.title,
+        'slug': page.slug,
+        'urlPath': page.url_path,
+        'intro': page.intro,
+        'thankYouText': page.thank_you_text,
+        'fields': [get_field_definition(field) for field in fields],
+    }
+
+
+def get_timestamp(page):  # noqa: D103
+    if page.last_published_at is None:
+        return None
+    return page.last_published_at.isoformat()
+
+
+def write_atomic(path, content):
+    """Write file so readers never see it half written."""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as tmp_file:
+        tmp_file.write(content)
+    os.replace(tmp_path, path)
+
+
+def get_form_fields(page_ids):
+    """Return form fields of the pages grouped by page id."""
+    grouped = collections.defaultdict(list)
+    for start in range(0, len(page_ids), QUERY_CHUNK_SIZE):
+        form_fields = FormField.objects.filter(
+            page_id__in=page_ids[start:start + QUERY_CHUNK_SIZE],
+        ).order_by('page_id', 'sort_order', 'pk')
+        for field in form_fields:
+            grouped[field.page_id].append(field)
+    return grouped
+
+
+class DefinitionExporter(object):
+    """Export form definitions incrementally to a directory."""
+
+    def __init__(self, directory=None):  # noqa: D107
+        self.directory = directory or settings.FORMS_DEFINITIONS_EXPORT_DIR
+        self.forms_directory = os.path.join(self.directory, FORMS_DIRECTORY)
+        self.manifest_path = os.path.join(self.directory, MANIFEST_NAME)
+
+    def load_manifest(self):
+        """Return the manifest of the previous run or an empty one."""
+        try:
+            with open(self.manifest_path, 'rb') as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            return {'version': FORMAT_VERSION, 'forms': {}}
+        if manifest.get('version') != FORMAT_VERSION:
+            return {'version': FORMAT_VERSION, 'forms': {}}
+        return manifest
+
+    def is_current(self, entry, page):
+        """Return whether the exported file of the page is up to date."""
+        if entry is None or entry['lastPublishedAt'] != get_timestamp(page):
+            return False
+        return os.path.exists(os.path.join(self.directory, entry['file']))
+
+    def export(self, full=False):
+        """Export the changed form pages and return what was done."""
+        os.makedirs(self.forms_directory, exist_ok=True)
+        old_manifest = self.load_manifest()
+        old_entries = {} if full else old_manifest['forms']
+        entries = {}
+        changed_pages = []
+        skipped = 0
+        for page in FormPage.objects.live().order_by('pk'):
+            key = str(page.pk)
+            if self.is_current(old_entries.get(key), page):
+                entries[key] = old_entries[key]
+                skipped += 1
+            else:
+                changed_pages.append(page)
+        form_fields = get_form_fields([page.pk for page in changed_pages])
+        written = 0
+        for page in changed_pages:
+            entry, created = self.write(page, form_fields[page.pk])
+            old_entry = old_manifest['forms'].get(str(page.pk))
+            if old_entry and old_entry['file'] != entry['file']:
+                self.remove(old_entry['file'])
+            written += created
+            entries[str(page.pk)] = entry
+        removed = 0
+        for key, old_entry in old_manifest['forms'].items():
+            if key not in entries:
+                self.remove(old_entry['file'])
+                removed += 1
+        manifest = encode({'version': FORMAT_VERSION, 'forms': entries})
+        if manifest != encode(old_manifest):
+            write_atomic(self.manifest_path, manifest)
+        return ExportResult(
+            written=written,
+            unchanged=len(changed_pages) - written,
+            skipped=skipped,
+            removed=removed,
+        )
+
+    def write(self, page, fields):
+        """Write definition file of a page unless it exists, return its entry."""
+        content = encode(get_definition(page, fields))
+        content_hash = hashlib.sha256(content).hexdigest()
+        relative_path = f'{FORMS_DIRECTORY}/{page.pk}-{content_hash[:16]}.json'
+        path = os.path.join(self.directory, relative_path)
+        created = not os.path.exists(path)
+        if created:
+            write_atomic(path, content)
+        entry = {
+            'file': relative_path,
+            'sha256': content_hash,
+            'lastPublishedAt': get_timestamp(page),
+            'slug': page.slug,
+            'urlPath': page.url_path,
+        }
+        return entry, created
+
+    def remove(self, relative_path):  # noqa: D102
+        try:
+            os.remove(os.path.join(self.directory, relative_path))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+"""
+Storage encodings of submission ``form_data``.
+
+Wagtail stores every submission as a JSON object, repeating all field names
+in every row. Form pages can opt in to a compact encoding instead: the field
+names are stored once per form version in a :class:`SubmissionFieldNames`
+row and submissions only store the values, positionally::
+
+    c<field names id>:["someone@example.com",""]
+
+The compressed encoding additionally deflates the values with zlib::
+
+    z<field names id>:<base85 of the zlib compressed values>
+
+Rows of all encodings can live side by side, :func:`decode` tells them apart
+by their first character. Field names are immutable and cached per process.
+"""
+
+import base64
+import hashlib
+import json
+import threading
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder  # type: ignore[import]
+from django.db import transaction  # type: ignore[import]
+
+ENCODING_JSON = 'json'
+ENCODING_COMPACT = 'compact'
+ENCODING_COMPRESSED = 'compressed'
+ENCODING_CHOICES = [
+    (ENCODING_JSON, 'JSON'),
+    (ENCODING_COMPACT, 'Compact'),
+    (ENCODING_COMPRESSED, 'Compact and compressed'),
+]
+
+PREFIXES = {
+    ENCODING_COMPACT: 'c',
+    ENCODING_COMPRESSED: 'z',
+}
+
+
+class FieldNamesCache(object):
+    """Process-level cache of field name lists in both directions."""
+
+    def __init__(self):  # noqa: D107
+        self._names = {}
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def get_names(self, names_id):
+        """Return the field names stored under an id."""
+        names = self._names.get(names_id)
+        if names is None:
+            from forms import models  # noqa: WPS433 (avoid circular import)
+
+            names = tuple(json.loads(
+                models.SubmissionFieldNames.objects.get(pk=names_id).names,
+            ))
+            self.add(names_id, None, names)
+        return names
+
+    def get_id(self, page_id, names):
+        """Return the id of the field names of a page, storing them if new."""
+        key = (page_id, names)
+        names_id = self._ids.get(key)
+        if names_id is None:
+            from forms import models  # noqa: WPS433 (avoid circular import)
+
+            names_id = models.SubmissionFieldNames.objects.get_or_create(
+                page_id=page_id,
+                key=get_key(names),
+                defaults={'names': json.dumps(names)},
+            )[0].pk
+            # Only cache the id once the row is there to stay.
+            transaction.on_commit(
+                lambda: self.add(names_id, page_id, names),
+            )
+        return names_id
+
+    def add(self, names_id, page_id, names):  # noqa: D102
+        with self._lock:
+            self._names[names_id] = names
+            if page_id is not None:
+                self._ids[(page_id, names)] = names_id
+
+    def clear(self):  # noqa: D102
+        with self._lock:
+            self._names.clear()
+            self._ids.clear()
+
+
+field_names_cache = FieldNamesCache()
+
+
+def get_key(names):
+    """Return the key identifying a form version by its field names."""
+    return hashlib.sha1(  # noqa: S303
+        json.dumps(names).encode('utf-8'),
+    ).hexdigest()
+
+
+def dumps(value):  # noqa: D103
+    return json.dumps(value, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+
+def encode(page_id, data, encoding):
+    """Return ``form_data`` of the data dict in the given encoding."""
+    if encoding == ENCODING_JSON:
+        return json.dumps(data, cls=DjangoJSONEncoder)
+    names = tuple(data)
+    names_id = field_names_cache.get_id(page_id, names)
+    values = dumps([data[name] for name in names])
+    if encoding == ENCODING_COMPRESSED:
+        values = base64.b85encode(
+            zlib.compress(values.encode('utf-8')),
+        ).decode('ascii')
+    return f'{PREFIXES[encoding]}{names_id}:{values}'
+
+
+def get_encoding(form_data):
+    """Return the encoding of stored ``form_data``."""
+    for encoding, prefix in PREFIXES.items():
+        if form_data.startswith(prefix):
+            return encoding
+    return ENCODING_JSON
+
+
+def get_names_id(form_data):
+    """Return id of the field names of compact ``form_data``, else ``None``."""
+    if get_encoding(form_data) == ENCODING_JSON:
+        return None
+    return int(form_data[1:].split(':', 1)[0])
+
+
+def decode(form_data):
+    """Return the data dict of ``form_data`` in any encoding."""
+    encoding = get_encoding(form_data)
+    if encoding == ENCODING_JSON:
+        return json.loads(form_data)
+    values = form_data[1:].split(':', 1)[1]
+    if encoding == ENCODING_COMPRESSED:
+        values = zlib.decompress(base64.b85decode(values)).decode('utf-8')
+    names = field_names_cache.get_names(get_names_id(form_data))
+    return dict(zip(names, json.loads(values)))
+
+
+def convert_submissions(page, batch_size=500):
+    """Re-encode the submissions of a page in its encoding, in batches."""
+    queryset = page.get_submission_class()._default_manager.filter(page=page)
+    converted = 0
+    last_pk = 0
+    while True:  # noqa: WPS457
+        submissions = list(
+            queryset.filter(pk__gt=last_pk).order_by('pk').only(
+                'pk', 'form_data',
+            )[:batch_size],
+        )
+        if not submissions:
+            return converted
+        changed = []
+        for submission in submissions:
+            if get_encoding(submission.form_data) == page.submission_encoding:
+                continue
+            submission.form_data = page.encode_form_data(
+                decode(submission.form_data),
+            )
+            changed.append(submission)
+        with transaction.atomic():
+            queryset.bulk_update(changed, ['form_data'])
+        converted += len(changed)
+        last_pk = submissions[-1].pk
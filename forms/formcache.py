@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+"""
+Process-level cache of compiled form classes.
+
+Building the form class of a form page queries its form fields and creates a
+new Django form class on every request. Form definitions hardly ever change,
+so the compiled class and data fields are cached per page and keyed by the
+time the page was last published. Publishing, also when scheduled, changes
+the key in every process; saving a draft does not, the live form fields stay
+the same. Saving the page or its form fields additionally invalidates the
+entry of the current process.
+"""
+
+import collections
+import threading
+
+CompiledForm = collections.namedtuple(
+    'CompiledForm',
+    ['form_class', 'data_fields', 'indexed_fields'],
+)
+
+
+class FormClassCache(object):
+    """Cache of compiled forms keyed by page id and publishing time."""
+
+    def __init__(self):  # noqa: D107
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_version(page):
+        """Return the part of the key that changes with the form definition."""
+        return page.last_published_at
+
+    def get(self, page):
+        """Return compiled form of the page, compiling it on a miss."""
+        compiled = self.peek(page)
+        if compiled is not None:
+            return compiled
+        version = self.get_version(page)
+        compiled = page.compile_form()
+        with self._lock:
+            self.misses += 1
+            if page.pk is not None:
+                self._entries[page.pk] = (version, compiled)
+        return compiled
+
+    def peek(self, page):
+        """Return compiled form of the page if it is cached, else ``None``."""
+        entry = self._entries.get(page.pk)
+        if entry is None or entry[0] != self.get_version(page):
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry[1]
+
+    def invalidate(self, page_id):
+        """Drop the cached form of a page."""
+        with self._lock:
+            self._entries.pop(page_id, None)
+
+    def clear(self):
+        """Drop all cached forms and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return hit and miss counters and the number of cached forms."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+        }
+
+
+form_class_cache = FormClassCache()
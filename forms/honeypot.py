@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+"""
+Answer honeypot spam before Django handles it.
+
+Most POSTs to the form endpoints are bot traffic that fills the hidden
+``spammer_jammer`` field. :meth:`forms.models.FormPage.handle_POST` ignores
+those, but only after the request went through the whole middleware stack
+and Wagtail's page routing. This middleware recognises such requests by
+their body alone and returns the same empty 200 response straight away,
+without touching the session store, the database or the page tree.
+
+The checks are shared with the ASGI application in :mod:`forms.asgi`.
+"""
+
+import collections
+import io
+import logging
+import threading
+
+from django.conf import settings  # type: ignore[import]
+from django.core.handlers import wsgi as djwsgi  # type: ignore[import]
+
+from monitoring import metrics
+
+logger = logging.getLogger(__name__)
+
+FIELD_NAME = 'spammer_jammer'
+
+FORM_CONTENT_TYPES = (
+    'application/x-www-form-urlencoded',
+    'multipart/form-data',
+)
+
+
+class HoneypotStats(object):
+    """Thread-safe counters of the short-circuit outcomes."""
+
+    def __init__(self):  # noqa: D107
+        self._counter = collections.Counter()
+        self._lock = threading.Lock()
+
+    def increment(self, name, amount=1):  # noqa: D102
+        with self._lock:
+            self._counter[name] += amount
+
+    def as_dict(self):
+        """Return copy of the counters."""
+        with self._lock:
+            return dict(self._counter)
+
+    def reset(self):  # noqa: D102
+        with self._lock:
+            self._counter.clear()
+
+
+stats = HoneypotStats()
+
+
+def is_candidate(method, path, content_type, content_length):
+    """Return whether a request may be a form endpoint POST to inspect."""
+    if not settings.FORMS_HONEYPOT_SHORT_CIRCUIT:
+        return False
+    return is_form_post(method, path, content_type, content_length)
+
+
+def is_form_post(method, path, content_type, content_length):
+    """Return whether a request may be a form endpoint POST."""
+    if method != 'POST':
+        return False
+    if not content_type.startswith(FORM_CONTENT_TYPES):
+        return False
+    if path.startswith(tuple(settings.FORMS_HONEYPOT_EXCLUDED_PATHS)):
+        return False
+    try:
+        content_length = int(content_length or 0)
+    except ValueError:
+        return False
+    # Large bodies (e.g. file uploads) are left to Django.
+    return 0 < content_length <= settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+
+
+def is_filled(request):
+    """Return whether the honeypot field of a parsed request is filled."""
+    try:
+        field_value = request.POST.get(FIELD_NAME)
+    except Exception:
+        # Malformed bodies are Django's problem.
+        logger.debug('Could not parse request body.', exc_info=True)
+        return False
+    return bool(field_value)
+
+
+def get_response_headers():
+    """Return headers of the empty success response of FormPage.handle_POST."""
+    headers = [
+        ('Content-Type', f'text/html; charset={settings.DEFAULT_CHARSET}'),
+        ('Content-Length', '0'),
+        ('X-Frame-Options', settings.X_FRAME_OPTIONS),
+    ]
+    if settings.SECURE_CONTENT_TYPE_NOSNIFF:
+        headers.append(('X-Content-Type-Options', 'nosniff'))
+    return headers
+
+
+class HoneypotMiddleware(object):
+    """Wrap a WSGI application to short-circuit honeypot spam."""
+
+    def __init__(self, application):  # noqa: D107
+        self.application = application
+
+    def __call__(self, environ, start_response):  # noqa: D102
+        if self.is_candidate(environ):
+            stats.increment('inspected')
+            if self.is_spam(environ):
+                stats.increment('short_circuited')
+                metrics.form_posts.inc(outcome='spam')
+                return self.respond(start_response)
+            stats.increment('passed')
+        return self.application(environ, start_response)
+
+    def is_candidate(self, environ):
+        """Return whether the request may be a form endpoint POST."""
+        return is_candidate(
+            environ.get('REQUEST_METHOD'),
+            environ.get('PATH_INFO', ''),
+            environ.get('CONTENT_TYPE', ''),
+            environ.get('CONTENT_LENGTH'),
+        )
+
+    def is_spam(self, environ):
+        """
+        Return whether the honeypot field of the request body is filled.
+
+        The body is buffered and put back into the environ, so the wrapped
+        application can still read it.
+
+        """  # noqa: DAR101, DAR201
+        content_length = int(environ['CONTENT_LENGTH'])
+        body = environ['wsgi.input'].read(content_length)
+        environ['wsgi.input'] = io.BytesIO(body)
+        return is_filled(djwsgi.WSGIRequest(
+            dict(environ, **{'wsgi.input': io.BytesIO(body)}),
+        ))
+
+    def respond(self, start_response):
+        """Send the same empty success response as FormPage.handle_POST."""
+        start_response('200 OK', get_response_headers())
+        return [b'']
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+"""
+Idempotency keys for form submissions.
+
+Clients on flaky networks retry POSTs they did not get an answer to. A POST
+with an ``Idempotency-Key`` header is processed once per form page: its
+valid response is kept for ``FORMS_IDEMPOTENCY_TTL`` seconds and sent again
+to retries with the same key, which are not validated, written or emailed
+again. Keys are not tied to the client IP, so retries still match after the
+client switched networks. With ``FORMS_IDEMPOTENCY_CONTENT_WINDOW`` set,
+POSTs without a key are deduplicated by their fields and client IP within
+that many seconds.
+
+Responses are kept in a small SQLite file shared by all worker processes,
+like the buckets of :class:`forms.ratelimit.SQLiteBackend`, keyed by a 16
+byte digest and with zlib compressed bodies. While the first request is
+processed its key is claimed and retries get 409 Conflict. Claims are
+released if the request fails or is invalid and expire after
+``FORMS_IDEMPOTENCY_CLAIM_TIMEOUT`` seconds if a worker dies.
+``manage.py purge_idempotency_keys`` deletes expired entries.
+"""
+
+import collections
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from django import http as djhttp  # type: ignore[import]
+from django.conf import settings  # type: ignore[import]
+
+from forms import ratelimit
+
+# Status of a claimed key whose request is being processed.
+CLAIMED = 0
+
+DIGEST_SIZE = 16
+
+# Fields that differ between identical submissions of a client.
+IGNORED_FIELDS = frozenset(('csrfmiddlewaretoken',))
+
+Key = collections.namedtuple('Key', ['digest', 'ttl'])
+
+
+def get_digest(*parts):
+    """Return compact digest of the parts of a key."""
+    return hashlib.sha256('\0'.join(parts).encode()).digest()[:DIGEST_SIZE]
+
+
+def get_key(request, page):
+    """Return the idempotency key of a POST to a page, ``None`` if none."""
+    if not settings.FORMS_IDEMPOTENCY:
+        return None
+    header = request.headers.get('Idempotency-Key')
+    if header:
+        return Key(
+            get_digest(str(page.pk), 'key', header),
+            settings.FORMS_IDEMPOTENCY_TTL,
+        )
+    window = settings.FORMS_IDEMPOTENCY_CONTENT_WINDOW
+    if not window or request.FILES:
+        return None
+    fields = sorted(
+        (name, field_value)
+        for name in request.POST
+        if name not in IGNORED_FIELDS
+        for field_value in request.POST.getlist(name)
+    )
+    return Key(
+        get_digest(
+            str(page.pk),
+            'content',
+            ratelimit.get_client_ip(request),
+            json.dumps(fields),
+        ),
+        window,
+    )
+
+
+def get_replayed_response(status, body):
+    """Return the kept response of a key."""
+    if status == CLAIMED:
+        response = djhttp.HttpResponse(status=409)
+        response['Retry-After'] = 1
+        return response
+    response = djhttp.HttpResponse(
+        zlib.decompress(body),
+        status=status,
+        content_type='application/json',
+    )
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+class SQLiteStore(object):
+    """Keep responses by idempotency key in a SQLite file."""
+
+    def __init__(self, path=None):  # noqa: D107
+        self.path = path or settings.FORMS_IDEMPOTENCY_SQLITE_PATH
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        """Return the connection of the current thread."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path,
+                timeout=5,
+                isolation_level=None,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS idempotent_response ('
+                'key BLOB PRIMARY KEY, status INTEGER NOT NULL, body BLOB, '
+                'expires_at REAL NOT NULL) WITHOUT ROWID',
+            )
+            self._local.connection = connection
+        return connection
+
+    def claim(self, key):
+        """
+        Claim a key for a request.
+
+        Returns:
+            ``None`` if the request should be processed, else the response
+            for a retry.
+
+        """  # noqa: DAR101
+        connection = self.connection
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT status, body FROM idempotent_response '
+                'WHERE key = ? AND expires_at > ?',
+                (key.digest, now),
+            ).fetchone()
+            if row is None:
+                connection.execute(
+                    'INSERT OR REPLACE INTO idempotent_response '
+                    '(key, status, body, expires_at) VALUES (?, ?, NULL, ?)',
+                    (
+                        key.digest,
+                        CLAIMED,
+                        now + settings.FORMS_IDEMPOTENCY_CLAIM_TIMEOUT,
+                    ),
+                )
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        if row is None:
+            return None
+        return get_replayed_response(*row)
+
+    def finish(self, key, response):
+        """Keep a valid response for retries, else release the claim."""
+        if response is not None and response.status_code == 200:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO idempotent_response '
+                '(key, status, body, expires_at) VALUES (?, ?, ?, ?)',
+                (
+                    key.digest,
+                    response.status_code,
+                    zlib.compress(response.content),
+                    time.time() + key.ttl,
+                ),
+            )
+        else:
+            self.connection.execute(
+                'DELETE FROM idempotent_response '
+                'WHERE key = ? AND status = ?',
+                (key.digest, CLAIMED),
+            )
+
+    def purge(self):
+        """Delete expired responses and claims, return their number."""
+        return self.connection.execute(
+            'DELETE FROM idempotent_response WHERE expires_at <= ?',
+            (time.time(),),
+        ).rowcount
+
+
+@functools.lru_cache(maxsize=None)
+def get_store():
+    """Return the store of this process."""
+    return SQLiteStore()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+"""
+Indexed lookups of submissions by field value.
+
+Finding the submissions with a given email address would otherwise mean
+decoding the form data of every submission. For form fields marked as
+indexed, the normalised value of every submission is written to the
+:class:`forms.models.SubmissionFieldValue` side table together with the
+submission, so such lookups are a single indexed query::
+
+    lookups.find('email', 'Someone@Example.com ')
+
+Values are stripped, case folded and cut to ``MAX_VALUE_LENGTH``
+characters. Fields with several values (e.g. checkboxes) get a row per
+value, empty values are not indexed.
+"""
+
+from django.db import transaction  # type: ignore[import]
+
+MAX_VALUE_LENGTH = 255
+
+
+def normalise(value):
+    """Return the value as it is stored in and looked up from the index."""
+    return ' '.join(str(value).split()).casefold()[:MAX_VALUE_LENGTH]
+
+
+def get_rows(page, submission, data, field_names):
+    """Return unsaved index rows of a submission's data."""
+    from forms import models  # noqa: WPS433 (avoid circular import)
+
+    rows = []
+    for field_name in sorted(field_names):
+        field_values = data.get(field_name)
+        if not isinstance(field_values, (list, tuple)):
+            field_values = [field_values]
+        for field_value in field_values:
+            if field_value is None:
+                continue
+            normalised = normalise(field_value)
+            if normalised:
+                rows.append(models.SubmissionFieldValue(
+                    page_id=page.pk,
+                    submission_id=submission.pk,
+                    field_name=field_name,
+                    value=normalised,
+                ))
+    return rows
+
+
+def index_submissions(page, submissions_with_data, field_names=None):
+    """Index the values of saved submissions, given with their data dicts."""
+    from forms import models  # noqa: WPS433 (avoid circular import)
+
+    if field_names is None:
+        field_names = page.get_compiled_form().indexed_fields
+    if not field_names:
+        return 0
+    rows = []
+    for submission, data in submissions_with_data:
+        rows.extend(get_rows(page, submission, data, field_names))
+    models.SubmissionFieldValue.objects.bulk_create(rows)
+    return len(rows)
+
+
+def find(field_name, value, page=None):
+    """Return the submissions whose indexed field has the value."""
+    from forms import models  # noqa: WPS433 (avoid circular import)
+
+    index_rows = models.SubmissionFieldValue.objects.filter(
+        field_name=field_name,
+        value=normalise(value),
+    )
+    if page is not None:
+        index_rows = index_rows.filter(page=page)
+    return models.Submission.objects.filter(
+        pk__in=index_rows.values('submission_id'),
+    )
+
+
+def find_any(page, value):
+    """Return the submissions of a page with the value in any indexed field."""
+    from forms import models  # noqa: WPS433 (avoid circular import)
+
+    return models.Submission.objects.filter(
+        pk__in=models.SubmissionFieldValue.objects.filter(
+            page=page,
+            value=normalise(value),
+        ).values('submission_id'),
+    )
+
+
+def reindex(page, batch_size=500):
+    """Rebuild the index rows of a page's submissions, return rows written."""
+    from forms import models  # noqa: WPS433 (avoid circular import)
+
+    field_names = page.get_compiled_form().indexed_fields
+    index_rows = models.SubmissionFieldValue.objects.filter(page=page)
+    index_rows.exclude(field_name__in=field_names).delete()
+    queryset = page.get_submission_class()._default_manager.filter(page=page)
+    written = 0
+    last_pk = 0
+    while True:  # noqa: WPS457
+        submissions = list(
+            queryset.filter(pk__gt=last_pk).order_by('pk')[:batch_size],
+        )
+        if not submissions:
+            return written
+        with transaction.atomic():
+            index_rows.filter(submission__in=submissions).delete()
+            written += index_submissions(
+                page,
+                [(submission, submission.get_data()) for submission in submissions],
+                field_names,
+            )
+        last_pk = submissions[-1].pk
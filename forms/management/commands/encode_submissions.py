@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+"""Convert stored submissions to the encoding of their form page."""
+
+from django.core.management.base import BaseCommand  # type: ignore[import]
+
+from forms import encoding
+from forms.models import FormPage
+
+
+class Command(BaseCommand):
+    """Re-encode submissions whose encoding differs from their page's."""
+
+    help = (  # noqa: WPS125
+        'Convert the stored form data of submissions to the encoding set on '
+        'their form page, in batches.'
+    )
+
+    def add_arguments(self, parser):  # noqa: D102
+        parser.add_argument(
+            '--page',
+            type=int,
+            action='append',
+            dest='page_ids',
+            help='Only convert this form page, can be repeated.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Submissions updated per transaction.',
+        )
+
+    def handle(self, *args, **options):  # noqa: D102
+        pages = FormPage.objects.order_by('pk')
+        if options['page_ids']:
+            pages = pages.filter(pk__in=options['page_ids'])
+        converted = 0
+        for page in pages:
+            converted += encoding.convert_submissions(
+                page,
+                batch_size=options['batch_size'],
+            )
+        self.stdout.write(f'Converted {converted} submissions.')
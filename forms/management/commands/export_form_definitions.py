@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+"""Export form definitions as static JSON files for frontend builds."""
+
+from django.core.management.base import BaseCommand  # type: ignore[import]
+
+from forms import definitions
+
+
+class Command(BaseCommand):
+    """Write the definitions of changed form pages and the manifest."""
+
+    help = (  # noqa: WPS125
+        'Export the definitions of live form pages to versioned JSON files. '
+        'Only pages published since the last run are rewritten.'
+    )
+
+    def add_arguments(self, parser):  # noqa: D102
+        parser.add_argument(
+            '--output',
+            default=None,
+            help='Export directory, FORMS_DEFINITIONS_EXPORT_DIR by default.',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Rebuild every form instead of only the changed ones.',
+        )
+
+    def handle(self, *args, **options):  # noqa: D102
+        exporter = definitions.DefinitionExporter(options['output'])
+        result = exporter.export(full=options['full'])
+        self.stdout.write(
+            f'Wrote {result.written}, unchanged {result.unchanged}, '
+            f'skipped {result.skipped}, removed {result.removed} forms '
+            f'to {exporter.directory}.',
+        )
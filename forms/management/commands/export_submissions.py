@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""Stream the submissions of a form page as CSV or NDJSON."""
+
+from django.core.management.base import BaseCommand  # type: ignore[import]
+from django.core.management.base import CommandError  # type: ignore[import]
+from django.utils import dateparse  # type: ignore[import]
+
+from forms import exports
+from forms.models import FormPage
+
+
+def parse_date(date_string):  # noqa: D103
+    if date_string is None:
+        return None
+    date = dateparse.parse_date(date_string)
+    if date is None:
+        raise CommandError(f'Invalid date {date_string}, use YYYY-MM-DD.')
+    return date
+
+
+class Command(BaseCommand):
+    """Export the submissions of a form page."""
+
+    help = (  # noqa: WPS125
+        'Export the submissions of a form page as CSV or NDJSON. Rows are '
+        'streamed, so memory use does not grow with the number of rows.'
+    )
+
+    def add_arguments(self, parser):  # noqa: D102
+        parser.add_argument('page_id', type=int)
+        parser.add_argument(
+            '--format',
+            choices=sorted(exports.FORMATTERS),
+            default='csv',
+        )
+        parser.add_argument('--date-from', help='First day, YYYY-MM-DD.')
+        parser.add_argument('--date-to', help='Last day, YYYY-MM-DD.')
+        parser.add_argument(
+            '--output',
+            default=None,
+            help='File to write to, standard output by default.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help='Rows fetched per query, FORMS_EXPORT_CHUNK_SIZE by default.',
+        )
+
+    def handle(self, *args, **options):  # noqa: D102
+        try:
+            page = FormPage.objects.get(pk=options['page_id'])
+        except FormPage.DoesNotExist:
+            raise CommandError(f'Form page {options["page_id"]} does not exist.')
+        chunks = exports.iter_export(
+            options['format'],
+            exports.get_submissions(
+                page,
+                parse_date(options['date_from']),
+                parse_date(options['date_to']),
+            ),
+            page.get_data_fields(),
+            options['chunk_size'],
+        )
+        if options['output'] is None:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode('utf-8'), ending='')
+            return
+        with open(options['output'], 'wb') as output:
+            for chunk in chunks:  # noqa: WPS440
+                output.write(chunk)
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+"""Write spooled form submissions to the database."""
+
+import time
+
+from django.conf import settings  # type: ignore[import]
+from django.core.management.base import BaseCommand  # type: ignore[import]
+from django.db import connection as djconnection  # type: ignore[import]
+
+from forms import writebehind
+
+
+class Command(BaseCommand):
+    """Flush the write-behind submission spool."""
+
+    help = 'Write spooled form submissions to the database.'  # noqa: WPS125
+
+    def add_arguments(self, parser):  # noqa: D102
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep flushing every FORMS_WRITE_BEHIND_FLUSH_INTERVAL seconds.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Number of submissions per bulk insert.',
+        )
+
+    def handle(self, *args, **options):  # noqa: D102
+        spool = writebehind.get_spool()
+        recovered = spool.recover(
+            older_than=settings.FORMS_WRITE_BEHIND_CLAIM_TIMEOUT,
+        )
+        if recovered:
+            self.stdout.write(f'Recovered {recovered} stale claims.')
+        while True:  # noqa: WPS457
+            written = writebehind.flush(spool, options['batch_size'])
+            if written or not options['loop']:
+                self.stdout.write(f'Wrote {written} submissions.')
+            if not options['loop']:
+                return
+            djconnection.close()
+            time.sleep(settings.FORMS_WRITE_BEHIND_FLUSH_INTERVAL)
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+"""Build the field value index of existing submissions."""
+
+from django.core.management.base import BaseCommand  # type: ignore[import]
+
+from forms import lookups
+from forms.models import FormPage
+
+
+class Command(BaseCommand):
+    """Rebuild the index rows of the indexed form fields."""
+
+    help = (  # noqa: WPS125
+        'Rebuild the field value index of existing submissions, e.g. after '
+        'marking a form field as indexed.'
+    )
+
+    def add_arguments(self, parser):  # noqa: D102
+        parser.add_argument(
+            '--page',
+            type=int,
+            action='append',
+            dest='page_ids',
+            help='Only index this form page, can be repeated.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Submissions indexed per transaction.',
+        )
+
+    def handle(self, *args, **options):  # noqa: D102
+        pages = FormPage.objects.order_by('pk')
+        if options['page_ids']:
+            pages = pages.filter(pk__in=options['page_ids'])
+        written = 0
+        for page in pages:
+            written += lookups.reindex(page, batch_size=options['batch_size'])
+        self.stdout.write(f'Wrote {written} index rows.')
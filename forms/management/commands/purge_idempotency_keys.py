@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+"""Delete expired idempotency keys of form submissions."""
+
+from django.core.management.base import BaseCommand  # type: ignore[import]
+
+from forms import idempotency
+
+
+class Command(BaseCommand):
+    """Delete expired responses and claims from the idempotency store."""
+
+    help = (  # noqa: WPS125
+        'Delete idempotency keys whose responses are no longer replayed. '
+        'Run it periodically, e.g. hourly from cron.'
+    )
+
+    def handle(self, *args, **options):  # noqa: D102
+        deleted = idempotency.get_store().purge()
+        self.stdout.write(f'Deleted {deleted} expired idempotency keys.')
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+"""Delete form submissions that are older than their retention."""
+
+from django.conf import settings  # type: ignore[import]
+from django.core.management.base import BaseCommand  # type: ignore[import]
+
+from forms import retention
+from forms.models import FormPage
+
+
+class Command(BaseCommand):
+    """Purge old submissions of all form pages, archiving them first."""
+
+    help = (  # noqa: WPS125
+        'Delete submissions older than the retention of their form page in '
+        'small chunks, optionally archiving them to compressed NDJSON files.'
+    )
+
+    def add_arguments(self, parser):  # noqa: D102
+        parser.add_argument(
+            '--page',
+            type=int,
+            action='append',
+            dest='page_ids',
+            help='Only purge this form page, can be repeated.',
+        )
+        parser.add_argument(
+            '--archive',
+            action='store_true',
+            help='Archive the submissions before deleting them.',
+        )
+        parser.add_argument(
+            '--archive-dir',
+            default=None,
+            help='Archive directory, FORMS_RETENTION_ARCHIVE_DIR by default.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help='Rows deleted per transaction.',
+        )
+
+    def handle(self, *args, **options):  # noqa: D102
+        archive_dir = None
+        if options['archive']:
+            archive_dir = (
+                options['archive_dir'] or settings.FORMS_RETENTION_ARCHIVE_DIR
+            )
+        pages = FormPage.objects.order_by('pk')
+        if options['page_ids']:
+            pages = pages.filter(pk__in=options['page_ids'])
+        deleted = 0
+        archived = 0
+        for page in pages:
+            result = retention.purge(
+                page,
+                archive_dir=archive_dir,
+                chunk_size=options['chunk_size'],
+            )
+            deleted += result.deleted
+            archived += result.archived
+        self.stdout.write(
+            f'Deleted {deleted} submissions, archived {archived}.',
+        )
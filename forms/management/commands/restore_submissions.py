@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+"""Restore archived form submissions."""
+
+from django.core.management.base import BaseCommand  # type: ignore[import]
+
+from forms import retention
+from forms.models import FormPage
+
+
+class Command(BaseCommand):
+    """Stream archived submissions back into the database."""
+
+    help = (  # noqa: WPS125
+        'Restore submissions from archive files written by purge_submissions '
+        'or directories containing them. Existing submissions are skipped.'
+    )
+
+    def add_arguments(self, parser):  # noqa: D102
+        parser.add_argument('paths', nargs='+')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Rows inserted per query.',
+        )
+
+    def handle(self, *args, **options):  # noqa: D102
+        submission_class = FormPage().get_submission_class()
+        restored = 0
+        skipped = 0
+        for path in options['paths']:
+            result = retention.restore(
+                path,
+                submission_class,
+                batch_size=options['batch_size'],
+            )
+            restored += result.restored
+            skipped += result.skipped
+        self.stdout.write(f'Restored {restored} submissions.')
+        if skipped:
+            self.stderr.write(
+                f'Skipped {skipped} submissions whose page or field names '
+                f'no longer exist.',
+            )
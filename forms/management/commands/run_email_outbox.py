@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+"""Send the notification emails recorded in the outbox."""
+
+from django.core.management.base import BaseCommand  # type: ignore[import]
+
+from forms import outbox
+
+
+class Command(BaseCommand):
+    """Run the email outbox worker."""
+
+    help = 'Send notification emails recorded in the outbox.'  # noqa: WPS125
+
+    def add_arguments(self, parser):  # noqa: D102
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Send the emails that are due and exit.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Number of emails to fetch per query.',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=None,
+            help='Seconds to wait between checks for due emails.',
+        )
+
+    def handle(self, *args, **options):  # noqa: D102
+        worker = outbox.OutboxWorker(batch_size=options['batch_size'])
+        if options['once']:
+            try:
+                sent = worker.drain()
+            finally:
+                worker.connection.close()
+            self.stdout.write(f'Sent {sent} emails.')
+        else:
+            worker.run(poll_interval=options['poll_interval'])
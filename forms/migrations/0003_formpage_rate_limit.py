@@ -0,0 +1,23 @@
+# Generated by Django 3.0.14 on 2026-10-18 09:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0002_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='formpage',
+            name='rate_limit_period',
+            field=models.PositiveIntegerField(blank=True, help_text='Period in seconds. Leave blank to use the default.', null=True),
+        ),
+        migrations.AddField(
+            model_name='formpage',
+            name='rate_limit_requests',
+            field=models.PositiveIntegerField(blank=True, help_text='Submissions allowed per client within the period. Leave blank to use the default, 0 disables the limit.', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.14 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0003_formpage_rate_limit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='formpage',
+            name='retention_days',
+            field=models.PositiveIntegerField(blank=True, help_text='Delete submissions older than this many days. Leave blank to use the default.', null=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.0.14 on 2026-10-18 10:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailforms', '0004_add_verbose_name_plural'),
+        ('forms', '0004_formpage_retention_days'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Submission',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('wagtailforms.formsubmission',),
+        ),
+        migrations.AddField(
+            model_name='formpage',
+            name='submission_encoding',
+            field=models.CharField(choices=[('json', 'JSON'), ('compact', 'Compact'), ('compressed', 'Compact and compressed')], default='json', help_text='How submissions are stored. Compact storage keeps the field names once per form version instead of in every submission.', max_length=16),
+        ),
+        migrations.CreateModel(
+            name='SubmissionFieldNames',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=40)),
+                ('names', models.TextField(help_text='JSON list of the field names.')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('page', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submission_field_names', to='forms.FormPage')),
+            ],
+            options={
+                'unique_together': {('page', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.0.14 on 2026-10-18 10:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailforms', '0004_add_verbose_name_plural'),
+        ('forms', '0005_submission_encoding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='formfield',
+            name='indexed',
+            field=models.BooleanField(default=False, help_text='Index the values of this field, e.g. email addresses, to look up submissions by them.'),
+        ),
+        migrations.CreateModel(
+            name='SubmissionFieldValue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field_name', models.CharField(max_length=255)),
+                ('value', models.CharField(max_length=255)),
+                ('page', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='forms.FormPage')),
+                ('submission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='wagtailforms.FormSubmission')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='submissionfieldvalue',
+            index=models.Index(fields=['page', 'field_name', 'value'], name='forms_submi_page_id_41e32d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submissionfieldvalue',
+            index=models.Index(fields=['field_name', 'value'], name='forms_submi_field_n_55de70_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submissionfieldvalue',
+            index=models.Index(fields=['page', 'value'], name='forms_submi_page_id_5a082e_idx'),
+        ),
+    ]
@@ -2,16 +2,35 @@
 
 """Define form models."""
 
+from django.conf import settings  # type: ignore[import]
 from django.db import models as djm  # type: ignore[import]
 from django import http as djhttp
+from django.db import transaction  # type: ignore[import]
+from django.db.models import signals as djsignals  # type: ignore[import]
+from django.utils import timezone  # type: ignore[import]
+from django.utils.translation import gettext_lazy as _  # type: ignore[import]
 from django.template import response as djtr
 from modelcluster import fields as mcf  # type: ignore[import]
 from wagtail.admin import edit_handlers as wtah  # type: ignore[import]
+from wagtail.admin import mail as wtmail  # type: ignore[import]
 from wagtail.core import fields as wtf  # type: ignore[import]
+from wagtail.core import signals as wtsignals  # type: ignore[import]
 from wagtail.contrib.forms import models as wtfm  # type: ignore[import]
 from grapple import models as gplm  # type: ignore[import]
 import logging
 
+from api import loaders
+from forms import aio
+from forms import encoding
+from forms import formcache
+from forms import idempotency
+from forms import lookups
+from forms import outbox
+from forms import ratelimit
+from forms import singlewriter
+from forms import writebehind
+from monitoring import metrics
+
 logger = logging.getLogger(__name__)
 
 
@@ -23,6 +42,17 @@ class FormField(wtfm.AbstractFormField):
         on_delete=djm.CASCADE,
         related_name='form_fields',
     )
+    indexed = djm.BooleanField(
+        default=False,
+        help_text=(
+            'Index the values of this field, e.g. email addresses, to look '
+            'up submissions by them.'
+        ),
+    )
+
+    panels = wtfm.AbstractFormField.panels + [
+        wtah.FieldPanel('indexed'),
+    ]
 
 
 class FormPage(wtfm.AbstractEmailForm):
@@ -30,6 +60,36 @@ class FormPage(wtfm.AbstractEmailForm):
 
     intro = wtf.RichTextField(blank=True)
     thank_you_text = wtf.RichTextField(blank=True)
+    rate_limit_requests = djm.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text=(
+            'Submissions allowed per client within the period. Leave blank '
+            'to use the default, 0 disables the limit.'
+        ),
+    )
+    rate_limit_period = djm.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text='Period in seconds. Leave blank to use the default.',
+    )
+    submission_encoding = djm.CharField(
+        max_length=16,
+        choices=encoding.ENCODING_CHOICES,
+        default=encoding.ENCODING_JSON,
+        help_text=(
+            'How submissions are stored. Compact storage keeps the field '
+            'names once per form version instead of in every submission.'
+        ),
+    )
+    retention_days = djm.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text=(
+            'Delete submissions older than this many days. Leave blank to '
+            'use the default.'
+        ),
+    )
 
     content_panels = wtfm.AbstractEmailForm.content_panels + [
         wtah.FieldPanel('intro', classname='full'),
@@ -45,6 +105,22 @@ class FormPage(wtfm.AbstractEmailForm):
             ],
             'Email',
         ),
+        wtah.MultiFieldPanel(
+            [
+                wtah.FieldRowPanel([
+                    wtah.FieldPanel('rate_limit_requests', classname='col6'),
+                    wtah.FieldPanel('rate_limit_period', classname='col6'),
+                ]),
+            ],
+            'Rate limit',
+        ),
+        wtah.MultiFieldPanel(
+            [
+                wtah.FieldPanel('submission_encoding'),
+                wtah.FieldPanel('retention_days'),
+            ],
+            'Submissions',
+        ),
     ]
 
     graphql_fields = [
@@ -53,6 +129,7 @@ class FormPage(wtfm.AbstractEmailForm):
             'form_fields',
             'forms.schema.FormFieldType',
             is_list=True,
+            source='graphql_form_fields',
         ),
         gplm.GraphQLString('thank_you_text'),
         gplm.GraphQLString('from_address'),
@@ -60,8 +137,9 @@ class FormPage(wtfm.AbstractEmailForm):
         gplm.GraphQLString('subject'),
         gplm.GraphQLPage(
             'used_on_page',
-            is_list=True
-        )
+            is_list=True,
+            source='graphql_used_on_page',
+        ),
     ]
 
     spam_protection_field = {
@@ -69,6 +147,9 @@ class FormPage(wtfm.AbstractEmailForm):
         'help_text': 'Blank field for spam protection',
     }
 
+    # Previews are built from unsaved revisions and must not use the cache.
+    use_form_cache = True
+
     def save(self, *args, **kwargs):
         """Override form page save method to enforce existence of hidden field."""
         if not self.form_fields.filter(
@@ -82,15 +163,102 @@ class FormPage(wtfm.AbstractEmailForm):
                 sort_order=self.form_fields.count(),  # Always last field
             )
         super().save(*args, **kwargs)
+        formcache.form_class_cache.invalidate(self.pk)
 
-    def get_data_fields(self):
-        """Override method to remove spam protection field from data fields."""
-        data_fields = super().get_data_fields()
-        return [
-            (clean_name, label)
-            for clean_name, label in data_fields
-            if label != self.spam_protection_field['label']
+    def compile_form(self):
+        """Build form class and data fields from the form field definitions."""
+        form_fields = list(self.get_form_fields())
+        data_fields = [('submit_time', _('Submission date'))]
+        # Remove spam protection field from data fields.
+        data_fields += [
+            (field.clean_name, field.label)
+            for field in form_fields
+            if field.label != self.spam_protection_field['label']
         ]
+        return formcache.CompiledForm(
+            form_class=self.form_builder(form_fields).get_form_class(),
+            data_fields=data_fields,
+            indexed_fields=frozenset(
+                field.clean_name for field in form_fields if field.indexed
+            ),
+        )
+
+    def get_compiled_form(self):
+        """Return compiled form, from the cache unless it is disabled."""
+        if not self.use_form_cache:
+            return self.compile_form()
+        return formcache.form_class_cache.get(self)
+
+    def get_form_class(self):
+        """Override method to use the cached form class."""
+        return self.get_compiled_form().form_class
+
+    def get_data_fields(self):
+        """Override method to use the cached data fields."""
+        return list(self.get_compiled_form().data_fields)
+
+    def get_submissions_list_view_class(self):
+        """Override method to stream exports of the submissions."""
+        from forms import views  # noqa: WPS433
+        return views.SubmissionsListView
+
+    def send_mail(self, form):
+        """Override method to send the rendered email in a separate step."""
+        self.send_rendered_mail(self.render_email(form))
+
+    def send_rendered_mail(self, content):
+        """Send already rendered notification email content."""
+        if outbox.is_enabled():
+            outbox.record(
+                self.subject,
+                content,
+                self.to_address,
+                self.from_address,
+            )
+            return
+        addresses = [address.strip() for address in self.to_address.split(',')]
+        with metrics.sending_email():
+            wtmail.send_mail(
+                self.subject,
+                content,
+                addresses,
+                self.from_address,
+            )
+
+    def graphql_form_fields(self, info, **kwargs):
+        """Resolve form fields batched with the other pages of the query."""
+        if 'form_fields' in getattr(self, '_cluster_related_objects', {}):
+            # Previews hold unsaved form fields in memory.
+            return self.form_fields.all()
+        return loaders.load_related_list(
+            info,
+            FormField.objects.all(),
+            'page_id',
+            self.pk,
+        )
+
+    def graphql_used_on_page(self, info, **kwargs):
+        """Resolve pages using the form batched with the other pages."""
+        return loaders.load_related_list(
+            info,
+            self.used_on_page.model.objects.all(),
+            self.used_on_page.field.attname,
+            self.pk,
+        )
+
+    def get_rate_limit(self):
+        """Return allowed submissions per client and period in seconds."""
+        requests = self.rate_limit_requests
+        if requests is None:
+            requests = settings.FORMS_RATE_LIMIT_REQUESTS
+        period = self.rate_limit_period or settings.FORMS_RATE_LIMIT_PERIOD
+        return requests, period
+
+    def get_retention_days(self):
+        """Return days submissions are kept, ``None`` to keep them forever."""
+        if self.retention_days is not None:
+            return self.retention_days
+        return settings.FORMS_RETENTION_DAYS
 
     def handle_GET(self, request, *args, **kwargs):
         """Handle GET request."""
@@ -102,40 +270,315 @@ class FormPage(wtfm.AbstractEmailForm):
     def handle_POST(self, request, *args, **kwargs):
         """Handle POST request."""  # noqa: DAR101, DAR201
         # logger.debug(f'{request.POST = }')
+        rejected = self.reject_spam(request)
+        if rejected is not None:
+            return rejected
+        # Empty spammer field is a (hopefully) a legit form submission.
+        # return super().serve(request, *args, *kwargs)
+        key = idempotency.get_key(request, self)
+        if key is None:
+            return self.handle_submission(request)
+        replayed = idempotency.get_store().claim(key)
+        if replayed is not None:
+            metrics.form_posts.inc(outcome='duplicate')
+            return replayed
+        response = None
+        try:
+            response = self.handle_submission(request)
+        finally:
+            idempotency.get_store().finish(key, response)
+        return response
+
+    def handle_submission(self, request):
+        """Validate and process a submission, return the response."""
+        form = self.get_form(
+            request.POST,
+            request.FILES,
+            page=self,
+            user=request.user,
+        )
+        if not form.is_valid():
+            metrics.form_posts.inc(outcome='invalid')
+            return self.get_invalid_response(form)
+        if writebehind.is_enabled():
+            try:
+                writebehind.enqueue(self, form)
+            except writebehind.QueueFull:
+                metrics.form_posts.inc(outcome='queue_full')
+                return self.get_queue_full_response()
+        else:
+            self.process_form_submission(form)
+        metrics.form_posts.inc(outcome='valid')
+        return self.get_valid_response(form)
+
+    def reject_spam(self, request):
+        """Return response for malformed or spam requests, else ``None``."""
         spammer_jammer = request.POST.get('spammer_jammer')
         if spammer_jammer is None:
             # If the spammer_jammer field is missing, then the request is
             # malformed.
+            metrics.form_posts.inc(outcome='malformed')
             return djhttp.HttpResponseBadRequest()
         elif spammer_jammer != '':
             # Non-empty spammer field should not be processed, but I still
             # give success response. This is to give no indication that their
             # request is ignored.
+            metrics.form_posts.inc(outcome='spam')
             return djhttp.HttpResponse(status=200)
-        else:
-            # Empty spammer field is a (hopefully) a legit form submission.
-            # return super().serve(request, *args, *kwargs)
-            form = self.get_form(
-                request.POST,
-                request.FILES,
+        return None
+
+    def get_valid_response(self, form):  # noqa: D102
+        return djhttp.JsonResponse(form.cleaned_data, status=200)
+
+    def get_invalid_response(self, form):  # noqa: D102
+        return djhttp.JsonResponse(
+            {'errors': form.errors.get_json_data(escape_html=True)},
+            status=400,
+        )
+
+    def get_queue_full_response(self):  # noqa: D102
+        logger.warning('Submission spool is full.')
+        response = djhttp.HttpResponse(status=503)
+        response['Retry-After'] = settings.FORMS_WRITE_BEHIND_RETRY_AFTER
+        return response
+
+    def process_form_submission(self, form):
+        """Override method to create the submission in a separate step."""
+        submission = self.create_submission(form)
+        if self.to_address:
+            self.send_mail(form)
+        return submission
+
+    def create_submission(self, form):
+        """Create and return the submission instance and its index rows."""
+        indexed_fields = self.get_compiled_form().indexed_fields
+        with singlewriter.serialised(), transaction.atomic():
+            submission = self.get_submission_class().objects.create(
+                form_data=self.encode_form_data(form.cleaned_data),
                 page=self,
-                user=request.user,
             )
-            if form.is_valid():
-                self.process_form_submission(form)
-                return djhttp.JsonResponse(
-                    form.cleaned_data,
-                    status=200,
+            if indexed_fields:
+                lookups.index_submissions(
+                    self,
+                    [(submission, form.cleaned_data)],
+                    indexed_fields,
                 )
+        return submission
+
+    def encode_form_data(self, data):
+        """Return ``form_data`` of the data in the encoding of the page."""
+        return encoding.encode(self.pk, data, self.submission_encoding)
+
+    def get_submission_class(self):
+        """Override method to decode all storage encodings."""
+        return Submission
+
+    async def aserve(self, request):
+        """
+        Serve a POST request on the event loop of the ASGI application.
+
+        The form is validated on the event loop. Database writes and email
+        run in the bounded thread pools of :mod:`forms.aio`.
+
+        """  # noqa: DAR101, DAR201
+        if ratelimit.get_backend().blocking:
+            throttled = await aio.database(ratelimit.check, request, self)
+        else:
+            throttled = ratelimit.check(request, self)
+        if throttled is not None:
+            metrics.form_posts.inc(outcome='throttled')
+            return throttled
+        return await self.ahandle_POST(request)
+
+    async def ahandle_POST(self, request):
+        """Handle POST request like handle_POST without blocking."""  # noqa: DAR101, DAR201
+        rejected = self.reject_spam(request)
+        if rejected is not None:
+            return rejected
+        key = idempotency.get_key(request, self)
+        if key is None:
+            return await self.ahandle_submission(request)
+        store = idempotency.get_store()
+        replayed = await aio.database(store.claim, key)
+        if replayed is not None:
+            metrics.form_posts.inc(outcome='duplicate')
+            return replayed
+        response = None
+        try:
+            response = await self.ahandle_submission(request)
+        finally:
+            await aio.database(store.finish, key, response)
+        return response
+
+    async def ahandle_submission(self, request):
+        """Validate and process a submission like handle_submission."""
+        form = await self.aget_form(
+            request.POST,
+            request.FILES,
+            page=self,
+            user=request.user,
+        )
+        if not form.is_valid():
+            metrics.form_posts.inc(outcome='invalid')
+            return self.get_invalid_response(form)
+        if writebehind.is_enabled():
+            try:
+                await aio.database(writebehind.enqueue, self, form)
+            except writebehind.QueueFull:
+                metrics.form_posts.inc(outcome='queue_full')
+                return self.get_queue_full_response()
+        else:
+            await self.aprocess_form_submission(form)
+        metrics.form_posts.inc(outcome='valid')
+        return self.get_valid_response(form)
+
+    async def aget_form(self, *args, **kwargs):
+        """Return form, compiling the form class in a thread on a miss."""
+        compiled = None
+        if self.use_form_cache:
+            compiled = formcache.form_class_cache.peek(self)
+        if compiled is None:
+            compiled = await aio.database(self.get_compiled_form)
+        form_params = self.get_form_parameters()
+        form_params.update(kwargs)
+        return compiled.form_class(*args, **form_params)
+
+    async def aprocess_form_submission(self, form):
+        """Create the submission and send the email without blocking."""
+        submission = await aio.database(self.create_submission, form)
+        if self.to_address:
+            content = self.render_email(form)
+            if outbox.is_enabled():
+                await aio.database(self.send_rendered_mail, content)
             else:
-                return djhttp.JsonResponse(
-                    {'errors': form.errors.get_json_data(escape_html=True)},
-                    status=400,
-                )
+                await aio.email(self.send_rendered_mail, content)
+        return submission
 
+    def serve_preview(self, request, mode_name):
+        """Override method to bypass the form class cache."""  # noqa: DAR101, DAR201
+        self.use_form_cache = False
+        return super().serve_preview(request, mode_name)
 
     def serve(self, request, *args, **kwargs):  # noqa: D102
         if request.method == 'POST':
+            throttled = ratelimit.check(request, self)
+            if throttled is not None:
+                metrics.form_posts.inc(outcome='throttled')
+                return throttled
             return self.handle_POST(request, *args, **kwargs)
         else:
             return self.handle_GET(request, *args, **kwargs)
+
+
+def invalidate_form_class(sender, instance, **kwargs):
+    """Drop cached form class when the page or one of its fields changes."""
+    page_id = instance.page_id if isinstance(instance, FormField) else instance.pk
+    formcache.form_class_cache.invalidate(page_id)
+
+
+wtsignals.page_published.connect(invalidate_form_class, sender=FormPage)
+wtsignals.page_unpublished.connect(invalidate_form_class, sender=FormPage)
+djsignals.post_save.connect(invalidate_form_class, sender=FormField)
+djsignals.post_delete.connect(invalidate_form_class, sender=FormField)
+
+
+class Submission(wtfm.FormSubmission):
+    """Form submission that decodes compactly stored form data."""
+
+    class Meta:  # noqa: D106, WPS306
+        proxy = True
+
+    def get_data(self):
+        """Override method to decode the form data in any encoding."""
+        form_data = encoding.decode(self.form_data)
+        form_data.update({'submit_time': self.submit_time})
+        return form_data
+
+
+class SubmissionFieldNames(djm.Model):
+    """Field names of a form version, shared by its compact submissions."""
+
+    page = djm.ForeignKey(
+        'FormPage',
+        on_delete=djm.CASCADE,
+        related_name='submission_field_names',
+    )
+    key = djm.CharField(max_length=40)
+    names = djm.TextField(help_text='JSON list of the field names.')
+    created_at = djm.DateTimeField(auto_now_add=True)
+
+    class Meta:  # noqa: D106, WPS306
+        unique_together = [('page', 'key')]
+
+    def __str__(self):  # noqa: D105
+        return f'{self.page_id}: {self.names}'
+
+
+class SubmissionFieldValue(djm.Model):
+    """Normalised value of an indexed field of a submission."""
+
+    page = djm.ForeignKey(
+        'FormPage',
+        on_delete=djm.CASCADE,
+        related_name='+',
+    )
+    submission = djm.ForeignKey(
+        wtfm.FormSubmission,
+        on_delete=djm.CASCADE,
+        related_name='+',
+    )
+    field_name = djm.CharField(max_length=255)
+    value = djm.CharField(max_length=lookups.MAX_VALUE_LENGTH)
+
+    class Meta:  # noqa: D106, WPS306
+        indexes = [
+            djm.Index(fields=['page', 'field_name', 'value']),
+            djm.Index(fields=['field_name', 'value']),
+            djm.Index(fields=['page', 'value']),
+        ]
+
+    def __str__(self):  # noqa: D105
+        return f'{self.field_name}={self.value} ({self.submission_id})'
+
+
+class OutboxEmail(djm.Model):
+    """Notification email waiting to be sent by the outbox worker."""
+
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    subject = djm.CharField(max_length=255, blank=True)
+    body = djm.TextField()
+    from_address = djm.CharField(max_length=255, blank=True)
+    to_address = djm.CharField(
+        max_length=255,
+        help_text='Separate multiple addresses by comma.',
+    )
+    status = djm.CharField(
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+    )
+    attempts = djm.PositiveIntegerField(default=0)
+    next_attempt_at = djm.DateTimeField(default=timezone.now)
+    last_error = djm.TextField(blank=True)
+    created_at = djm.DateTimeField(auto_now_add=True)
+    sent_at = djm.DateTimeField(null=True, blank=True)
+
+    class Meta:  # noqa: D106, WPS306
+        indexes = [
+            djm.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):  # noqa: D105
+        return f'{self.subject} to {self.to_address} ({self.status})'
+
+    def get_recipients(self):
+        """Return list of recipient addresses."""
+        return [address.strip() for address in self.to_address.split(',')]
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+"""
+Outbox for form notification emails.
+
+With the outbox enabled, the request only records the notification email.
+A worker (``manage.py run_email_outbox``) drains the outbox over a single
+SMTP connection that stays open between messages and batches. Failed
+messages are retried with exponential backoff until the maximum number of
+attempts is reached.
+
+Run a single worker per outbox; rows are not locked while they are sent.
+"""
+
+import datetime
+import logging
+import smtplib
+import time
+
+from django.conf import settings  # type: ignore[import]
+from django.core import mail as djmail  # type: ignore[import]
+from django.db import connection as djconnection  # type: ignore[import]
+from django.utils import timezone  # type: ignore[import]
+from wagtail.admin import mail as wtmail  # type: ignore[import]
+
+from monitoring import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def is_enabled():
+    """Return whether notification emails should go through the outbox."""
+    return settings.FORMS_EMAIL_OUTBOX
+
+
+def record(subject, body, to_address, from_address):
+    """Record an email to be sent by the outbox worker."""
+    from forms import models  # noqa: WPS433 (avoid circular import)
+
+    return models.OutboxEmail.objects.create(
+        subject=subject,
+        body=body,
+        to_address=to_address,
+        from_address=from_address,
+    )
+
+
+def get_backoff(attempts):
+    """Return delay before the next attempt after ``attempts`` failures."""
+    delay = settings.FORMS_EMAIL_OUTBOX_BACKOFF * 2 ** (attempts - 1)
+    return datetime.timedelta(
+        seconds=min(delay, settings.FORMS_EMAIL_OUTBOX_BACKOFF_MAX),
+    )
+
+
+class OutboxWorker(object):
+    """Send due outbox emails over one reused connection."""
+
+    def __init__(self, connection=None, batch_size=None):  # noqa: D107
+        self.connection = connection or djmail.get_connection()
+        self.batch_size = (
+            batch_size or settings.FORMS_EMAIL_OUTBOX_BATCH_SIZE
+        )
+
+    def get_due(self):
+        """Return the next batch of emails that are due."""
+        from forms import models  # noqa: WPS433 (avoid circular import)
+
+        return list(
+            models.OutboxEmail.objects.filter(
+                status=models.OutboxEmail.STATUS_PENDING,
+                next_attempt_at__lte=timezone.now(),
+            ).order_by('next_attempt_at', 'pk')[:self.batch_size],
+        )
+
+    def send(self, email):
+        """Send a single email and record the outcome on its row."""
+        email.attempts += 1
+        try:
+            try:
+                self.deliver(email)
+            except smtplib.SMTPServerDisconnected:
+                # The server may have dropped the idle connection between
+                # batches. Reconnect once before counting it as a failure.
+                self.connection.close()
+                self.deliver(email)
+        except Exception as error:
+            # Drop the connection, it is reopened for the next message.
+            self.connection.close()
+            email.last_error = repr(error)
+            if email.attempts >= settings.FORMS_EMAIL_OUTBOX_MAX_ATTEMPTS:
+                email.status = email.STATUS_FAILED
+                logger.error(f'Giving up on outbox email {email.pk}: {error!r}')
+            else:
+                email.next_attempt_at = (
+                    timezone.now() + get_backoff(email.attempts)
+                )
+                logger.warning(f'Outbox email {email.pk} failed: {error!r}')
+        else:
+            email.status = email.STATUS_SENT
+            email.sent_at = timezone.now()
+            email.last_error = ''
+        email.save(update_fields=[
+            'attempts',
+            'status',
+            'next_attempt_at',
+            'sent_at',
+            'last_error',
+        ])
+        return email.status == email.STATUS_SENT
+
+    def deliver(self, email):
+        """Send the email over the persistent connection."""
+        # Opening the connection up front keeps the backend from closing it
+        # again after the message is sent.
+        self.connection.open()
+        with metrics.sending_email():
+            wtmail.send_mail(
+                email.subject,
+                email.body,
+                email.get_recipients(),
+                email.from_address,
+                connection=self.connection,
+            )
+
+    def drain(self):
+        """Send emails until none are due and return the number sent."""
+        sent = 0
+        while True:  # noqa: WPS457
+            due = self.get_due()
+            if not due:
+                return sent
+            sent += sum(self.send(email) for email in due)
+
+    def run(self, poll_interval=None, stop=None):
+        """Drain the outbox until ``stop`` is set (or forever)."""
+        poll_interval = (
+            poll_interval or settings.FORMS_EMAIL_OUTBOX_POLL_INTERVAL
+        )
+        try:
+            while stop is None or not stop.is_set():
+                self.drain()
+                djconnection.close()
+                time.sleep(poll_interval)
+        finally:
+            self.connection.close()
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+
+"""
+Per-client rate limiting of form submissions.
+
+Every client IP gets a token bucket per form page. A bucket holds up to
+``requests`` tokens and refills at ``requests / period`` tokens per second,
+so a client can burst up to the limit and is then throttled to the average
+rate. Rejections are answered with 429 and ``Retry-After``.
+
+Limits are set per page, so a client is only known to be throttled once
+Wagtail routed its request to the page. The rejected client and path are
+then put in a penalty box of the process until the client has a token
+again. :class:`RateLimitMiddleware` under WSGI and :mod:`forms.asgi` answer
+further POSTs of the client to the path straight away, without touching the
+session store, the database or the page tree.
+
+Two backends are available. :class:`LocalMemoryBackend` keeps buckets in the
+current process, evicting the least recently used ones beyond ``max_keys``.
+:class:`SQLiteBackend` keeps them in a small SQLite file next to (not inside)
+the main database, so the limit holds across all gunicorn workers on the
+host, and deletes buckets once they are full again.
+
+Clients are told apart by IP. Behind a reverse proxy every request comes from
+the proxy, so ``FORMS_RATE_LIMIT_PROXY_HEADER`` must name the header the proxy
+sets, or all clients share one bucket.
+"""
+
+import collections
+import functools
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from django import http as djhttp  # type: ignore[import]
+from django.conf import settings  # type: ignore[import]
+from django.utils import module_loading  # type: ignore[import]
+
+from forms import honeypot
+from monitoring import metrics
+
+
+def get_full_at(tokens, capacity, rate, now):
+    """Return when a bucket is full again and can be forgotten."""
+    return now + (capacity - tokens) / rate
+
+
+def take_token(tokens, updated_at, capacity, rate, now):
+    """
+    Refill a bucket and try to take one token from it.
+
+    Returns:
+        Tuple of the new token count, whether a token was taken and the
+        seconds until the next token is available.
+
+    """  # noqa: DAR101
+    if tokens is None:
+        tokens = capacity
+    else:
+        tokens = min(capacity, tokens + (now - updated_at) * rate)
+    if tokens >= 1:
+        return tokens - 1, True, 0
+    return tokens, False, (1 - tokens) / rate
+
+
+class LocalMemoryBackend(object):
+    """Keep token buckets in the memory of the current process."""
+
+    max_keys = 10000
+    # Whether consume() does I/O and must not run on an event loop.
+    blocking = False
+
+    def __init__(self):  # noqa: D107
+        self._buckets = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, rate):
+        """Take a token for ``key`` and return ``(allowed, retry_after)``."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (None, now))
+            tokens, allowed, retry_after = take_token(
+                tokens, updated_at, capacity, rate, now,
+            )
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                # Forget the least recently used buckets, which are the most
+                # likely to be full again. This errs on the permissive side.
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+
+class SQLiteBackend(object):
+    """Keep token buckets in a SQLite file shared between processes."""
+
+    blocking = True
+    # Seconds between deletions of full buckets by an instance.
+    prune_interval = 60
+
+    def __init__(self, path=None):  # noqa: D107
+        self.path = path or settings.FORMS_RATE_LIMIT_SQLITE_PATH
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        self._pruned_at = 0
+
+    @property
+    def connection(self):
+        """Return the connection of the current thread."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path,
+                timeout=5,
+                isolation_level=None,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS token_bucket ('
+                'key TEXT PRIMARY KEY, tokens REAL, updated_at REAL, '
+                'full_at REAL)',
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS token_bucket_full_at '
+                'ON token_bucket (full_at)',
+            )
+            self._local.connection = connection
+        return connection
+
+    def consume(self, key, capacity, rate):
+        """Take a token for ``key`` and return ``(allowed, retry_after)``."""
+        connection = self.connection
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT tokens, updated_at FROM token_bucket WHERE key = ?',
+                (key,),
+            ).fetchone()
+            tokens, updated_at = row or (None, now)
+            tokens, allowed, retry_after = take_token(
+                tokens, updated_at, capacity, rate, now,
+            )
+            connection.execute(
+                'INSERT OR REPLACE INTO token_bucket '
+                '(key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?)',
+                (key, tokens, now, get_full_at(tokens, capacity, rate, now)),
+            )
+            if now - self._pruned_at >= self.prune_interval:
+                self._pruned_at = now
+                self.prune(now)
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return allowed, retry_after
+
+    def prune(self, now=None):
+        """Delete buckets that are full again, return their number."""
+        return self.connection.execute(
+            'DELETE FROM token_bucket WHERE full_at <= ?',
+            (time.time() if now is None else now,),
+        ).rowcount
+
+
+@functools.lru_cache(maxsize=None)
+def get_backend():
+    """Return instance of the configured backend."""
+    return module_loading.import_string(settings.FORMS_RATE_LIMIT_BACKEND)()
+
+
+class PenaltyBox(object):
+    """Clients throttled on a path and until when, in the current process."""
+
+    max_keys = 10000
+
+    def __init__(self):  # noqa: D107
+        self._until = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, key, retry_after):
+        """Put a client in the box for ``retry_after`` seconds."""
+        with self._lock:
+            self._until[key] = time.monotonic() + retry_after
+            self._until.move_to_end(key)
+            while len(self._until) > self.max_keys:
+                # The oldest entries expire first.
+                self._until.popitem(last=False)
+
+    def get_retry_after(self, key):
+        """Return seconds a client is still throttled, else ``None``."""
+        with self._lock:
+            until = self._until.get(key)
+            if until is None:
+                return None
+            retry_after = until - time.monotonic()
+            if retry_after <= 0:
+                del self._until[key]  # noqa: WPS420
+                return None
+            return retry_after
+
+    def reset(self):  # noqa: D102
+        with self._lock:
+            self._until.clear()
+
+
+penalty_box = PenaltyBox()
+
+
+def get_address(meta):
+    """Return IP of the client of a WSGI environ or request ``META``."""
+    header = settings.FORMS_RATE_LIMIT_PROXY_HEADER
+    if header and meta.get(header):
+        # The proxy appends the address it received the request from.
+        return meta[header].split(',')[-1].strip()
+    return meta.get('REMOTE_ADDR', '')
+
+
+def get_client_ip(request):
+    """Return IP of the client, honouring the trusted proxy header if set."""
+    return get_address(request.META)
+
+
+def get_penalty_key(meta):
+    """Return the penalty box key of the client and path of a request."""
+    return (meta.get('PATH_INFO', ''), get_address(meta))
+
+
+def get_throttled_response(retry_after):
+    """Return 429 response telling the client when to retry."""
+    response = djhttp.HttpResponse(status=429)
+    response['Retry-After'] = math.ceil(retry_after)
+    return response
+
+
+def check(request, page):
+    """Return 429 response if the client exceeded the limit of the page."""
+    requests, period = page.get_rate_limit()
+    if not requests:
+        return None
+    allowed, retry_after = get_backend().consume(
+        f'{page.pk}:{get_client_ip(request)}',
+        capacity=requests,
+        rate=requests / period,
+    )
+    if allowed:
+        return None
+    penalty_box.add(get_penalty_key(request.META), retry_after)
+    return get_throttled_response(retry_after)
+
+
+def check_early(meta):
+    """Return 429 response if the client is in the penalty box for the path."""
+    if meta.get('REQUEST_METHOD') != 'POST':
+        return None
+    retry_after = penalty_box.get_retry_after(get_penalty_key(meta))
+    if retry_after is None:
+        return None
+    metrics.form_posts.inc(outcome='throttled')
+    return get_throttled_response(retry_after)
+
+
+class RateLimitMiddleware(object):
+    """Wrap a WSGI application to reject throttled clients before routing."""
+
+    def __init__(self, application):  # noqa: D107
+        self.application = application
+
+    def __call__(self, environ, start_response):  # noqa: D102
+        throttled = check_early(environ)
+        if throttled is None:
+            return self.application(environ, start_response)
+        start_response('429 Too Many Requests', [
+            ('Retry-After', throttled['Retry-After']),
+            *honeypot.get_response_headers(),
+        ])
+        return [b'']
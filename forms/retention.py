@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+
+"""
+Retention of form submissions.
+
+Form pages keep their submissions for ``retention_days`` (or
+``FORMS_RETENTION_DAYS``) days. :func:`purge` deletes older submissions in
+primary key order, ``FORMS_RETENTION_CHUNK_SIZE`` rows per transaction, so
+locks are only ever held for a short moment: chunks are read and archived
+before the transaction that deletes them. Before a chunk is deleted it
+can be appended to gzip compressed NDJSON archives partitioned by page and
+submission date::
+
+    <archive dir>/<page id>/<year>/<month>/<yyyy-mm-dd>.ndjson.gz
+
+Every chunk is a gzip member of its own, which readers decompress as one
+stream. Archives are written before the delete commits, so rows already in
+their partition are not appended again when a failed purge is repeated.
+:func:`restore` streams archives back into the database, indexed like new
+submissions, and skips rows that still exist or repeat, so purging and
+restoring can both be repeated. Rows whose page or compact field names were
+deleted since are skipped and counted.
+"""
+
+import collections
+import datetime
+import gzip
+import json
+import logging
+import os
+import time
+
+from django.conf import settings  # type: ignore[import]
+from django.db import transaction  # type: ignore[import]
+from django.utils import dateparse  # type: ignore[import]
+from django.utils import timezone  # type: ignore[import]
+
+from forms import encoding
+from forms import lookups
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIX = '.ndjson.gz'
+
+PurgeResult = collections.namedtuple('PurgeResult', ['deleted', 'archived'])
+RestoreResult = collections.namedtuple(
+    'RestoreResult',
+    ['restored', 'skipped'],
+)
+
+
+def get_cutoff(page, now=None):
+    """Return time before which submissions of the page are purged."""
+    days = page.get_retention_days()
+    if days is None:
+        return None
+    return (now or timezone.now()) - datetime.timedelta(days=days)
+
+
+def get_archive_path(directory, page_id, date):
+    """Return path of the archive partition of a page and day."""
+    return os.path.join(
+        directory,
+        str(page_id),
+        f'{date:%Y}',
+        f'{date:%m}',
+        f'{date:%Y-%m-%d}{ARCHIVE_SUFFIX}',
+    )
+
+
+def encode_row(row):
+    """Return archive line of a submission row."""
+    return json.dumps({
+        'id': row['pk'],
+        'page_id': row['page_id'],
+        'submit_time': row['submit_time'].isoformat(),
+        'form_data': row['form_data'],
+    }).encode('utf-8') + b'\n'
+
+
+def read_archived_ids(path):
+    """Return the ids of the rows in an archive file, if it exists."""
+    if not os.path.exists(path):
+        return set()
+    return {row['id'] for row in iter_archive(path)}
+
+
+def archive(directory, rows, archived_ids=None):
+    """
+    Append rows to their archive partitions and sync them to disk.
+
+    Rows already in their partition are skipped. ``archived_ids`` maps the
+    partitions read so far to their ids, so that every partition is read
+    once per purge.
+
+    """  # noqa: DAR101, DAR201
+    if archived_ids is None:
+        archived_ids = {}
+    partitions = collections.defaultdict(list)
+    for row in rows:
+        date = timezone.localtime(row['submit_time']).date()
+        path = get_archive_path(directory, row['page_id'], date)
+        if path not in archived_ids:
+            archived_ids[path] = read_archived_ids(path)
+        if row['pk'] in archived_ids[path]:
+            continue
+        archived_ids[path].add(row['pk'])
+        partitions[path].append(encode_row(row))
+    for path, lines in partitions.items():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'ab') as raw_file:
+            with gzip.GzipFile(fileobj=raw_file, mode='wb') as gzip_file:
+                gzip_file.writelines(lines)
+            raw_file.flush()
+            os.fsync(raw_file.fileno())
+    return len(rows)
+
+
+def purge(page, archive_dir=None, chunk_size=None, now=None):
+    """
+    Delete the submissions of a page that are older than its retention.
+
+    With ``archive_dir``, every chunk is archived before it is deleted.
+
+    """  # noqa: DAR101, DAR201
+    cutoff = get_cutoff(page, now)
+    if cutoff is None:
+        return PurgeResult(deleted=0, archived=0)
+    chunk_size = chunk_size or settings.FORMS_RETENTION_CHUNK_SIZE
+    queryset = page.get_submission_class()._default_manager.filter(
+        page=page,
+        submit_time__lt=cutoff,
+    )
+    deleted = 0
+    archived = 0
+    archived_ids = {}
+    last_pk = 0
+    while True:  # noqa: WPS457
+        # Reading and archiving the chunk happen outside the transaction, so
+        # that the write lock is not held while files are read and synced.
+        rows = list(
+            queryset.filter(pk__gt=last_pk).order_by('pk').values(
+                'pk', 'page_id', 'submit_time', 'form_data',
+            )[:chunk_size],
+        )
+        if not rows:
+            break
+        if archive_dir is not None:
+            archived += archive(archive_dir, rows, archived_ids)
+        with transaction.atomic():
+            # Index rows are deleted in cascade, the submissions themselves
+            # need not be fetched again for that.
+            deleted += queryset.filter(
+                pk__in=[row['pk'] for row in rows],
+            ).only('pk').delete()[1].get(queryset.model._meta.label, 0)
+        last_pk = rows[-1]['pk']
+        time.sleep(settings.FORMS_RETENTION_CHUNK_PAUSE)
+    if deleted:
+        logger.info(f'Purged {deleted} submissions of page {page.pk}.')
+    return PurgeResult(deleted=deleted, archived=archived)
+
+
+def iter_archive(path):
+    """Yield the submission rows stored in an archive file."""
+    with gzip.open(path, 'rb') as archive_file:
+        for line in archive_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_archive_paths(path):
+    """Yield archive files at the path, searching directories recursively."""
+    if not os.path.isdir(path):
+        yield path
+        return
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith(ARCHIVE_SUFFIX):
+                yield os.path.join(dirpath, filename)
+
+
+def restore(path, submission_class, batch_size=None):
+    """
+    Stream archived rows back into the database.
+
+    Rows of pages that no longer exist, or in a compact encoding whose field
+    names no longer exist, cannot be restored and are skipped.
+
+    """  # noqa: DAR101, DAR201
+    batch_size = batch_size or settings.FORMS_RETENTION_CHUNK_SIZE
+    restored = 0
+    skipped = 0
+    batch = []
+    for archive_path in iter_archive_paths(path):
+        for row in iter_archive(archive_path):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                batch_result = restore_batch(batch, submission_class)
+                restored += batch_result.restored
+                skipped += batch_result.skipped
+                batch = []
+    if batch:
+        batch_result = restore_batch(batch, submission_class)
+        restored += batch_result.restored
+        skipped += batch_result.skipped
+    return RestoreResult(restored=restored, skipped=skipped)
+
+
+def get_restorable(rows):
+    """Return the rows whose page and field names still exist."""
+    from forms import models  # noqa: WPS433 (avoid circular import)
+
+    page_ids = set(models.FormPage.objects.filter(
+        pk__in={row['page_id'] for row in rows},
+    ).values_list('pk', flat=True))
+    names_ids = {
+        row['id']: encoding.get_names_id(row['form_data']) for row in rows
+    }
+    existing_names_ids = set(models.SubmissionFieldNames.objects.filter(
+        pk__in=set(names_ids.values()) - {None},
+    ).values_list('pk', flat=True))
+    return [
+        row for row in rows
+        if row['page_id'] in page_ids and (
+            names_ids[row['id']] is None or
+            names_ids[row['id']] in existing_names_ids
+        )
+    ]
+
+
+def index_restored(submissions):
+    """Index restored submissions like new ones of their pages."""
+    from forms import models  # noqa: WPS433 (avoid circular import)
+
+    submissions_by_page = collections.defaultdict(list)
+    for submission in submissions:
+        submissions_by_page[submission.page_id].append(submission)
+    for page in models.FormPage.objects.filter(pk__in=submissions_by_page):
+        lookups.index_submissions(page, [
+            (submission, submission.get_data())
+            for submission in submissions_by_page[page.pk]
+        ])
+
+
+def restore_batch(rows, submission_class):
+    """Insert and index archived rows that do not exist anymore."""
+    manager = submission_class._default_manager
+    # Rows are archived again if an earlier purge failed to delete them.
+    rows = list({row['id']: row for row in rows}.values())
+    existing = set(
+        manager.filter(
+            pk__in=[row['id'] for row in rows],
+        ).values_list('pk', flat=True),
+    )
+    rows = [row for row in rows if row['id'] not in existing]
+    restorable = get_restorable(rows)
+    skipped = len(rows) - len(restorable)
+    if skipped:
+        logger.warning(
+            f'Skipped {skipped} archived submissions whose page or field '
+            f'names no longer exist.',
+        )
+    submit_times = {
+        row['id']: dateparse.parse_datetime(row['submit_time'])
+        for row in restorable
+    }
+    submissions = [
+        submission_class(
+            pk=row['id'],
+            page_id=row['page_id'],
+            form_data=row['form_data'],
+        )
+        for row in restorable
+    ]
+    with transaction.atomic():
+        manager.bulk_create(submissions)
+        # submit_time is auto_now_add, so the insert set it to now.
+        for submission in submissions:
+            submission.submit_time = submit_times[submission.pk]
+        manager.bulk_update(submissions, ['submit_time'])
+        index_restored(submissions)
+    return RestoreResult(restored=len(submissions), skipped=skipped)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""
+Funnel the submission writes of all processes through one writer at a time.
+
+SQLite has a single writer. Other writers wait in its busy handler, which
+sleeps and retries, so under a burst of submissions they get the lock in no
+particular order and the unlucky ones wait up to the busy timeout. With
+``FORMS_SINGLE_WRITER`` enabled, transactions that write submissions first
+take an exclusive lock on ``FORMS_SINGLE_WRITER_LOCK_FILE``: writers queue up
+in the kernel instead and run one after the other, in all threads and
+processes.
+"""
+
+import contextlib
+import fcntl
+import os
+import threading
+
+from django.conf import settings  # type: ignore[import]
+
+
+class SingleWriter(object):
+    """Lock shared by the threads of this process and other processes."""
+
+    def __init__(self):  # noqa: D107
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_key = None
+
+    def get_file(self):
+        """Return the lock file of this process, opened again after forks."""
+        # Forked processes share open files and their flock with the parent.
+        file_key = (os.getpid(), settings.FORMS_SINGLE_WRITER_LOCK_FILE)
+        if self._file_key != file_key:
+            if self._file is not None:
+                self._file.close()
+            path = settings.FORMS_SINGLE_WRITER_LOCK_FILE
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._file = open(path, 'a')  # noqa: WPS515
+            self._file_key = file_key
+        return self._file
+
+    @contextlib.contextmanager
+    def hold(self):
+        """Hold the lock for a block, waiting for it as long as it takes."""
+        with self._lock:
+            fileno = self.get_file().fileno()
+            fcntl.flock(fileno, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fileno, fcntl.LOCK_UN)
+
+
+writer = SingleWriter()
+
+
+def serialised():
+    """Return a context manager that serialises a write, if enabled."""
+    if not settings.FORMS_SINGLE_WRITER:
+        return contextlib.nullcontext()
+    return writer.hold()
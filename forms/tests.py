@@ -2,51 +2,53 @@
 
 """Test for the forms app."""
 
+import asyncio
+import datetime
+import fcntl
 from http import HTTPStatus
 import json
+import logging
+import os
+import subprocess  # noqa: S404
+import sys
+import time
+from urllib import parse as urlparse
 
-from django import test as djt  # type: ignore[import]
+from django import http as djhttp  # type: ignore[import]
 from django.contrib.auth import models as djam  # type: ignore[import]
+from django.core import management as djmgmt  # type: ignore[import]
+from django.core import wsgi as djwsgi  # type: ignore[import]
+from django.core.mail.backends import locmem  # type: ignore[import]
+from django.db import connection as djconnection  # type: ignore[import]
+from django.db import models as djm  # type: ignore[import]
+from django.db import utils as djdbutils  # type: ignore[import]
+from django.utils import timezone  # type: ignore[import]
 import pytest  # type: ignore[import]
+from wagtail.core import hooks as wthooks  # type: ignore[import]
 
-from home.models import HomePage
-from forms.models import FormPage
+from contact_form_prototype import routers
+from forms import asgi
+from forms import definitions
+from forms import encoding
+from forms import exports
+from forms import formcache
+from forms import honeypot
+from forms import idempotency
+from forms import lookups
+from forms import outbox
+from forms import ratelimit
+from forms import retention
+from forms import singlewriter
+from forms import writebehind
+from forms.models import FormField, FormPage, OutboxEmail
+from forms.models import SubmissionFieldNames
+from monitoring import registry
+from monitoring import timing
 
 
 class TestFormPage(object):  # noqa: WPS214
     """Test form page."""
 
-    @pytest.fixture
-    def contact_form_page(self, db):  # noqa: D102
-        # The first home page instance is created during migration. This
-        # feature comes predefined with the Wagtail starter.
-        home_page = HomePage.objects.first()
-        # Additional pages can now be added as child pages to this one.
-        contact_form_page = FormPage(
-            title='Contact',
-            from_address='contact-form@example.com',
-            to_address='staff@example.com',
-            subject='New form submission',
-        )
-        home_page.add_child(instance=contact_form_page)
-        contact_form_page.save()
-        assert FormPage.objects.count() == 1
-        return contact_form_page
-
-    @pytest.fixture
-    def contact_form_page_w_email_field(self, contact_form_page):  # noqa: D102
-        contact_form_page.form_fields.create(
-            label='Email',
-            field_type='email',
-            required=True,
-        )
-        contact_form_page.save()
-        return contact_form_page
-
-    @pytest.fixture
-    def request_factory(self):  # noqa: D102
-        return djt.RequestFactory()
-
     def test_spam_check_form_field_exists_on_plain_form(  # noqa: WPS118
         self,
         contact_form_page,
@@ -287,3 +289,1658 @@ class TestFormPage(object):  # noqa: WPS214
 
         assert res.status_code == HTTPStatus.OK
         assert len(mailoutbox) == 0  # noqa: WPS507
+
+
+class TestWriteBehind(object):
+    """Test spooling of submissions for write-behind mode."""
+
+    @pytest.fixture(autouse=True)
+    def write_behind_settings(self, settings, tmp_path):  # noqa: D102
+        settings.FORMS_WRITE_BEHIND = True
+        settings.FORMS_WRITE_BEHIND_AUTOFLUSH = False
+        settings.FORMS_WRITE_BEHIND_SPOOL_DIR = str(tmp_path / 'spool')
+        settings.FORMS_WRITE_BEHIND_MAX_DEPTH = 2
+        return settings
+
+    def test_POST_valid_payload_is_spooled_not_saved(
+        self,
+        contact_form_page_w_email_field,
+        submit,
+        mailoutbox,
+    ):  # noqa: D102
+        submission_class = contact_form_page_w_email_field.get_submission_class()
+
+        res = submit(contact_form_page_w_email_field)
+
+        assert res.status_code == HTTPStatus.OK
+        assert writebehind.get_spool().depth() == 1
+        assert submission_class.objects.count() == 0
+        assert len(mailoutbox) == 0  # noqa: WPS507
+
+    def test_flush_bulk_creates_submissions_and_sends_email(
+        self,
+        contact_form_page_w_email_field,
+        submit,
+        mailoutbox,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        submit(page, email='first@example.com')
+        submit(page, email='second@example.com')
+
+        written = writebehind.flush(batch_size=1)
+
+        assert written == 2
+        assert writebehind.get_spool().depth() == 0
+        emails = [
+            submission.get_data()['email']
+            for submission in page.get_submission_class().objects.order_by('pk')
+        ]
+        assert emails == ['first@example.com', 'second@example.com']
+        assert len(mailoutbox) == 2
+        assert 'first@example.com' in mailoutbox[0].body
+
+    def test_POST_full_spool_service_unavailable(
+        self,
+        contact_form_page_w_email_field,
+        submit,
+        settings,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        submit(page)
+        submit(page)
+
+        res = submit(page)
+
+        assert res.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+        assert res['Retry-After'] == str(settings.FORMS_WRITE_BEHIND_RETRY_AFTER)
+        assert writebehind.get_spool().depth() == 2
+
+    def test_failed_batch_is_released(
+        self,
+        contact_form_page_w_email_field,
+        submit,
+        monkeypatch,
+    ):  # noqa: D102
+        submit(contact_form_page_w_email_field)
+
+        def fail(entries):  # noqa: WPS430
+            raise RuntimeError('Database unavailable')
+
+        monkeypatch.setattr(writebehind, 'write_batch', fail)
+
+        with pytest.raises(RuntimeError):
+            writebehind.flush()
+        spool = writebehind.get_spool()
+        assert len(spool.claim(10)) == 1
+
+    def test_failed_email_does_not_write_twice(
+        self,
+        contact_form_page_w_email_field,
+        submit,
+        settings,
+    ):  # noqa: D102
+        settings.EMAIL_BACKEND = 'forms.tests.FailingBackend'
+        page = contact_form_page_w_email_field
+        submit(page)
+
+        assert writebehind.flush() == 1
+        assert writebehind.flush() == 0
+        assert writebehind.get_spool().depth() == 0
+        assert page.get_submission_class().objects.count() == 1
+
+    def test_recover_counts_from_claim(
+        self,
+        contact_form_page_w_email_field,
+        submit,
+    ):  # noqa: D102
+        submit(contact_form_page_w_email_field)
+        spool = writebehind.get_spool()
+        name = os.listdir(spool.new_dir)[0]
+        enqueued = time.time() - 1000
+        os.utime(os.path.join(spool.new_dir, name), (enqueued, enqueued))
+
+        spool.claim(10)
+
+        assert spool.recover(older_than=300) == 0
+        spool.release([name])
+        spool.release([name])
+        assert len(spool.claim(10)) == 1
+
+    def test_rows_keep_submission_time(
+        self,
+        contact_form_page_w_email_field,
+        submit,
+        monkeypatch,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        email_field = page.form_fields.get(label='Email')
+        email_field.indexed = True
+        email_field.save()
+        submitted = timezone.now() - datetime.timedelta(hours=1)
+        with monkeypatch.context() as patched:
+            patched.setattr(writebehind.timezone, 'now', lambda: submitted)
+            submit(page, email='first@example.com')
+        submit(page, email='second@example.com')
+
+        writebehind.flush()
+
+        first = lookups.find('email', 'first@example.com').get()
+        second = lookups.find('email', 'second@example.com').get()
+        assert first.get_data()['email'] == 'first@example.com'
+        assert second.get_data()['email'] == 'second@example.com'
+        assert first.submit_time == submitted
+        assert second.submit_time > submitted
+
+    def test_depth_is_listed_once_per_interval(
+        self,
+        contact_form_page_w_email_field,
+        submit,
+        settings,
+        monkeypatch,
+    ):  # noqa: D102
+        settings.FORMS_WRITE_BEHIND_DEPTH_CHECK_INTERVAL = 60
+        page = contact_form_page_w_email_field
+        submit(page)
+        monkeypatch.setattr(writebehind.SubmissionSpool, 'depth', None)
+
+        assert submit(page).status_code == HTTPStatus.OK
+        assert submit(page).status_code == HTTPStatus.SERVICE_UNAVAILABLE
+
+    def test_flush_command(
+        self,
+        contact_form_page_w_email_field,
+        submit,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        submit(page)
+
+        djmgmt.call_command('flush_submissions')
+
+        assert page.get_submission_class().objects.count() == 1
+
+
+class FailingBackend(locmem.EmailBackend):
+    """Email backend that refuses every message."""
+
+    def send_messages(self, messages):  # noqa: D102
+        raise ConnectionRefusedError('SMTP server unavailable')
+
+
+class TestEmailOutbox(object):
+    """Test recording and sending of notification emails via the outbox."""
+
+    @pytest.fixture(autouse=True)
+    def outbox_settings(self, settings):  # noqa: D102
+        settings.FORMS_EMAIL_OUTBOX = True
+        settings.FORMS_EMAIL_OUTBOX_MAX_ATTEMPTS = 2
+        return settings
+
+    def test_POST_records_email_without_sending(
+        self,
+        contact_form_page_w_email_field,
+        submit,
+        mailoutbox,
+    ):  # noqa: D102
+        res = submit(contact_form_page_w_email_field)
+
+        assert res.status_code == HTTPStatus.OK
+        assert len(mailoutbox) == 0  # noqa: WPS507
+        email = OutboxEmail.objects.get()
+        assert email.status == OutboxEmail.STATUS_PENDING
+        assert email.to_address == 'staff@example.com'
+        assert 'someone@example.com' in email.body
+
+    def test_worker_sends_over_one_connection(
+        self,
+        contact_form_page_w_email_field,
+        submit,
+        smtp_stand_in,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        for index in range(3):
+            submit(page, email=f'{index}@example.com')
+
+        worker = outbox.OutboxWorker(batch_size=2)
+        sent = worker.drain()
+        worker.connection.close()
+
+        assert sent == 3
+        assert smtp_stand_in.connections == 1
+        assert len(smtp_stand_in.messages) == 3
+        assert 'Subject: New form submission' in smtp_stand_in.messages[0]
+        assert set(
+            OutboxEmail.objects.values_list('status', flat=True),
+        ) == {OutboxEmail.STATUS_SENT}
+
+    def test_failed_send_backs_off_then_gives_up(
+        self,
+        contact_form_page_w_email_field,
+        submit,
+    ):  # noqa: D102
+        submit(contact_form_page_w_email_field)
+        worker = outbox.OutboxWorker(connection=FailingBackend())
+
+        assert worker.drain() == 0
+        email = OutboxEmail.objects.get()
+        assert email.status == OutboxEmail.STATUS_PENDING
+        assert email.attempts == 1
+        assert email.next_attempt_at > timezone.now()
+        assert 'SMTP server unavailable' in email.last_error
+
+        email.next_attempt_at = timezone.now()
+        email.save()
+        worker.drain()
+
+        email.refresh_from_db()
+        assert email.status == OutboxEmail.STATUS_FAILED
+        assert email.attempts == 2
+
+    def test_backoff_is_exponential_and_capped(self, settings):  # noqa: D102
+        settings.FORMS_EMAIL_OUTBOX_BACKOFF = 10
+        settings.FORMS_EMAIL_OUTBOX_BACKOFF_MAX = 60
+
+        delays = [
+            outbox.get_backoff(attempts).total_seconds()
+            for attempts in range(1, 6)
+        ]
+
+        assert delays == [10, 20, 40, 60, 60]
+
+    def test_run_email_outbox_command(
+        self,
+        contact_form_page_w_email_field,
+        submit,
+        mailoutbox,
+    ):  # noqa: D102
+        submit(contact_form_page_w_email_field)
+
+        djmgmt.call_command('run_email_outbox', once=True)
+
+        assert len(mailoutbox) == 1
+        assert OutboxEmail.objects.get().status == OutboxEmail.STATUS_SENT
+
+
+class TestFormClassCache(object):
+    """Test caching of compiled form classes."""
+
+    @pytest.fixture(autouse=True)
+    def empty_cache(self):  # noqa: D102
+        formcache.form_class_cache.clear()
+        yield formcache.form_class_cache
+        formcache.form_class_cache.clear()
+
+    def test_repeated_get_form_does_not_query(
+        self,
+        contact_form_page_w_email_field,
+        django_assert_num_queries,
+        empty_cache,
+    ):  # noqa: D102
+        page = FormPage.objects.get(pk=contact_form_page_w_email_field.pk)
+        page.get_form()
+
+        with django_assert_num_queries(0):
+            form = page.get_form({'email': 'someone@example.com'})
+            data_fields = page.get_data_fields()
+
+        assert form.is_valid()
+        assert [name for name, _ in data_fields] == ['submit_time', 'email']
+        assert empty_cache.stats() == {'hits': 2, 'misses': 1, 'size': 1}
+
+    def test_save_invalidates(
+        self,
+        contact_form_page_w_email_field,
+        empty_cache,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        page.get_form()
+        page.form_fields.create(label='Name', field_type='singleline')
+
+        page.save()
+
+        assert empty_cache.stats()['size'] == 0
+        assert 'name' in page.get_form().fields
+
+    def test_publish_changes_key_in_other_processes(
+        self,
+        contact_form_page_w_email_field,
+    ):  # noqa: D102
+        other_process = formcache.FormClassCache()
+        page = contact_form_page_w_email_field
+        page.form_fields.add(FormField(label='Name', field_type='singleline'))
+        revision = page.save_revision()
+        compiled = other_process.get(FormPage.objects.get(pk=page.pk))
+        assert 'name' not in compiled.form_class().fields
+
+        revision.publish()
+        compiled = other_process.get(FormPage.objects.get(pk=page.pk))
+
+        assert 'name' in compiled.form_class().fields
+
+    def test_publish_invalidates(
+        self,
+        contact_form_page_w_email_field,
+        empty_cache,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        revision = page.save_revision()
+        page.get_form()
+
+        revision.publish()
+
+        assert empty_cache.stats()['size'] == 0
+
+
+class TestHoneypotMiddleware(object):
+    """Test short-circuiting of honeypot spam in front of Django."""
+
+    @pytest.fixture(autouse=True)
+    def reset_stats(self):  # noqa: D102
+        honeypot.stats.reset()
+
+    @pytest.fixture
+    def inner_app(self):  # noqa: D102
+        def app(environ, start_response):  # noqa: WPS430
+            app.calls.append(environ['wsgi.input'].read())
+            start_response('204 No Content', [])
+            return [b'']
+        app.calls = []
+        return app
+
+    def call(self, application, req):  # noqa: D102
+        statuses = []
+
+        def start_response(status, headers):  # noqa: WPS430
+            statuses.append(status)
+
+        body = b''.join(application(req.environ, start_response))
+        return statuses[0], body
+
+    def test_spam_POST_answered_without_queries(
+        self,
+        contact_form_page_w_email_field,
+        request_factory,
+        django_assert_num_queries,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        application = honeypot.HoneypotMiddleware(
+            djwsgi.get_wsgi_application(),
+        )
+        req = request_factory.post(
+            page.url,
+            {
+                'email': 'someone@example.com',
+                'spammer_jammer': 'This is spam',
+            },
+        )
+
+        with django_assert_num_queries(0):
+            status, body = self.call(application, req)
+
+        assert status == '200 OK'
+        assert body == b''
+        assert page.get_submission_class().objects.count() == 0
+        assert honeypot.stats.as_dict() == {
+            'inspected': 1,
+            'short_circuited': 1,
+        }
+
+    def test_urlencoded_spam_POST_short_circuited(
+        self,
+        request_factory,
+        inner_app,
+    ):  # noqa: D102
+        req = request_factory.post(
+            '/contact/',
+            'email=someone%40example.com&spammer_jammer=spam',
+            content_type='application/x-www-form-urlencoded',
+        )
+
+        status, _ = self.call(honeypot.HoneypotMiddleware(inner_app), req)
+
+        assert status == '200 OK'
+        assert not inner_app.calls
+
+    def test_empty_honeypot_passed_on_with_body(
+        self,
+        request_factory,
+        inner_app,
+    ):  # noqa: D102
+        req = request_factory.post(
+            '/contact/',
+            'email=someone%40example.com&spammer_jammer=',
+            content_type='application/x-www-form-urlencoded',
+        )
+
+        status, _ = self.call(honeypot.HoneypotMiddleware(inner_app), req)
+
+        assert status == '204 No Content'
+        assert inner_app.calls == [
+            b'email=someone%40example.com&spammer_jammer=',
+        ]
+        assert honeypot.stats.as_dict() == {'inspected': 1, 'passed': 1}
+
+    def test_excluded_path_not_inspected(
+        self,
+        request_factory,
+        inner_app,
+    ):  # noqa: D102
+        req = request_factory.post('/admin/pages/', {'spammer_jammer': 'x'})
+
+        status, _ = self.call(honeypot.HoneypotMiddleware(inner_app), req)
+
+        assert status == '204 No Content'
+        assert honeypot.stats.as_dict() == {}
+
+
+class TestRateLimit(object):
+    """Test throttling of submissions per client and form page."""
+
+    @pytest.fixture(autouse=True)
+    def rate_limit_settings(self, settings, tmp_path):  # noqa: D102
+        settings.FORMS_RATE_LIMIT_REQUESTS = 2
+        settings.FORMS_RATE_LIMIT_PERIOD = 60
+        settings.FORMS_RATE_LIMIT_SQLITE_PATH = str(tmp_path / 'rl.sqlite3')
+        return settings
+
+    def test_POST_over_limit_too_many_requests(
+        self,
+        contact_form_page_w_email_field,
+        submit,
+        django_assert_num_queries,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        submit(page)
+        submit(page)
+
+        with django_assert_num_queries(0):
+            res = submit(page)
+
+        assert res.status_code == HTTPStatus.TOO_MANY_REQUESTS
+        assert res['Retry-After'] == '30'
+        assert page.get_submission_class().objects.count() == 2
+
+    def test_page_overrides_default_limit(
+        self,
+        contact_form_page_w_email_field,
+        submit,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        page.rate_limit_requests = 0
+        for _ in range(3):  # noqa: WPS122
+            res = submit(page)
+
+        assert res.status_code == HTTPStatus.OK
+
+    def test_limit_is_per_client(
+        self,
+        contact_form_page_w_email_field,
+        request_factory,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        page.rate_limit_requests = 1
+        first = request_factory.post(page.url, REMOTE_ADDR='10.0.0.1')
+        second = request_factory.post(page.url, REMOTE_ADDR='10.0.0.2')
+
+        assert ratelimit.check(first, page) is None
+        assert ratelimit.check(second, page) is None
+        assert ratelimit.check(first, page).status_code == 429
+
+    def test_throttled_client_rejected_before_routing(
+        self,
+        contact_form_page_w_email_field,
+        submit,
+        request_factory,
+        django_assert_num_queries,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        for _ in range(3):  # noqa: WPS122
+            submit(page)
+        application = ratelimit.RateLimitMiddleware(
+            djwsgi.get_wsgi_application(),
+        )
+        req = request_factory.post(
+            page.url,
+            {'email': 'someone@example.com', 'spammer_jammer': ''},
+        )
+        responses = []
+
+        def start_response(status, headers):  # noqa: WPS430
+            responses.append((status, dict(headers)))
+
+        with django_assert_num_queries(0):
+            body = b''.join(application(req.environ, start_response))
+
+        status, headers = responses[0]
+        assert status == '429 Too Many Requests'
+        assert headers['Retry-After'] == '30'
+        assert body == b''
+        assert page.get_submission_class().objects.count() == 2
+
+    def test_penalty_expires(self, monkeypatch):  # noqa: D102
+        clock = [1000.0]  # noqa: WPS358
+        monkeypatch.setattr(ratelimit.time, 'monotonic', lambda: clock[0])
+        box = ratelimit.PenaltyBox()
+        box.add(('/contact/', '10.0.0.1'), 30)
+
+        assert box.get_retry_after(('/contact/', '10.0.0.1')) == 30
+        assert box.get_retry_after(('/contact/', '10.0.0.2')) is None
+        clock[0] += 30
+
+        assert box.get_retry_after(('/contact/', '10.0.0.1')) is None
+
+    @pytest.mark.parametrize('backend', [
+        ratelimit.LocalMemoryBackend,
+        ratelimit.SQLiteBackend,
+    ])
+    def test_backend_refills(self, backend, monkeypatch):  # noqa: D102
+        clock = [1000.0]  # noqa: WPS358
+        monkeypatch.setattr(ratelimit.time, 'time', lambda: clock[0])
+        monkeypatch.setattr(ratelimit.time, 'monotonic', lambda: clock[0])
+        limiter = backend()
+
+        assert limiter.consume('key', capacity=1, rate=0.5) == (True, 0)
+        assert limiter.consume('key', capacity=1, rate=0.5) == (False, 2)
+        clock[0] += 2
+
+        assert limiter.consume('key', capacity=1, rate=0.5) == (True, 0)
+
+    def test_local_memory_backend_evicts_least_recently_used(self):  # noqa: D102, E501
+        limiter = ratelimit.LocalMemoryBackend()
+        limiter.max_keys = 2
+        limiter.consume('first', capacity=1, rate=0.01)
+        limiter.consume('second', capacity=1, rate=0.01)
+
+        assert not limiter.consume('first', capacity=1, rate=0.01)[0]
+        limiter.consume('third', capacity=1, rate=0.01)
+
+        assert not limiter.consume('first', capacity=1, rate=0.01)[0]
+        assert limiter.consume('second', capacity=1, rate=0.01)[0]
+
+    def test_sqlite_backend_prunes_full_buckets(self, monkeypatch):  # noqa: D102, E501
+        clock = [1000.0]  # noqa: WPS358
+        monkeypatch.setattr(ratelimit.time, 'time', lambda: clock[0])
+        limiter = ratelimit.SQLiteBackend()
+        limiter.consume('slow', capacity=1, rate=0.01)
+        limiter.consume('fast', capacity=1, rate=1)
+        clock[0] += limiter.prune_interval
+        limiter.consume('new', capacity=1, rate=1)
+
+        keys = limiter.connection.execute(
+            'SELECT key FROM token_bucket ORDER BY key',
+        ).fetchall()
+
+        assert keys == [('new',), ('slow',)]
+
+    def test_sqlite_backend_shared_between_instances(self):  # noqa: D102
+        first = ratelimit.SQLiteBackend()
+        second = ratelimit.SQLiteBackend()
+
+        assert first.consume('key', capacity=1, rate=0.01)[0]
+        assert not second.consume('key', capacity=1, rate=0.01)[0]
+
+
+class TestASGI(object):
+    """Test the async form submission path of the ASGI application."""
+
+    @pytest.fixture(autouse=True)
+    def reset_stats(self):  # noqa: D102
+        honeypot.stats.reset()
+
+    @pytest.fixture
+    def inner_app(self):  # noqa: D102
+        async def app(scope, receive, send):  # noqa: WPS430
+            message = await receive()
+            app.calls.append(message['body'])
+            await send({'type': 'http.response.start', 'status': 204})
+            await send({'type': 'http.response.body', 'body': b''})
+        app.calls = []
+        return app
+
+    def call(self, application, path, form_data):  # noqa: D102
+        body = urlparse.urlencode(form_data).encode()
+        scope = {
+            'type': 'http',
+            'method': 'POST',
+            'path': path,
+            'root_path': '',
+            'query_string': b'',
+            'headers': [
+                (b'host', b'localhost'),
+                (b'content-type', b'application/x-www-form-urlencoded'),
+                (b'content-length', str(len(body)).encode()),
+            ],
+            'client': ('127.0.0.1', 50000),
+            'server': ('localhost', 80),
+        }
+        # The body arrives in two chunks, like from a slow client.
+        messages = [
+            {'type': 'http.request', 'body': body[:5], 'more_body': True},
+            {'type': 'http.request', 'body': body[5:], 'more_body': False},
+        ]
+        sent = []
+
+        async def receive():  # noqa: WPS430
+            return messages.pop(0)
+
+        async def send(message):  # noqa: WPS430
+            sent.append(message)
+
+        asyncio.run(application(scope, receive, send))
+        headers = dict(sent[0].get('headers', []))
+        body = b''.join(message.get('body', b'') for message in sent[1:])
+        return sent[0]['status'], headers, body
+
+    def test_valid_POST_saved_and_sent(
+        self,
+        contact_form_page_w_email_field,
+        inner_app,
+        mailoutbox,
+        shared_connection_executors,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+
+        status, headers, body = self.call(
+            asgi.FormSubmissionApplication(inner_app),
+            page.url,
+            {'email': 'someone@example.com', 'spammer_jammer': ''},
+        )
+
+        assert status == HTTPStatus.OK
+        assert json.loads(body) == {
+            'email': 'someone@example.com',
+            'spammer_jammer': '',
+        }
+        assert headers[b'X-Frame-Options'] == b'DENY'
+        assert not inner_app.calls
+        assert page.get_submission_class().objects.count() == 1
+        assert len(mailoutbox) == 1
+
+    def test_invalid_POST_bad_request(
+        self,
+        contact_form_page_w_email_field,
+        inner_app,
+        mailoutbox,
+        shared_connection_executors,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+
+        status, _, body = self.call(
+            asgi.FormSubmissionApplication(inner_app),
+            page.url,
+            {'email': 'not an address', 'spammer_jammer': ''},
+        )
+
+        assert status == HTTPStatus.BAD_REQUEST
+        assert 'email' in json.loads(body)['errors']
+        assert page.get_submission_class().objects.count() == 0
+        assert not mailoutbox
+
+    def test_POST_timed_logged_and_counted(
+        self,
+        contact_form_page_w_email_field,
+        inner_app,
+        mailoutbox,
+        shared_connection_executors,
+        caplog,
+    ):  # noqa: D102
+        monitoring_logger = logging.getLogger('monitoring')
+        monitoring_logger.addHandler(caplog.handler)
+        try:
+            status, headers, _ = self.call(
+                asgi.FormSubmissionApplication(inner_app),
+                contact_form_page_w_email_field.url,
+                {'email': 'someone@example.com', 'spammer_jammer': ''},
+            )
+        finally:
+            monitoring_logger.removeHandler(caplog.handler)
+
+        assert status == HTTPStatus.OK
+        logged = json.loads(caplog.records[-1].getMessage())
+        assert logged['route'] == 'POST wagtail_serve'
+        assert logged['queries'] > 0
+        assert f'desc="{logged["queries"]} queries"' in (
+            headers[b'Server-Timing'].decode()
+        )
+        assert registry.registry.collect()[
+            ('forms_posts_total', (('outcome', 'valid'),))
+        ] == 1
+
+    def test_POST_over_query_budget_fails(
+        self,
+        contact_form_page_w_email_field,
+        inner_app,
+        mailoutbox,
+        shared_connection_executors,
+        settings,
+    ):  # noqa: D102
+        settings.MONITORING_QUERY_BUDGETS = {'POST wagtail_serve': 1}
+
+        with pytest.raises(timing.QueryBudgetExceeded):
+            self.call(
+                asgi.FormSubmissionApplication(inner_app),
+                contact_form_page_w_email_field.url,
+                {'email': 'someone@example.com', 'spammer_jammer': ''},
+            )
+
+    def test_writing_client_pinned_to_primary(
+        self,
+        contact_form_page_w_email_field,
+        inner_app,
+        mailoutbox,
+        shared_connection_executors,
+        monkeypatch,
+    ):  # noqa: D102
+        monkeypatch.setattr(routers, 'get_replica_alias', lambda: 'replica')
+
+        _, headers, _ = self.call(
+            asgi.FormSubmissionApplication(inner_app),
+            contact_form_page_w_email_field.url,
+            {'email': 'someone@example.com', 'spammer_jammer': ''},
+        )
+
+        assert headers[b'Set-Cookie'].startswith(b'db_primary=1;')
+
+    def test_before_serve_page_hooks_run(
+        self,
+        contact_form_page_w_email_field,
+        inner_app,
+        mailoutbox,
+        shared_connection_executors,
+        monkeypatch,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+
+        def forbid(hooked_page, request, serve_args, serve_kwargs):  # noqa: WPS430
+            return djhttp.HttpResponseForbidden()
+        monkeypatch.setitem(
+            wthooks._hooks,  # noqa: WPS437
+            'before_serve_page',
+            [*wthooks._hooks['before_serve_page'], (forbid, 0)],  # noqa: WPS437
+        )
+
+        status, _, _ = self.call(
+            asgi.FormSubmissionApplication(inner_app),
+            page.url,
+            {'email': 'someone@example.com', 'spammer_jammer': ''},
+        )
+
+        assert status == HTTPStatus.FORBIDDEN
+        assert page.get_submission_class().objects.count() == 0
+
+    def test_spam_POST_short_circuited(
+        self,
+        db,
+        inner_app,
+        django_assert_num_queries,
+    ):  # noqa: D102
+        with django_assert_num_queries(0):
+            status, _, body = self.call(
+                asgi.FormSubmissionApplication(inner_app),
+                '/contact/',
+                {'email': 'someone@example.com', 'spammer_jammer': 'spam'},
+            )
+
+        assert status == HTTPStatus.OK
+        assert body == b''
+        assert not inner_app.calls
+        assert honeypot.stats.as_dict() == {
+            'inspected': 1,
+            'short_circuited': 1,
+        }
+
+    def test_throttled_client_rejected_before_routing(
+        self,
+        db,
+        inner_app,
+        django_assert_num_queries,
+    ):  # noqa: D102
+        ratelimit.penalty_box.add(('/contact/', '127.0.0.1'), 30)
+
+        with django_assert_num_queries(0):
+            status, headers, _ = self.call(
+                asgi.FormSubmissionApplication(inner_app),
+                '/contact/',
+                {'email': 'someone@example.com', 'spammer_jammer': ''},
+            )
+
+        assert status == HTTPStatus.TOO_MANY_REQUESTS
+        assert headers[b'Retry-After'] == b'30'
+        assert not inner_app.calls
+
+    def test_other_page_passed_on_with_body(
+        self,
+        inner_app,
+        shared_connection_executors,
+    ):  # noqa: D102
+        status, _, _ = self.call(
+            asgi.FormSubmissionApplication(inner_app),
+            '/',
+            {'spammer_jammer': ''},
+        )
+
+        assert status == HTTPStatus.NO_CONTENT
+        assert inner_app.calls == [b'spammer_jammer=']
+
+    def test_excluded_path_passed_on(self, inner_app):  # noqa: D102
+        status, _, _ = self.call(
+            asgi.FormSubmissionApplication(inner_app),
+            '/graphql',
+            {'spammer_jammer': 'spam'},
+        )
+
+        assert status == HTTPStatus.NO_CONTENT
+        assert honeypot.stats.as_dict() == {}
+
+    def test_entry_point_wraps_django(self):  # noqa: D102
+        from contact_form_prototype import asgi as project_asgi  # noqa: WPS433
+
+        assert isinstance(
+            project_asgi.application,
+            asgi.FormSubmissionApplication,
+        )
+
+
+class TestDefinitionExport(object):
+    """Test the incremental static export of form definitions."""
+
+    @pytest.fixture
+    def exporter(self, tmp_path):  # noqa: D102
+        return definitions.DefinitionExporter(str(tmp_path))
+
+    def read(self, exporter, relative_path):  # noqa: D102
+        with open(f'{exporter.directory}/{relative_path}') as exported:
+            return json.load(exported)
+
+    def test_export_writes_definition_and_manifest(
+        self,
+        contact_form_page_w_email_field,
+        exporter,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+
+        result = exporter.export()
+
+        assert result == definitions.ExportResult(1, 0, 0, 0)
+        entry = self.read(exporter, 'manifest.json')['forms'][str(page.pk)]
+        definition = self.read(exporter, entry['file'])
+        assert definition['title'] == 'Contact'
+        assert [
+            (field['name'], field['fieldType'], field['required'])
+            for field in definition['fields']
+        ] == [
+            ('email', 'email', True),
+            ('spammer_jammer', 'hidden', False),
+        ]
+
+    def test_unchanged_pages_skipped_without_queries(
+        self,
+        contact_form_page_w_email_field,
+        exporter,
+        django_assert_num_queries,
+    ):  # noqa: D102
+        exporter.export()
+
+        with django_assert_num_queries(1):
+            result = exporter.export()
+
+        assert result == definitions.ExportResult(0, 0, 1, 0)
+
+    def test_republished_page_rewritten(
+        self,
+        contact_form_page_w_email_field,
+        exporter,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        exporter.export()
+        old_file = self.read(exporter, 'manifest.json')['forms'][str(page.pk)]
+
+        page.thank_you_text = 'Thanks!'
+        page.save_revision().publish()
+        result = exporter.export()
+
+        new_file = self.read(exporter, 'manifest.json')['forms'][str(page.pk)]
+        assert result == definitions.ExportResult(1, 0, 0, 0)
+        assert new_file['file'] != old_file['file']
+        assert self.read(exporter, new_file['file'])['thankYouText'] == (
+            'Thanks!'
+        )
+        assert not os.path.exists(f'{exporter.directory}/{old_file["file"]}')
+
+    def test_republished_without_changes_keeps_file(
+        self,
+        contact_form_page_w_email_field,
+        exporter,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        exporter.export()
+
+        page.save_revision().publish()
+        result = exporter.export()
+
+        assert result == definitions.ExportResult(0, 1, 0, 0)
+
+    def test_unpublished_page_removed(
+        self,
+        contact_form_page_w_email_field,
+        exporter,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        exporter.export()
+
+        page.unpublish()
+        result = exporter.export()
+
+        assert result == definitions.ExportResult(0, 0, 0, 1)
+        assert self.read(exporter, 'manifest.json')['forms'] == {}
+        assert os.listdir(exporter.forms_directory) == []
+
+    def test_export_command(
+        self,
+        contact_form_page_w_email_field,
+        tmp_path,
+        capsys,
+    ):  # noqa: D102
+        djmgmt.call_command(
+            'export_form_definitions',
+            '--output',
+            str(tmp_path),
+            '--full',
+        )
+
+        assert 'Wrote 1, unchanged 0, skipped 0, removed 0' in (
+            capsys.readouterr().out
+        )
+
+
+class TestSubmissionExport(object):
+    """Test the streaming CSV and NDJSON export of submissions."""
+
+    @pytest.fixture
+    def page(self, contact_form_page_w_email_field, submit):  # noqa: D102
+        for number in range(3):
+            submit(
+                contact_form_page_w_email_field,
+                email=f'person-{number}@example.com',
+            )
+        return contact_form_page_w_email_field
+
+    def get(self, admin_client, page, export_format):  # noqa: D102
+        return admin_client.get(
+            f'/admin/forms/submissions/{page.pk}/',
+            {'export': export_format},
+        )
+
+    def test_admin_csv_export_streams(self, page, admin_client):  # noqa: D102
+        res = self.get(admin_client, page, 'csv')
+
+        assert res.streaming
+        assert res['Content-Type'] == 'text/csv'
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        assert lines[0] == 'Submission date,Email'
+        assert [line.split(',')[1] for line in lines[1:]] == [
+            'person-0@example.com',
+            'person-1@example.com',
+            'person-2@example.com',
+        ]
+
+    def test_admin_ndjson_export_streams(self, page, admin_client):  # noqa: D102
+        res = self.get(admin_client, page, 'ndjson')
+
+        assert res.streaming
+        rows = [
+            json.loads(line)
+            for line in b''.join(res.streaming_content).splitlines()
+        ]
+        assert [row['email'] for row in rows] == [
+            'person-0@example.com',
+            'person-1@example.com',
+            'person-2@example.com',
+        ]
+        assert set(rows[0]) == {'submit_time', 'email'}
+
+    def test_export_reads_in_chunks(
+        self,
+        page,
+        django_assert_num_queries,
+    ):  # noqa: D102
+        chunks = exports.iter_export(
+            'ndjson',
+            exports.get_submissions(page),
+            page.get_data_fields(),
+            chunk_size=1,
+        )
+
+        with django_assert_num_queries(1):
+            assert len(b''.join(chunks).splitlines()) == 3
+
+    def test_date_filter_excludes_rows(self, page):  # noqa: D102
+        tomorrow = timezone.localdate() + datetime.timedelta(days=1)
+
+        assert exports.get_submissions(page, date_to=tomorrow).count() == 3
+        assert exports.get_submissions(page, date_from=tomorrow).count() == 0
+
+    def test_export_command(self, page, tmp_path):  # noqa: D102
+        output = tmp_path / 'export.csv'
+
+        djmgmt.call_command(
+            'export_submissions',
+            str(page.pk),
+            '--date-from',
+            str(timezone.localdate()),
+            '--output',
+            str(output),
+        )
+
+        assert len(output.read_text().splitlines()) == 4
+
+
+class TestRetention(object):
+    """Test purging, archiving and restoring old submissions."""
+
+    @pytest.fixture(autouse=True)
+    def retention_settings(self, settings, tmp_path):  # noqa: D102
+        settings.FORMS_RETENTION_CHUNK_PAUSE = 0
+        settings.FORMS_RETENTION_ARCHIVE_DIR = str(tmp_path / 'archive')
+        return settings
+
+    @pytest.fixture
+    def page(self, contact_form_page_w_email_field, submit):  # noqa: D102
+        page = contact_form_page_w_email_field
+        for number in range(5):
+            submit(page, email=f'person-{number}@example.com')
+        submissions = page.get_submission_class().objects.order_by('pk')
+        old_pks = [submission.pk for submission in submissions[:3]]
+        submissions.filter(pk__in=old_pks).update(
+            submit_time=timezone.now() - datetime.timedelta(days=40),
+        )
+        page.retention_days = 30
+        page.save()
+        return page
+
+    def test_purge_deletes_old_submissions_in_chunks(
+        self,
+        page,
+        django_assert_num_queries,
+    ):  # noqa: D102
+        # Two chunks with a select, and in a savepoint of their own the
+        # primary keys for the cascade and a delete of the index rows and
+        # the submissions each, and a final empty select.
+        with django_assert_num_queries(2 * 6 + 1):
+            result = retention.purge(page, chunk_size=2)
+
+        assert result == retention.PurgeResult(deleted=3, archived=0)
+        assert page.get_submission_class().objects.count() == 2
+
+    def test_no_retention_keeps_submissions(
+        self,
+        page,
+        settings,
+    ):  # noqa: D102
+        settings.FORMS_RETENTION_DAYS = None
+        page.retention_days = None
+
+        assert retention.purge(page).deleted == 0
+        assert page.get_submission_class().objects.count() == 5
+
+    def test_archive_and_restore(self, page, settings):  # noqa: D102
+        archive_dir = settings.FORMS_RETENTION_ARCHIVE_DIR
+        submission_class = page.get_submission_class()
+        before = list(
+            submission_class.objects.order_by('pk').values_list(
+                'pk', 'submit_time', 'form_data',
+            ),
+        )
+
+        result = retention.purge(page, archive_dir=archive_dir, chunk_size=2)
+
+        assert result == retention.PurgeResult(deleted=3, archived=3)
+        date = timezone.localdate() - datetime.timedelta(days=40)
+        archive_path = retention.get_archive_path(archive_dir, page.pk, date)
+        assert len(list(retention.iter_archive(archive_path))) == 3
+        assert retention.restore(archive_dir, submission_class) == (3, 0)
+        assert retention.restore(archive_dir, submission_class) == (0, 0)
+        assert list(
+            submission_class.objects.order_by('pk').values_list(
+                'pk', 'submit_time', 'form_data',
+            ),
+        ) == before
+
+    def test_retry_after_failed_delete(
+        self,
+        page,
+        settings,
+        monkeypatch,
+    ):  # noqa: D102
+        archive_dir = settings.FORMS_RETENTION_ARCHIVE_DIR
+        submission_class = page.get_submission_class()
+        email_field = page.form_fields.get(label='Email')
+        email_field.indexed = True
+        email_field.save()
+        delete = djm.QuerySet.delete
+        failures = [djdbutils.OperationalError('database is locked')]
+
+        def flaky_delete(queryset):  # noqa: WPS430
+            if failures:
+                raise failures.pop()
+            return delete(queryset)
+
+        monkeypatch.setattr(djm.QuerySet, 'delete', flaky_delete)
+        with pytest.raises(djdbutils.OperationalError):
+            retention.purge(page, archive_dir=archive_dir, chunk_size=2)
+        retention.purge(page, archive_dir=archive_dir, chunk_size=2)
+        date = timezone.localdate() - datetime.timedelta(days=40)
+        archive_path = retention.get_archive_path(archive_dir, page.pk, date)
+        archived = [row['id'] for row in retention.iter_archive(archive_path)]
+
+        assert len(archived) == len(set(archived)) == 3
+        assert retention.restore(archive_dir, submission_class).restored == 3
+        assert lookups.find('email', 'person-0@example.com').count() == 1
+
+    def test_restore_skips_repeated_rows(self, page, settings):  # noqa: D102
+        archive_dir = settings.FORMS_RETENTION_ARCHIVE_DIR
+        submission_class = page.get_submission_class()
+        retention.purge(page, archive_dir=archive_dir)
+        date = timezone.localdate() - datetime.timedelta(days=40)
+        archive_path = retention.get_archive_path(archive_dir, page.pk, date)
+        rows = list(retention.iter_archive(archive_path))
+
+        result = retention.restore_batch(rows + rows, submission_class)
+
+        assert result == retention.RestoreResult(restored=3, skipped=0)
+        assert submission_class.objects.count() == 5
+
+    def test_archive_outside_transaction(
+        self,
+        page,
+        settings,
+        monkeypatch,
+    ):  # noqa: D102
+        archive = retention.archive
+        savepoints = []
+
+        def recording_archive(*args):  # noqa: WPS430
+            savepoints.append(list(djconnection.savepoint_ids))
+            return archive(*args)
+
+        monkeypatch.setattr(retention, 'archive', recording_archive)
+        retention.purge(
+            page,
+            archive_dir=settings.FORMS_RETENTION_ARCHIVE_DIR,
+            chunk_size=2,
+        )
+
+        assert savepoints == [[], []]
+
+    def test_restore_skips_rows_that_cannot_be_restored(
+        self,
+        page,
+        settings,
+    ):  # noqa: D102
+        archive_dir = settings.FORMS_RETENTION_ARCHIVE_DIR
+        submission_class = page.get_submission_class()
+        retention.purge(page, archive_dir=archive_dir)
+        date = timezone.localdate() - datetime.timedelta(days=40)
+        archive_path = retention.get_archive_path(archive_dir, page.pk, date)
+        rows = list(retention.iter_archive(archive_path))
+        rows[0]['page_id'] = page.pk + 1000
+        rows[1]['form_data'] = 'c1000:["gone@example.com",""]'
+
+        result = retention.restore_batch(rows, submission_class)
+
+        assert result == retention.RestoreResult(restored=1, skipped=2)
+        assert submission_class.objects.count() == 3
+
+    def test_purge_and_restore_commands(
+        self,
+        page,
+        settings,
+        capsys,
+    ):  # noqa: D102
+        djmgmt.call_command('purge_submissions', '--archive')
+        djmgmt.call_command(
+            'restore_submissions',
+            settings.FORMS_RETENTION_ARCHIVE_DIR,
+        )
+
+        out = capsys.readouterr().out
+        assert 'Deleted 3 submissions, archived 3.' in out
+        assert 'Restored 3 submissions.' in out
+        assert page.get_submission_class().objects.count() == 5
+
+
+class TestSubmissionEncoding(object):
+    """Test compact storage of submission form data."""
+
+    @pytest.fixture(autouse=True)
+    def empty_cache(self):  # noqa: D102
+        encoding.field_names_cache.clear()
+        yield
+        encoding.field_names_cache.clear()
+
+    @pytest.mark.parametrize('page_encoding', [
+        encoding.ENCODING_COMPACT,
+        encoding.ENCODING_COMPRESSED,
+    ])
+    def test_submission_stored_compactly(
+        self,
+        contact_form_page_w_email_field,
+        submit,
+        page_encoding,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        page.submission_encoding = page_encoding
+        page.save()
+
+        submit(page, email='first@example.com')
+        submit(page, email='second@example.com')
+
+        submissions = page.get_submission_class().objects.order_by('pk')
+        assert [
+            encoding.get_encoding(submission.form_data)
+            for submission in submissions
+        ] == [page_encoding, page_encoding]
+        assert 'email' not in submissions[0].form_data
+        assert submissions[0].get_data()['email'] == 'first@example.com'
+        assert list(submissions[1].get_data()) == [
+            'email',
+            'spammer_jammer',
+            'submit_time',
+        ]
+        assert SubmissionFieldNames.objects.count() == 1
+
+    def test_export_decodes_compact_rows(
+        self,
+        contact_form_page_w_email_field,
+        submit,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        submit(page, email='legacy@example.com')
+        page.submission_encoding = encoding.ENCODING_COMPRESSED
+        page.save()
+        submit(page, email='compact@example.com')
+
+        rows = b''.join(exports.iter_export(
+            'ndjson',
+            exports.get_submissions(page),
+            page.get_data_fields(),
+        )).splitlines()
+
+        assert [json.loads(row)['email'] for row in rows] == [
+            'legacy@example.com',
+            'compact@example.com',
+        ]
+
+    def test_encode_submissions_command_converts_both_ways(
+        self,
+        contact_form_page_w_email_field,
+        submit,
+        capsys,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        for number in range(3):
+            submit(page, email=f'person-{number}@example.com')
+        submissions = page.get_submission_class().objects.order_by('pk')
+        before = [submission.get_data() for submission in submissions]
+
+        page.submission_encoding = encoding.ENCODING_COMPACT
+        page.save()
+        djmgmt.call_command('encode_submissions', '--batch-size', '2')
+        compact = [submission.form_data for submission in submissions.all()]
+        page.submission_encoding = encoding.ENCODING_JSON
+        page.save()
+        djmgmt.call_command('encode_submissions')
+
+        assert all(form_data.startswith('c') for form_data in compact)
+        assert [
+            submission.get_data() for submission in submissions.all()
+        ] == before
+        assert capsys.readouterr().out.count('Converted 3 submissions.') == 2
+
+
+class TestFieldValueIndex(object):
+    """Test indexed lookups of submissions by field value."""
+
+    @pytest.fixture
+    def page(self, contact_form_page_w_email_field):  # noqa: D102
+        email_field = FormField.objects.get(
+            page=contact_form_page_w_email_field,
+            label='Email',
+        )
+        email_field.indexed = True
+        email_field.save()
+        return contact_form_page_w_email_field
+
+    def test_submission_indexed_and_found(self, page, submit):  # noqa: D102
+        submit(page, email='Someone@Example.com')
+        submit(page, email='other@example.com')
+
+        found = lookups.find('email', ' someone@example.com', page=page)
+
+        assert [submission.get_data()['email'] for submission in found] == [
+            'Someone@Example.com',
+        ]
+        assert lookups.find('spammer_jammer', '').count() == 0
+
+    def test_unindexed_field_not_found(
+        self,
+        contact_form_page_w_email_field,
+        submit,
+    ):  # noqa: D102
+        submit(contact_form_page_w_email_field)
+
+        assert lookups.find('email', 'someone@example.com').count() == 0
+
+    def test_written_behind_submission_indexed(
+        self,
+        page,
+        submit,
+        settings,
+        tmp_path,
+    ):  # noqa: D102
+        settings.FORMS_WRITE_BEHIND = True
+        settings.FORMS_WRITE_BEHIND_AUTOFLUSH = False
+        settings.FORMS_WRITE_BEHIND_SPOOL_DIR = str(tmp_path / 'spool')
+        submit(page)
+
+        writebehind.flush()
+
+        assert lookups.find('email', 'someone@example.com').count() == 1
+
+    def test_admin_search_uses_index(
+        self,
+        page,
+        submit,
+        admin_client,
+        settings,
+    ):  # noqa: D102
+        # The manifest only exists after collectstatic.
+        settings.STATICFILES_STORAGE = (
+            'django.contrib.staticfiles.storage.StaticFilesStorage'
+        )
+        submit(page, email='first@example.com')
+        submit(page, email='second@example.com')
+
+        res = admin_client.get(
+            f'/admin/forms/submissions/{page.pk}/',
+            {'value': 'SECOND@example.com'},
+        )
+
+        assert res.status_code == HTTPStatus.OK
+        assert [
+            row['fields'][1] for row in res.context['data_rows']
+        ] == ['second@example.com']
+        assert 'name="value"' in res.content.decode()
+
+    def test_index_command_backfills(
+        self,
+        contact_form_page_w_email_field,
+        submit,
+        capsys,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        submit(page)
+        email_field = FormField.objects.get(page=page, label='Email')
+        email_field.indexed = True
+        email_field.save()
+
+        djmgmt.call_command('index_submissions')
+        djmgmt.call_command('index_submissions')
+
+        assert lookups.find('email', 'someone@example.com').count() == 1
+        assert capsys.readouterr().out.count('Wrote 1 index rows.') == 2
+
+
+class TestConcurrentWrites(object):
+    """Test the SQLite profile and the single writer under concurrency."""
+
+    def get_connection(self, path, **pragmas):  # noqa: D102
+        handler = djdbutils.ConnectionHandler({
+            'default': {
+                'ENGINE': 'contact_form_prototype.sqlite',
+                'NAME': str(path),
+                'OPTIONS': {
+                    'begin': 'IMMEDIATE',
+                    'pragmas': {'journal_mode': 'WAL', **pragmas},
+                },
+            },
+        })
+        return handler['default']
+
+    @pytest.mark.django_db
+    def test_connection_has_pragmas(self):  # noqa: D102
+        with djconnection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            busy_timeout = cursor.fetchone()[0]
+            cursor.execute('PRAGMA synchronous')
+            synchronous = cursor.fetchone()[0]
+
+        assert busy_timeout == 20000
+        assert synchronous == 1  # NORMAL
+
+    @pytest.mark.django_db
+    def test_transaction_takes_write_lock(self, tmp_path):  # noqa: D102
+        first = self.get_connection(tmp_path / 'db.sqlite3')
+        second = self.get_connection(tmp_path / 'db.sqlite3', busy_timeout=10)
+        try:
+            with first.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                assert cursor.fetchone()[0] == 'wal'
+            # What atomic() does on SQLite.
+            first.set_autocommit(
+                False, force_begin_transaction_with_broken_autocommit=True,
+            )
+
+            with pytest.raises(djdbutils.OperationalError, match='locked'):
+                second.set_autocommit(
+                    False, force_begin_transaction_with_broken_autocommit=True,
+                )
+        finally:
+            first.close()
+            second.close()
+
+    def test_single_writer_holds_lock_file(self, settings, tmp_path):  # noqa: D102
+        settings.FORMS_SINGLE_WRITER = True
+        settings.FORMS_SINGLE_WRITER_LOCK_FILE = str(tmp_path / 'writer.lock')
+
+        with singlewriter.serialised():
+            with open(settings.FORMS_SINGLE_WRITER_LOCK_FILE) as other:
+                with pytest.raises(BlockingIOError):
+                    fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        with open(settings.FORMS_SINGLE_WRITER_LOCK_FILE) as other:
+            fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def test_single_writer_disabled(self, settings, tmp_path):  # noqa: D102
+        settings.FORMS_SINGLE_WRITER = False
+        settings.FORMS_SINGLE_WRITER_LOCK_FILE = str(tmp_path / 'writer.lock')
+
+        with singlewriter.serialised():
+            assert not os.path.exists(settings.FORMS_SINGLE_WRITER_LOCK_FILE)
+
+    @pytest.mark.parametrize('options', [[], ['--single-writer']])
+    def test_concurrent_submitters_without_lock_errors(
+        self,
+        settings,
+        options,
+    ):  # noqa: D102
+        completed = subprocess.run(  # noqa: S603
+            [
+                sys.executable,
+                '-m',
+                'benchmarks.concurrency',
+                '--processes=4',
+                '--threads=4',
+                '--submissions=10',
+                '--check',
+                *options,
+            ],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+        )
+
+        assert completed.returncode == 0, completed.stdout + completed.stderr
+        assert 'stored 160 of 160 successful submissions' in completed.stdout
+        assert '0 errors, 0 lock errors' in completed.stdout
+
+
+class TestIdempotency(object):
+    """Test that retried submissions are processed once."""
+
+    def post(  # noqa: D102
+        self,
+        request_factory,
+        page,
+        email='someone@example.com',
+        **extra,
+    ):
+        req = request_factory.post(
+            page.url,
+            {'email': email, 'spammer_jammer': ''},
+            **extra,
+        )
+        req.user = djam.AnonymousUser()
+        return req
+
+    def test_retry_replays_response(
+        self,
+        contact_form_page_w_email_field,
+        request_factory,
+        mailoutbox,
+        django_assert_num_queries,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        first = page.serve(
+            self.post(request_factory, page, HTTP_IDEMPOTENCY_KEY='a1'),
+        )
+
+        with django_assert_num_queries(0):
+            retry = page.serve(
+                self.post(request_factory, page, HTTP_IDEMPOTENCY_KEY='a1'),
+            )
+
+        assert first.status_code == HTTPStatus.OK
+        assert retry.status_code == HTTPStatus.OK
+        assert retry.content == first.content
+        assert retry['Content-Type'] == 'application/json'
+        assert retry['Idempotent-Replayed'] == 'true'
+        assert page.get_submission_class().objects.count() == 1
+        assert len(mailoutbox) == 1
+
+    def test_retry_from_other_network_replays_response(
+        self,
+        contact_form_page_w_email_field,
+        request_factory,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        first = page.serve(self.post(
+            request_factory,
+            page,
+            email='first@example.com',
+            HTTP_IDEMPOTENCY_KEY='a1',
+            REMOTE_ADDR='10.0.0.1',
+        ))
+
+        res = page.serve(self.post(
+            request_factory,
+            page,
+            email='first@example.com',
+            HTTP_IDEMPOTENCY_KEY='a1',
+            REMOTE_ADDR='10.0.0.2',
+        ))
+
+        assert res['Idempotent-Replayed'] == 'true'
+        assert res.content == first.content
+        assert page.get_submission_class().objects.count() == 1
+
+    def test_other_key_is_processed(
+        self,
+        contact_form_page_w_email_field,
+        request_factory,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        page.serve(self.post(request_factory, page, HTTP_IDEMPOTENCY_KEY='a1'))
+        page.serve(self.post(request_factory, page, HTTP_IDEMPOTENCY_KEY='a2'))
+        page.serve(self.post(request_factory, page))
+
+        assert page.get_submission_class().objects.count() == 3
+
+    def test_invalid_submission_releases_key(
+        self,
+        contact_form_page_w_email_field,
+        request_factory,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        invalid = page.serve(self.post(
+            request_factory, page, email='nope', HTTP_IDEMPOTENCY_KEY='a1',
+        ))
+        valid = page.serve(
+            self.post(request_factory, page, HTTP_IDEMPOTENCY_KEY='a1'),
+        )
+
+        assert invalid.status_code == HTTPStatus.BAD_REQUEST
+        assert valid.status_code == HTTPStatus.OK
+        assert not valid.has_header('Idempotent-Replayed')
+        assert page.get_submission_class().objects.count() == 1
+
+    def test_retry_while_processing_conflicts(
+        self,
+        contact_form_page_w_email_field,
+        request_factory,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        req = self.post(request_factory, page, HTTP_IDEMPOTENCY_KEY='a1')
+        assert idempotency.get_store().claim(
+            idempotency.get_key(req, page),
+        ) is None
+
+        res = page.serve(req)
+
+        assert res.status_code == HTTPStatus.CONFLICT
+        assert res['Retry-After'] == '1'
+        assert not page.get_submission_class().objects.exists()
+
+    def test_content_window(
+        self,
+        contact_form_page_w_email_field,
+        request_factory,
+        settings,
+    ):  # noqa: D102
+        settings.FORMS_IDEMPOTENCY_CONTENT_WINDOW = 300
+        page = contact_form_page_w_email_field
+        page.serve(self.post(request_factory, page))
+        retry = page.serve(self.post(request_factory, page))
+        page.serve(self.post(request_factory, page, REMOTE_ADDR='10.0.0.2'))
+        page.serve(self.post(request_factory, page, email='other@example.com'))
+
+        assert retry['Idempotent-Replayed'] == 'true'
+        assert page.get_submission_class().objects.count() == 3
+
+    def test_async_retry_replays_response(
+        self,
+        contact_form_page_w_email_field,
+        request_factory,
+        shared_connection_executors,
+    ):  # noqa: D102
+        page = contact_form_page_w_email_field
+        responses = [
+            asyncio.run(page.ahandle_POST(
+                self.post(request_factory, page, HTTP_IDEMPOTENCY_KEY='a1'),
+            ))
+            for _ in range(2)  # noqa: WPS122
+        ]
+
+        assert responses[1].content == responses[0].content
+        assert responses[1]['Idempotent-Replayed'] == 'true'
+        assert page.get_submission_class().objects.count() == 1
+
+    def test_purge_command(self, capsys):  # noqa: D102
+        store = idempotency.get_store()
+        ok = djhttp.JsonResponse({})
+        store.finish(idempotency.Key(b'expired', -1), ok)
+        store.finish(idempotency.Key(b'current', 60), ok)
+
+        djmgmt.call_command('purge_idempotency_keys')
+
+        assert capsys.readouterr().out == 'Deleted 1 expired idempotency keys.\n'
+        assert store.claim(idempotency.Key(b'expired', 60)) is None
+        assert store.claim(idempotency.Key(b'current', 60)).status_code == 200
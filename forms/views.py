@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+"""Admin views of the forms app."""
+
+from django import forms as djforms  # type: ignore[import]
+from django import http as djhttp  # type: ignore[import]
+from wagtail.contrib.forms import forms as wtff  # type: ignore[import]
+from wagtail.contrib.forms import views as wtfv  # type: ignore[import]
+
+from forms import exports
+from forms import lookups
+
+
+class SubmissionFilterForm(wtff.SelectDateForm):
+    """Filter submissions by date and by a value of an indexed field."""
+
+    value = djforms.CharField(
+        required=False,
+        label='Indexed value',
+        widget=djforms.TextInput(attrs={'placeholder': 'e.g. an email address'}),
+    )
+
+
+class SubmissionsListView(wtfv.SubmissionsListView):
+    """List and search submissions and stream CSV and NDJSON exports."""
+
+    FORMAT_NDJSON = 'ndjson'
+    FORMATS = wtfv.SubmissionsListView.FORMATS + (FORMAT_NDJSON,)
+
+    def get_filtering(self):
+        """Override method to search the indexed field values."""
+        filtering = super().get_filtering()
+        # Replaces the date form in the template, adding the search box.
+        self.select_date_form = SubmissionFilterForm(self.request.GET)
+        if self.select_date_form.is_valid():
+            value = self.select_date_form.cleaned_data.get('value')
+            if value:
+                filtering['pk__in'] = lookups.find_any(
+                    self.form_page,
+                    value,
+                ).values('pk')
+        return filtering
+
+    def render_to_response(self, context, **response_kwargs):
+        """Stream CSV and NDJSON exports instead of rendering them at once."""  # noqa: DAR101, DAR201
+        export_format = self.request.GET.get('export')
+        if not self.is_export or export_format not in exports.FORMATTERS:
+            return super().render_to_response(context, **response_kwargs)
+        response = djhttp.StreamingHttpResponse(
+            exports.iter_export(
+                export_format,
+                self.object_list,
+                self.form_page.get_data_fields(),
+            ),
+            content_type=exports.CONTENT_TYPES[export_format],
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{self.get_filename()}.{export_format}"'
+        )
+        return response
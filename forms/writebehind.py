@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+
+"""
+Write-behind queue for form submissions.
+
+Validated submissions are spooled to a local directory instead of being
+inserted into the database within the request. The spool works like a
+maildir: every entry is written to ``tmp/`` and atomically renamed into
+``new/``. A flusher claims entries by renaming them into ``cur/`` and turns
+them into submission rows with ``bulk_create``. Renames are atomic, so
+several worker processes can enqueue and flush concurrently without locks.
+
+Entries carry the time of the request, which becomes the ``submit_time`` of
+their row however long they waited in the spool. The spool depth is counted
+at most every ``FORMS_WRITE_BEHIND_DEPTH_CHECK_INTERVAL`` seconds per
+process, in between the entries the process spooled itself are added.
+
+Delivery is at-least-once. Entries that were claimed by a flusher that died
+before acknowledging them are put back into ``new/`` after a grace period,
+counted from the claim. Entries are acknowledged as soon as their rows are
+committed, before notification emails are sent, so a failing mail server
+never gets rows written twice.
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings  # type: ignore[import]
+from django.core.serializers.json import DjangoJSONEncoder  # type: ignore[import]
+from django.db import connection as djconnection  # type: ignore[import]
+from django.db import transaction  # type: ignore[import]
+from django.utils import dateparse  # type: ignore[import]
+from django.utils import timezone  # type: ignore[import]
+
+from forms import lookups
+from forms import outbox
+from forms import singlewriter
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised when the spool already holds the maximum number of entries."""
+
+
+class SubmissionSpool(object):
+    """Directory backed queue of pending form submissions."""
+
+    def __init__(self, path):  # noqa: D107
+        self.path = path
+        self.tmp_dir = os.path.join(path, 'tmp')
+        self.new_dir = os.path.join(path, 'new')
+        self.cur_dir = os.path.join(path, 'cur')
+        for directory in (self.tmp_dir, self.new_dir, self.cur_dir):
+            os.makedirs(directory, exist_ok=True)
+
+    def depth(self):
+        """Return number of pending and claimed entries."""
+        return _count_entries(self.new_dir) + _count_entries(self.cur_dir)
+
+    def put(self, entry):
+        """Durably write an entry to the spool and return its name."""
+        # Names sort by creation time, so entries are flushed in order.
+        name = '{0:020d}-{1}.json'.format(time.time_ns(), uuid.uuid4().hex)
+        tmp_path = os.path.join(self.tmp_dir, name)
+        with open(tmp_path, 'w', encoding='utf-8') as spool_file:
+            json.dump(entry, spool_file, cls=DjangoJSONEncoder)
+            spool_file.flush()
+            os.fsync(spool_file.fileno())
+        os.rename(tmp_path, os.path.join(self.new_dir, name))
+        return name
+
+    def claim(self, limit):
+        """Claim up to ``limit`` entries and return ``(name, entry)`` pairs."""
+        claimed = []
+        for name in sorted(os.listdir(self.new_dir)):
+            if len(claimed) >= limit:
+                break
+            cur_path = os.path.join(self.cur_dir, name)
+            try:
+                os.rename(os.path.join(self.new_dir, name), cur_path)
+                # Renames keep the mtime of the enqueue, recover() needs the
+                # time of the claim.
+                os.utime(cur_path)
+                with open(cur_path, encoding='utf-8') as spool_file:
+                    claimed.append((name, json.load(spool_file)))
+            except FileNotFoundError:
+                # Another flusher claimed the entry first.
+                continue
+        return claimed
+
+    def ack(self, names):
+        """Remove entries that have been written to the database."""
+        for name in names:
+            try:
+                os.unlink(os.path.join(self.cur_dir, name))
+            except FileNotFoundError:
+                logger.warning(f'Spool entry {name} was already removed.')
+
+    def release(self, names):
+        """Put claimed entries back so they are picked up again."""
+        for name in names:
+            try:
+                os.rename(
+                    os.path.join(self.cur_dir, name),
+                    os.path.join(self.new_dir, name),
+                )
+            except FileNotFoundError:
+                logger.warning(f'Spool entry {name} was already released.')
+
+    def recover(self, older_than):
+        """Release claims that are older than ``older_than`` seconds."""
+        cutoff = time.time() - older_than
+        stale = [
+            entry.name
+            for entry in os.scandir(self.cur_dir)
+            if entry.stat().st_mtime < cutoff
+        ]
+        self.release(stale)
+        return len(stale)
+
+
+def _count_entries(directory):
+    with os.scandir(directory) as entries:
+        return sum(1 for _ in entries)
+
+
+class DepthEstimate(object):
+    """Spool depth of this process, listing the spool only now and then."""
+
+    def __init__(self):  # noqa: D107
+        self._lock = threading.Lock()
+        self.path = None
+        self.counted_at = None
+        self.depth = 0
+
+    def get(self, spool):
+        """Return the depth, counted again if the count is too old."""
+        with self._lock:
+            now = time.monotonic()
+            interval = settings.FORMS_WRITE_BEHIND_DEPTH_CHECK_INTERVAL
+            if (
+                spool.path != self.path or
+                self.counted_at is None or
+                now - self.counted_at >= interval
+            ):
+                self.path = spool.path
+                self.counted_at = now
+                self.depth = spool.depth()
+            return self.depth
+
+    def add(self, spool):
+        """Count an entry this process put into the spool."""
+        with self._lock:
+            if spool.path == self.path:
+                self.depth += 1
+
+
+depth_estimate = DepthEstimate()
+
+
+def is_enabled():
+    """Return whether submissions should be written behind."""
+    return settings.FORMS_WRITE_BEHIND
+
+
+def get_spool():
+    """Return spool for the configured directory."""
+    return SubmissionSpool(settings.FORMS_WRITE_BEHIND_SPOOL_DIR)
+
+
+def enqueue(page, form):
+    """
+    Spool a validated submission of ``page``.
+
+    The notification email is rendered now, while the bound form is still
+    around, and sent by the flusher once the submission row exists.
+
+    Raises:
+        QueueFull: If the spool already holds the maximum number of entries.
+
+    """  # noqa: DAR101, DAR201
+    spool = get_spool()
+    if depth_estimate.get(spool) >= settings.FORMS_WRITE_BEHIND_MAX_DEPTH:
+        raise QueueFull()
+    name = spool.put({
+        'page_id': page.pk,
+        # isoformat() keeps the microseconds DjangoJSONEncoder drops.
+        'submit_time': timezone.now().isoformat(),
+        'form_data': json.dumps(form.cleaned_data, cls=DjangoJSONEncoder),
+        'email': page.render_email(form) if page.to_address else None,
+    })
+    depth_estimate.add(spool)
+    if settings.FORMS_WRITE_BEHIND_AUTOFLUSH:
+        Flusher.ensure_started()
+    return name
+
+
+def get_submit_time(entry):
+    """Return when a spooled submission was made, ``None`` if unknown."""
+    submit_time = entry.get('submit_time')
+    return dateparse.parse_datetime(submit_time) if submit_time else None
+
+
+def set_inserted_pks(submission_class, submissions):
+    """Set the primary keys that ``bulk_create`` leaves unset on SQLite."""
+    if not submissions or submissions[0].pk is not None:
+        return
+    # The transaction holds the write lock since the insert, so the latest
+    # rows are these, in the order they were inserted.
+    pks = submission_class.objects.order_by('-pk').values_list(
+        'pk',
+        flat=True,
+    )[:len(submissions)]
+    for submission, pk in zip(submissions, reversed(pks)):
+        submission.pk = pk
+
+
+def write_batch(entries):
+    """
+    Insert submission rows for the entries.
+
+    Rows get the submission time of their entries and are indexed. With the
+    email outbox enabled, the notification emails are recorded in the same
+    transaction.
+
+    Returns:
+        Tuple of the number of rows written and the ``(page, content)``
+        emails still to be sent.
+
+    """  # noqa: DAR101
+    from forms import models  # noqa: WPS433 (avoid circular import)
+
+    pages = models.FormPage.objects.in_bulk(
+        {entry['page_id'] for entry in entries},
+    )
+    submissions_by_class = {}
+    submit_times = []
+    indexed = []
+    emails = []
+    for entry in entries:
+        page = pages.get(entry['page_id'])
+        if page is None:
+            logger.warning(
+                f'Dropping spooled submission for missing page {entry["page_id"]}.',
+            )
+            continue
+        data = json.loads(entry['form_data'])
+        submission_class = page.get_submission_class()
+        submission = submission_class(
+            page=page,
+            form_data=page.encode_form_data(data),
+        )
+        submissions_by_class.setdefault(submission_class, []).append(
+            submission,
+        )
+        submit_time = get_submit_time(entry)
+        if submit_time is not None:
+            submit_times.append((submission, submit_time))
+        if page.get_compiled_form().indexed_fields:
+            indexed.append((page, submission, data))
+        if entry['email'] is not None:
+            emails.append((page, entry['email']))
+    with singlewriter.serialised(), transaction.atomic():
+        for submission_class, submissions in submissions_by_class.items():
+            submission_class.objects.bulk_create(submissions)
+            set_inserted_pks(submission_class, submissions)
+        # submit_time is auto_now_add, so the insert set it to now.
+        for submission, submit_time in submit_times:
+            submission.submit_time = submit_time
+        for submission_class, submissions in submissions_by_class.items():
+            submission_class.objects.bulk_update(
+                [
+                    submission for submission, _ in submit_times
+                    if isinstance(submission, submission_class)
+                ],
+                ['submit_time'],
+            )
+        for page, submission, data in indexed:
+            lookups.index_submissions(page, [(submission, data)])
+        if outbox.is_enabled():
+            for page, content in emails:
+                page.send_rendered_mail(content)
+            emails = []
+    written = sum(len(subs) for subs in submissions_by_class.values())
+    return written, emails
+
+
+def send_emails(emails):
+    """Send the emails of written submissions, logging failures."""
+    for page, content in emails:
+        try:
+            page.send_rendered_mail(content)
+        except Exception:
+            logger.exception(
+                f'Sending the notification email of form page {page.pk} failed.',
+            )
+
+
+def flush(spool=None, batch_size=None):
+    """Write all currently spooled entries to the database in batches."""
+    spool = spool or get_spool()
+    batch_size = batch_size or settings.FORMS_WRITE_BEHIND_BATCH_SIZE
+    written = 0
+    while True:  # noqa: WPS457
+        claimed = spool.claim(batch_size)
+        if not claimed:
+            return written
+        names = [name for name, _ in claimed]
+        try:
+            batch_written, emails = write_batch([entry for _, entry in claimed])
+        except Exception:
+            spool.release(names)
+            raise
+        spool.ack(names)
+        written += batch_written
+        send_emails(emails)
+
+
+class Flusher(threading.Thread):
+    """Background thread that periodically flushes the spool."""
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, interval):  # noqa: D107
+        super().__init__(name='forms-write-behind-flusher', daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    @classmethod
+    def ensure_started(cls):
+        """Start the flusher of this process unless it is running already."""
+        with cls._lock:
+            if cls._instance is None or not cls._instance.is_alive():
+                cls._instance = cls(settings.FORMS_WRITE_BEHIND_FLUSH_INTERVAL)
+                cls._instance.start()
+                atexit.register(cls._instance.stop)
+        return cls._instance
+
+    def run(self):  # noqa: D102
+        spool = get_spool()
+        spool.recover(older_than=settings.FORMS_WRITE_BEHIND_CLAIM_TIMEOUT)
+        while not self.stopped.wait(self.interval):
+            self.flush_once(spool)
+
+    def flush_once(self, spool):
+        """Flush the spool and log instead of dying on errors."""
+        try:
+            flush(spool)
+        except Exception:
+            logger.exception('Flushing spooled submissions failed.')
+        finally:
+            djconnection.close()
+
+    def stop(self):
+        """Stop the loop and flush what is left."""
+        self.stopped.set()
+        self.join(timeout=self.interval)
+        self.flush_once(get_spool())
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+
+"""
+Gunicorn configuration, read from the working directory on start.
+
+The application is loaded and warmed up once in the master process, before
+the workers are forked from it.
+"""
+
+import time
+
+preload_app = True
+
+started = time.perf_counter()
+
+
+def when_ready(server):
+    """Warm up the preloaded application before the workers are forked."""
+    from contact_form_prototype import warmup  # noqa: WPS433
+
+    loaded = time.perf_counter() - started
+    server.log.info(f'Loaded the application in {loaded * 1000:.0f} ms')
+    server.log.info(warmup.format_report(warmup.run()))
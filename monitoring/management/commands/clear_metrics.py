@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+"""Remove the metric values of all processes."""
+
+from django.core.management.base import BaseCommand  # type: ignore[import]
+
+from monitoring.registry import registry
+
+
+class Command(BaseCommand):
+    """Start counting from zero, e.g. before the server starts."""
+
+    help = (  # noqa: WPS125
+        'Remove the metric values of all processes. Run it before starting '
+        'the server, so files of old worker processes do not pile up.'
+    )
+
+    def handle(self, *args, **options):  # noqa: D102
+        registry.clear()
+        self.stdout.write('Cleared the metrics.')
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+"""Report where the start of a worker process spends its import time."""
+
+import collections
+import subprocess  # noqa: S404
+import sys
+
+from django.conf import settings  # type: ignore[import]
+from django.core.management.base import BaseCommand  # type: ignore[import]
+from django.core.management.base import CommandError  # type: ignore[import]
+
+# Loads the application like a gunicorn worker and warms it up like the
+# gunicorn master does before forking.
+STARTUP_CODE = """
+from contact_form_prototype import wsgi
+if {warmup}:
+    from contact_form_prototype import warmup
+    print(warmup.format_report(warmup.run()))
+"""
+
+ImportTime = collections.namedtuple(
+    'ImportTime',
+    ['module', 'self_us', 'cumulative_us', 'level'],
+)
+
+
+def parse_import_times(output):
+    """Return the imports listed by ``python -X importtime``."""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # The header line.
+            continue
+        name = fields[2].rstrip()
+        module = name.lstrip()
+        imports.append(ImportTime(
+            module,
+            int(fields[0]),
+            int(fields[1]),
+            (len(name) - len(module) - 1) // 2,
+        ))
+    return imports
+
+
+def group_by_package(imports):
+    """Return the self time of the imports summed by top-level package."""
+    totals = collections.Counter()
+    for import_time in imports:
+        totals[import_time.module.split('.')[0]] += import_time.self_us
+    return totals
+
+
+class Command(BaseCommand):
+    """Start the application in a new interpreter and report import times."""
+
+    help = (  # noqa: WPS125
+        'Load the application in a new Python process with -X importtime, '
+        'then report the import time by package and the slowest modules.'
+    )
+
+    def add_arguments(self, parser):  # noqa: D102
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=15,
+            help='Number of packages and modules to list.',
+        )
+        parser.add_argument(
+            '--no-warmup',
+            action='store_true',
+            help='Only load the application, without warming it up.',
+        )
+
+    def handle(self, *args, **options):  # noqa: D102
+        completed = subprocess.run(  # noqa: S603
+            [
+                sys.executable,
+                '-X',
+                'importtime',
+                '-c',
+                STARTUP_CODE.format(warmup=not options['no_warmup']),
+            ],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+        )
+        if completed.returncode:
+            raise CommandError(
+                f'Loading the application failed:\n{completed.stderr}',
+            )
+        imports = parse_import_times(completed.stderr)
+        total = sum(import_time.self_us for import_time in imports)
+        self.stdout.write(
+            f'Imported {len(imports)} modules in {total / 1000:.0f} ms.',
+        )
+        if completed.stdout.strip():
+            self.stdout.write(completed.stdout.strip())
+
+        self.stdout.write(f'\n{"Package":<40} {"ms":>6}  share')
+        for package, self_us in group_by_package(imports).most_common(
+            options['limit'],
+        ):
+            self.stdout.write(
+                f'{package:<40} {self_us / 1000:>6.0f} '
+                f'{self_us / total:>6.1%}',
+            )
+
+        self.stdout.write(f'\n{"Module (with its imports)":<40} {"ms":>6}')
+        slowest = sorted(
+            imports,
+            key=lambda import_time: import_time.cumulative_us,
+            reverse=True,
+        )
+        for import_time in slowest[:options['limit']]:
+            self.stdout.write(
+                f'{import_time.module:<40} '
+                f'{import_time.cumulative_us / 1000:>6.0f}',
+            )
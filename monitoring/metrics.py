@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+"""Metrics of form, email, GraphQL and search traffic."""
+
+import contextlib
+import time
+
+from monitoring.registry import Counter, Histogram
+
+form_posts = Counter(
+    'forms_posts_total',
+    'POSTs to form pages by outcome.',
+    ['outcome'],
+)
+
+emails = Counter(
+    'forms_emails_total',
+    'Notification emails handed to the email backend by outcome.',
+    ['outcome'],
+)
+
+email_send_seconds = Histogram(
+    'forms_email_send_seconds',
+    'Time to hand a notification email to the email backend.',
+)
+
+graphql_requests = Counter(
+    'api_graphql_requests_total',
+    'GraphQL requests by outcome and response cache status.',
+    ['outcome', 'cache'],
+)
+
+graphql_seconds = Histogram(
+    'api_graphql_request_seconds',
+    'Time to answer a GraphQL request.',
+)
+
+search_seconds = Histogram(
+    'search_request_seconds',
+    'Time to search and paginate the results, without rendering.',
+)
+
+
+@contextlib.contextmanager
+def sending_email():
+    """Time sending an email and count it as sent or failed."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        emails.inc(outcome='failed')
+        raise
+    else:
+        emails.inc(outcome='sent')
+    finally:
+        email_send_seconds.observe(time.perf_counter() - started)
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+
+"""
+Counters and latency histograms shared by all worker processes.
+
+Every process adds to its own file in ``MONITORING_METRICS_DIR``, mapped
+into memory, so recording a value takes no system call and no lock shared
+with other processes. The files hold float values keyed by metric name and
+labels. :meth:`Registry.collect` sums the files of all processes, including
+the ones of workers that have exited, so counters never go down while the
+server runs. Empty the directory with :meth:`Registry.clear` when the server
+starts.
+
+File layout: 8 bytes holding the number of used bytes, then entries of a
+4 byte key length, the UTF-8 key padded to 8 bytes and an 8 byte float.
+Entries are written before the used size is updated, so readers never see
+half written entries.
+"""
+
+import contextlib
+import glob
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.conf import settings  # type: ignore[import]
+
+HEADER_SIZE = 8
+INITIAL_SIZE = 64 * 1024
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def make_key(name, labels):
+    """Return the key of a sample, labels in a stable order."""
+    return json.dumps([name, sorted(labels.items())])
+
+
+def get_padding(key_size):  # noqa: D103
+    return (8 - (4 + key_size) % 8) % 8
+
+
+def read_entries(data, used):
+    """Yield ``(key, value, offset)`` of the entries of a file."""
+    offset = HEADER_SIZE
+    while offset < used:
+        key_size = struct.unpack_from('i', data, offset)[0]
+        offset += 4
+        key = bytes(data[offset:offset + key_size]).decode('utf-8')
+        offset += key_size + get_padding(key_size)
+        yield key, struct.unpack_from('d', data, offset)[0], offset
+        offset += 8
+
+
+class MappedValues(object):
+    """Float values of one process, keyed by strings, in a mapped file."""
+
+    def __init__(self, path):  # noqa: D107
+        self.path = path
+        self._file = open(path, 'a+b')  # noqa: WPS515
+        size = os.fstat(self._file.fileno()).st_size
+        if size < INITIAL_SIZE:
+            self._file.truncate(INITIAL_SIZE)
+            size = INITIAL_SIZE
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._used = struct.unpack_from('i', self._map, 0)[0]
+        if not self._used:
+            self._used = HEADER_SIZE
+            struct.pack_into('i', self._map, 0, self._used)
+        self._offsets = {
+            key: offset
+            for key, _, offset in read_entries(self._map, self._used)
+        }
+
+    def add(self, key, amount):
+        """Add to the value of a key, starting from 0."""
+        offset = self._offsets.get(key)
+        if offset is None:
+            offset = self._append(key)
+        value = struct.unpack_from('d', self._map, offset)[0]
+        struct.pack_into('d', self._map, offset, value + amount)
+
+    def _append(self, key):
+        encoded = key.encode('utf-8')
+        size = 4 + len(encoded) + get_padding(len(encoded)) + 8
+        if self._used + size > len(self._map):
+            self._grow(self._used + size)
+        struct.pack_into(
+            f'i{len(encoded)}s{get_padding(len(encoded))}xd',
+            self._map,
+            self._used,
+            len(encoded),
+            encoded,
+            0,
+        )
+        offset = self._used + size - 8
+        self._used += size
+        struct.pack_into('i', self._map, 0, self._used)
+        self._offsets[key] = offset
+        return offset
+
+    def _grow(self, minimum):
+        size = len(self._map)
+        while size < minimum:
+            size *= 2
+        self._map.close()
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+    def close(self):  # noqa: D102
+        self._map.close()
+        self._file.close()
+
+
+def read_file(path):
+    """Return the values of a file written by any process."""
+    with open(path, 'rb') as values_file:
+        data = values_file.read()
+    if len(data) < HEADER_SIZE:
+        return {}
+    used = struct.unpack_from('i', data, 0)[0]
+    return {key: value for key, value, _ in read_entries(data, used)}
+
+
+def format_value(value):  # noqa: D103
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+def escape_label_value(label_value):  # noqa: D103
+    return str(label_value).replace('\\', r'\\').replace(
+        '\n', r'\n',
+    ).replace('"', r'\"')
+
+
+def format_labels(labels):
+    """Return labels in the Prometheus text format."""
+    if not labels:
+        return ''
+    return '{{{0}}}'.format(','.join(
+        f'{name}="{escape_label_value(label_value)}"'
+        for name, label_value in labels
+    ))
+
+
+class Registry(object):
+    """Metrics of the project and the values of this process."""
+
+    def __init__(self):  # noqa: D107
+        self.metrics = []
+        self._lock = threading.Lock()
+        self._values = None
+        self._values_key = None
+
+    def register(self, metric):  # noqa: D102
+        self.metrics.append(metric)
+        return metric
+
+    def get_values(self):
+        """Return the values of this process, opened after forks."""
+        values_key = (os.getpid(), settings.MONITORING_METRICS_DIR)
+        if self._values_key != values_key:
+            if self._values is not None:
+                self._values.close()
+            directory = settings.MONITORING_METRICS_DIR
+            os.makedirs(directory, exist_ok=True)
+            self._values = MappedValues(
+                os.path.join(directory, f'metrics-{os.getpid()}.db'),
+            )
+            self._values_key = values_key
+        return self._values
+
+    def add(self, name, labels, amount):
+        """Add to the value of a sample in this process."""
+        key = make_key(name, labels)
+        with self._lock:
+            self.get_values().add(key, amount)
+
+    def collect(self):
+        """Return the values of all processes, keyed by name and labels."""
+        totals = {}
+        pattern = os.path.join(settings.MONITORING_METRICS_DIR, 'metrics-*.db')
+        for path in glob.glob(pattern):
+            for key, value in read_file(path).items():
+                name, labels = json.loads(key)
+                sample = (name, tuple(tuple(label) for label in labels))
+                totals[sample] = totals.get(sample, 0) + value
+        return totals
+
+    def render(self):
+        """Return all metrics in the Prometheus text format."""
+        totals = self.collect()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(
+                f'{name}{format_labels(labels)} {format_value(value)}'
+                for name, labels, value in metric.get_samples(totals)
+            )
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        """Remove the values of all processes."""
+        with self._lock:
+            if self._values is not None:
+                self._values.close()
+            self._values = None
+            self._values_key = None
+            pattern = os.path.join(
+                settings.MONITORING_METRICS_DIR, 'metrics-*.db',
+            )
+            for path in glob.glob(pattern):
+                os.remove(path)
+
+
+registry = Registry()
+
+
+def check_labels(metric, labels):
+    """Fail if a sample has other labels than its metric."""
+    if set(labels) != set(metric.labelnames):
+        raise ValueError(
+            f'{metric.name} takes the labels {metric.labelnames}, '
+            f'not {tuple(labels)}.',
+        )
+
+
+class Counter(object):
+    """Monotonically increasing count."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):  # noqa: D107
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        registry.register(self)
+
+    def inc(self, amount=1, **labels):  # noqa: D102
+        check_labels(self, labels)
+        registry.add(self.name, labels, amount)
+
+    def get_samples(self, totals):
+        """Return ``(name, labels, value)`` of the samples of all processes."""
+        return sorted(
+            (name, labels, value)
+            for (name, labels), value in totals.items()
+            if name == self.name
+        )
+
+
+class Histogram(object):
+    """Distribution of observed values, e.g. latencies in seconds."""
+
+    kind = 'histogram'
+
+    def __init__(  # noqa: D107
+        self,
+        name,
+        documentation,
+        labelnames=(),
+        buckets=DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+        registry.register(self)
+
+    def observe(self, value, **labels):  # noqa: D102
+        check_labels(self, labels)
+        bound = next(bound for bound in self.buckets if value <= bound)
+        bucket_labels = dict(labels, le=format_value(bound))
+        registry.add(f'{self.name}_bucket', bucket_labels, 1)
+        registry.add(f'{self.name}_sum', labels, value)
+        registry.add(f'{self.name}_count', labels, 1)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe the duration of a block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def get_samples(self, totals):
+        """Return ``(name, labels, value)`` with cumulative buckets."""
+        bucket_name = f'{self.name}_bucket'
+        sum_name = f'{self.name}_sum'
+        count_name = f'{self.name}_count'
+        samples = []
+        for labels in sorted(key[1] for key in totals if key[0] == count_name):
+            cumulative = 0
+            for bound in self.buckets:
+                bucket_labels = labels + (('le', format_value(bound)),)
+                cumulative += totals.get(
+                    (bucket_name, tuple(sorted(bucket_labels))), 0,
+                )
+                samples.append((bucket_name, bucket_labels, cumulative))
+            samples.append((sum_name, labels, totals[(sum_name, labels)]))
+            samples.append((count_name, labels, totals[(count_name, labels)]))
+        return samples
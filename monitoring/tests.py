@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+
+"""Test for the monitoring app."""
+
+import copy
+import io
+import json
+import logging
+from logging import config as logging_config
+import multiprocessing
+import re
+
+from django.core import management as djmgmt  # type: ignore[import]
+from django.db import connection  # type: ignore[import]
+import pytest  # type: ignore[import]
+
+from api import models as api_models
+from api import persisted
+from api.tests import RELATIONS_QUERY
+from contact_form_prototype import warmup
+from contact_form_prototype.settings import base as base_settings
+from content.models import SomePage
+from forms import formcache
+from home.models import HomePage
+from monitoring import metrics
+from monitoring import registry
+from monitoring import timing
+from monitoring.management.commands import report_import_times
+from search import hits
+
+
+@pytest.fixture(autouse=True)
+def monitoring_caplog(caplog):  # noqa: D103
+    # The monitoring logger does not propagate to the root logger.
+    monitoring_logger = logging.getLogger('monitoring')
+    monitoring_logger.addHandler(caplog.handler)
+    yield caplog
+    monitoring_logger.removeHandler(caplog.handler)
+
+
+@pytest.fixture(autouse=True)
+def no_hit_flusher(monkeypatch):  # noqa: D103
+    # Searches buffer their hits, which must not be flushed at exit.
+    monkeypatch.setattr(hits.Flusher, 'ensure_started', lambda: None)
+    yield
+    hits.buffer.take()
+
+
+def get_sample(name, **labels):  # noqa: D103
+    return registry.registry.collect().get(
+        (name, tuple(sorted(labels.items()))),
+        0,
+    )
+
+
+def count_graphql_requests():  # noqa: D103
+    metrics.graphql_requests.inc(outcome='ok', cache='off')
+
+
+@pytest.fixture
+def content_pages(contact_form_page_w_email_field):  # noqa: D103
+    home_page = HomePage.objects.first()
+    for index in range(5):
+        home_page.add_child(instance=SomePage(
+            title=f'Some page {index}',
+            intro='<p>Text</p>',
+            contact_form=contact_form_page_w_email_field,
+        ))
+
+
+class TestServerTiming(object):
+    """Test the Server-Timing middleware."""
+
+    @pytest.fixture(autouse=True)
+    def static_files(self, settings):  # noqa: D102
+        settings.STATICFILES_STORAGE = (
+            'django.contrib.staticfiles.storage.StaticFilesStorage'
+        )
+
+    def test_header(self, client, db):  # noqa: D102
+        res = client.get('/search/', {'query': 'page'})
+
+        metrics = dict(
+            metric.strip().split(';', 1)
+            for metric in res['Server-Timing'].split(',')
+        )
+        assert set(metrics) == {'db', 'template', 'total'}
+        assert metrics['db'].endswith(
+            f'desc="{res.wsgi_request.metrics.queries} queries"',
+        )
+        assert res.wsgi_request.metrics.queries > 0
+        assert res.wsgi_request.metrics.template_time > 0
+
+    def test_log_line(self, client, db, caplog):  # noqa: D102
+        caplog.set_level(logging.INFO, logger='monitoring.timing')
+
+        client.get('/search/', {'query': 'page'})
+
+        line = json.loads(caplog.records[-1].getMessage())
+        assert line['route'] == 'GET search'
+        assert line['path'] == '/search/'
+        assert line['status'] == 200
+        assert line['queries'] > 0
+        assert line['total_ms'] >= line['template_ms']
+
+    def test_log_line_with_base_logging(self, client, db, settings):  # noqa: D102, E501
+        # Production settings keep the root logger at WARNING.
+        logging_settings = copy.deepcopy(base_settings.LOGGING)
+        stream = io.StringIO()
+        logging_settings['handlers']['console']['stream'] = stream
+        logging_config.dictConfig(logging_settings)
+        try:
+            client.get('/search/', {'query': 'page'})
+        finally:
+            logging_config.dictConfig(settings.LOGGING)
+
+        assert '"route": "GET search"' in stream.getvalue()
+
+    def test_disabled(self, client, db, settings):  # noqa: D102
+        settings.MONITORING_SERVER_TIMING = False
+
+        res = client.get('/search/', {'query': 'page'})
+
+        assert 'Server-Timing' not in res
+
+
+class TestQueryBudgets(object):
+    """Test the query budgets of routes."""
+
+    @pytest.fixture(autouse=True)
+    def no_caches(self, settings):  # noqa: D102
+        settings.STATICFILES_STORAGE = (
+            'django.contrib.staticfiles.storage.StaticFilesStorage'
+        )
+        settings.API_GRAPHQL_CACHE = False
+        settings.SEARCH_FIRST_PAGE_CACHE_TIMEOUT = 0
+
+    def test_exceeded_in_strict_mode(self, client, db, settings):  # noqa: D102
+        settings.MONITORING_QUERY_BUDGETS = {'GET search': 0}
+
+        with pytest.raises(timing.QueryBudgetExceeded):
+            client.get('/search/', {'query': 'page'})
+
+    def test_exceeded_is_logged(  # noqa: D102
+        self,
+        client,
+        db,
+        settings,
+        caplog,
+    ):
+        settings.MONITORING_QUERY_BUDGETS = {'GET search': 0}
+        settings.MONITORING_QUERY_BUDGETS_STRICT = False
+
+        res = client.get('/search/', {'query': 'page'})
+
+        assert res.status_code == 200
+        assert 'GET search ran' in caplog.records[-1].getMessage()
+
+    def test_query_budget(self, db, settings):  # noqa: D102
+        settings.MONITORING_QUERY_BUDGETS = {'GET search': 1}
+
+        with timing.query_budget('GET search') as metrics:
+            HomePage.objects.count()
+        assert metrics.queries == 1
+
+        with pytest.raises(timing.QueryBudgetExceeded):
+            with timing.query_budget('GET search'):
+                HomePage.objects.count()
+                HomePage.objects.count()
+
+    def test_route_without_budget(self, db):  # noqa: D102
+        with timing.query_budget('GET unknown'):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+
+    def test_form_post(  # noqa: D102
+        self,
+        client,
+        contact_form_page_w_email_field,
+        content_pages,
+    ):
+        res = client.post(contact_form_page_w_email_field.url, {
+            'email': 'someone@example.com',
+            'spammer_jammer': '',
+        })
+
+        assert res.status_code == 200
+        assert res.wsgi_request.metrics.route == 'POST wagtail_serve'
+
+    def test_graphql(self, client, content_pages):  # noqa: D102
+        res = client.post(
+            '/graphql',
+            json.dumps({'query': RELATIONS_QUERY}),
+            content_type='application/json',
+        )
+
+        assert 'errors' not in res.json()
+        assert res.wsgi_request.metrics.route == 'POST graphql'
+
+    def test_search(self, client, content_pages):  # noqa: D102
+        res = client.get('/search/', {'query': 'page'})
+
+        assert len(res.context['search_results']) == 5
+        assert res.wsgi_request.metrics.route == 'GET search'
+
+
+class TestMetricsRegistry(object):
+    """Test counters and histograms shared by processes."""
+
+    def test_values_of_processes_are_summed(self):  # noqa: D102
+        metrics.graphql_requests.inc(outcome='ok', cache='off')
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=count_graphql_requests) for _ in range(2)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        assert get_sample(
+            'api_graphql_requests_total', outcome='ok', cache='off',
+        ) == 3
+
+    def test_file_grows(self, settings, tmp_path):  # noqa: D102
+        for number in range(2000):
+            metrics.form_posts.inc(number, outcome=f'outcome-{number}')
+
+        registry.registry.clear()
+        assert get_sample('forms_posts_total', outcome='outcome-1999') == 0
+
+        metrics.form_posts.inc(2, outcome='valid')
+        assert get_sample('forms_posts_total', outcome='valid') == 2
+
+    def test_labels_are_checked(self):  # noqa: D102
+        with pytest.raises(ValueError):
+            metrics.form_posts.inc(state='valid')
+
+    def test_render(self):  # noqa: D102
+        metrics.form_posts.inc(outcome='sp"am')
+        metrics.search_seconds.observe(0.02)
+        metrics.search_seconds.observe(20)
+
+        lines = registry.registry.render().splitlines()
+
+        assert '# TYPE forms_posts_total counter' in lines
+        assert 'forms_posts_total{outcome="sp\\"am"} 1.0' in lines
+        assert '# TYPE search_request_seconds histogram' in lines
+        assert 'search_request_seconds_bucket{le="0.01"} 0.0' in lines
+        assert 'search_request_seconds_bucket{le="0.025"} 1.0' in lines
+        assert 'search_request_seconds_bucket{le="10.0"} 1.0' in lines
+        assert 'search_request_seconds_bucket{le="+Inf"} 2.0' in lines
+        assert 'search_request_seconds_sum 20.02' in lines
+        assert 'search_request_seconds_count 2.0' in lines
+
+
+class TestMetricsWiring(object):
+    """Test the metrics recorded by forms, GraphQL and search."""
+
+    @pytest.fixture(autouse=True)
+    def no_caches(self, settings):  # noqa: D102
+        settings.STATICFILES_STORAGE = (
+            'django.contrib.staticfiles.storage.StaticFilesStorage'
+        )
+        settings.API_GRAPHQL_CACHE = False
+
+    def test_form_posts(  # noqa: D102
+        self,
+        client,
+        contact_form_page_w_email_field,
+        mailoutbox,
+    ):
+        url = contact_form_page_w_email_field.url
+        client.post(url, {'email': 'someone@example.com', 'spammer_jammer': ''})
+        client.post(url, {'email': 'invalid', 'spammer_jammer': ''})
+        client.post(url, {'email': 'someone@example.com'})
+        client.post(url, {'email': 'x', 'spammer_jammer': 'Buy now'})
+
+        for outcome in ('valid', 'invalid', 'malformed', 'spam'):
+            assert get_sample('forms_posts_total', outcome=outcome) == 1
+        assert get_sample('forms_emails_total', outcome='sent') == 1
+        assert get_sample('forms_email_send_seconds_count') == 1
+
+    def test_graphql(self, client, content_pages):  # noqa: D102
+        client.post(
+            '/graphql',
+            json.dumps({'query': RELATIONS_QUERY}),
+            content_type='application/json',
+        )
+        client.post(
+            '/graphql',
+            json.dumps({'query': '{ unknown }'}),
+            content_type='application/json',
+        )
+
+        assert get_sample(
+            'api_graphql_requests_total', outcome='ok', cache='off',
+        ) == 1
+        assert get_sample(
+            'api_graphql_requests_total', outcome='error', cache='off',
+        ) == 1
+        assert get_sample('api_graphql_request_seconds_count') == 2
+
+    def test_search(self, client, db):  # noqa: D102
+        client.get('/search/', {'query': 'page'})
+
+        assert get_sample('search_request_seconds_count') == 1
+
+
+class TestMetricsView(object):
+    """Test the Prometheus endpoint."""
+
+    def test_not_found_without_token(self, client, db, settings):  # noqa: D102
+        settings.MONITORING_METRICS_TOKEN = None
+        settings.STATICFILES_STORAGE = (
+            'django.contrib.staticfiles.storage.StaticFilesStorage'
+        )
+
+        assert client.get('/metrics').status_code == 404
+
+    def test_token_required(self, client, settings):  # noqa: D102
+        settings.MONITORING_METRICS_TOKEN = 'secret'
+
+        res = client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong')
+
+        assert res.status_code == 401
+        assert res['WWW-Authenticate'] == 'Bearer'
+
+    def test_metrics(self, client, settings):  # noqa: D102
+        settings.MONITORING_METRICS_TOKEN = 'secret'
+        metrics.form_posts.inc(outcome='valid')
+
+        res = client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+
+        assert res.status_code == 200
+        assert res['Content-Type'].startswith('text/plain; version=0.0.4')
+        assert 'forms_posts_total{outcome="valid"} 1.0' in res.content.decode()
+
+
+IMPORT_TIMES = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |     django.utils.version
+import time:       300 |        420 |   django.utils
+import time:       500 |        920 | django
+import time:        80 |         80 | wagtail
+"""
+
+
+class TestWarmup(object):
+    """Test warming up the application before forking."""
+
+    def test_run(self, contact_form_page_w_email_field):  # noqa: D102
+        formcache.form_class_cache.clear()
+        query = '{ pages { id } }'
+        api_models.PersistedQuery.objects.create(
+            sha256_hash=persisted.get_hash(query),
+            query=query,
+            source=api_models.PersistedQuery.SOURCE_BUILD,
+        )
+        persisted.document_cache.clear()
+
+        results = warmup.run()
+
+        assert [step.name for step in results] == ['start'] + [
+            name for name, _ in warmup.STEPS
+        ]
+        assert not [step for step in results if step.error]
+        assert formcache.form_class_cache.stats()['size'] == 1
+        assert persisted.document_cache.get(persisted.get_hash(query))
+        assert warmup.format_report(results).startswith('Warmed up in')
+
+    def test_failed_step_is_skipped(self):  # noqa: D102
+        def fail():  # noqa: WPS430
+            raise RuntimeError('Database is not ready.')
+
+        results = warmup.run([('fail', fail), ('sites', lambda: None)])
+
+        assert isinstance(results[1].error, RuntimeError)
+        assert results[2].error is None
+        assert re.search(
+            r'fail \d+ ms \(failed\), sites',
+            warmup.format_report(results),
+        )
+
+    def test_parse_import_times(self):  # noqa: D102
+        imports = report_import_times.parse_import_times(IMPORT_TIMES)
+
+        assert [
+            (import_time.module, import_time.level) for import_time in imports
+        ] == [
+            ('django.utils.version', 2),
+            ('django.utils', 1),
+            ('django', 0),
+            ('wagtail', 0),
+        ]
+        assert report_import_times.group_by_package(imports) == {
+            'django': 920,
+            'wagtail': 80,
+        }
+
+    def test_report_import_times(self):  # noqa: D102
+        stdout = io.StringIO()
+
+        djmgmt.call_command(
+            'report_import_times',
+            '--no-warmup',
+            '--limit',
+            '3',
+            stdout=stdout,
+        )
+
+        output = stdout.getvalue()
+        assert output.startswith('Imported ')
+        assert 'contact_form_prototype.wsgi' in output
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+"""
+Time requests and count their SQL queries.
+
+:class:`ServerTimingMiddleware` records the number of SQL queries of every
+request and the time spent in the database, rendering templates and in
+total. The numbers are sent in a ``Server-Timing`` header, which browsers
+show in their developer tools, and logged as one line of JSON. Database time
+includes the queries run while rendering templates.
+
+Routes, i.e. the method and URL name of a request, can be given a budget of
+SQL queries in ``MONITORING_QUERY_BUDGETS``. Requests over budget are logged
+as warnings, or fail with :class:`QueryBudgetExceeded` when
+``MONITORING_QUERY_BUDGETS_STRICT`` is enabled, as it is in the tests.
+Code that is not served through the middleware can be checked against a
+budget with :func:`query_budget`.
+
+Form POSTs served on the event loop by :mod:`forms.asgi` skip the
+middleware. Their metrics are kept in :data:`request_metrics`, so that the
+threads of :mod:`forms.aio` record the queries they run, and are sent and
+logged with :func:`report`.
+"""
+
+import contextlib
+import contextvars
+import json
+import logging
+import time
+
+from django.conf import settings  # type: ignore[import]
+from django.db import connections  # type: ignore[import]
+
+logger = logging.getLogger(__name__)
+
+# Metrics of the request served on the event loop, see forms.aio.
+request_metrics = contextvars.ContextVar('request_metrics')
+
+
+class QueryBudgetExceeded(Exception):
+    """A request ran more SQL queries than the budget of its route."""
+
+
+class RequestMetrics(object):
+    """Query count and timings of one request."""
+
+    def __init__(self, route=None):  # noqa: D107
+        self.route = route
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.total_time = 0.0
+        self.template_started = None
+
+    def __call__(self, execute, sql, params, many, context):
+        """Count and time a query, as a database execute wrapper."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+    def start_template(self):  # noqa: D102
+        self.template_started = time.perf_counter()
+
+    def end_template(self, response):
+        """Add the rendering time, as a post render callback."""
+        self.template_time += time.perf_counter() - self.template_started
+
+    def get_header(self):
+        """Return the value of the ``Server-Timing`` header."""
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'template;dur={self.template_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ])
+
+    def as_dict(self):
+        """Return the metrics, times in milliseconds."""
+        return {
+            'route': self.route,
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 1),
+            'template_ms': round(self.template_time * 1000, 1),
+            'total_ms': round(self.total_time * 1000, 1),
+        }
+
+
+@contextlib.contextmanager
+def record_queries(metrics):
+    """Count and time the queries of all database connections in a block."""
+    with contextlib.ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(metrics))
+        yield metrics
+
+
+def get_route(request):
+    """Return ``'<method> <URL name>'`` of a resolved request, or ``None``."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    return f'{request.method} {match.url_name or match.view_name}'
+
+
+def check_budget(metrics, strict=None):
+    """Warn or fail if a request ran more queries than its route may."""
+    budget = settings.MONITORING_QUERY_BUDGETS.get(metrics.route)
+    if budget is None or metrics.queries <= budget:
+        return
+    message = (
+        f'{metrics.route} ran {metrics.queries} SQL queries, '
+        f'the budget is {budget}.'
+    )
+    if strict is None:
+        strict = settings.MONITORING_QUERY_BUDGETS_STRICT
+    if strict:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+@contextlib.contextmanager
+def query_budget(route):
+    """Fail if a block runs more queries than the budget of a route."""
+    metrics = RequestMetrics(route)
+    with record_queries(metrics):
+        yield metrics
+    check_budget(metrics, strict=True)
+
+
+def report(request, response, metrics):
+    """Send the metrics of a request in a header, log and check them."""
+    response['Server-Timing'] = metrics.get_header()
+    logger.info(json.dumps({
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        **metrics.as_dict(),
+    }))
+    check_budget(metrics)
+
+
+class ServerTimingMiddleware(object):
+    """Record, send and log the query count and timings of requests."""
+
+    def __init__(self, get_response):  # noqa: D107
+        self.get_response = get_response
+
+    def __call__(self, request):  # noqa: D102
+        if not settings.MONITORING_SERVER_TIMING:
+            return self.get_response(request)
+        request.metrics = RequestMetrics()
+        started = time.perf_counter()
+        with record_queries(request.metrics):
+            response = self.get_response(request)
+        request.metrics.total_time = time.perf_counter() - started
+        request.metrics.route = get_route(request)
+        report(request, response, request.metrics)
+        return response
+
+    def process_template_response(self, request, response):  # noqa: D102
+        metrics = getattr(request, 'metrics', None)
+        if metrics is not None:
+            # Template responses are rendered right after this hook.
+            metrics.start_template()
+            response.add_post_render_callback(metrics.end_template)
+        return response
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+
+"""Define URLs of the monitoring app."""
+
+from django.urls import path  # type: ignore[import]
+
+from monitoring import views
+
+urlpatterns = [
+    path('metrics', views.metrics_view, name='metrics'),
+]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+"""Expose the metrics to Prometheus."""
+
+import hmac
+
+from django import http as djhttp  # type: ignore[import]
+from django.conf import settings  # type: ignore[import]
+
+from monitoring import metrics  # noqa: F401
+from monitoring.registry import CONTENT_TYPE, registry
+
+
+def metrics_view(request):
+    """Return all metrics to requests with the bearer token."""
+    token = settings.MONITORING_METRICS_TOKEN
+    if not token:
+        raise djhttp.Http404
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if not hmac.compare_digest(
+        authorization.encode('utf-8'),
+        f'Bearer {token}'.encode('utf-8'),
+    ):
+        response = djhttp.HttpResponse(status=401)
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    return djhttp.HttpResponse(registry.render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+
+"""Configure the search app."""
+
+from django.apps import AppConfig  # type: ignore[import]
+
+
+class SearchConfig(AppConfig):
+    """Connect the signal receivers of the search app."""
+
+    name = 'search'
+
+    def ready(self):  # noqa: D102
+        from search import signals  # noqa: F401, WPS433
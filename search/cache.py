@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""
+Caches of search result counts and first result pages.
+
+Both are stored in Django's default cache, keyed by the normalised query
+string and a generation shared by all processes. Publishing, unpublishing
+or deleting pages and rebuilding the index bump the generation, so cached
+results never outlive the content they were computed from.
+
+Total counts are only computed when ``SEARCH_RESULT_COUNTS`` is enabled.
+The first page of a query is cached for ``SEARCH_FIRST_PAGE_CACHE_TIMEOUT``
+seconds once the query has been searched ``SEARCH_FIRST_PAGE_CACHE_MIN_HITS``
+times within that time.
+"""
+
+import hashlib
+
+from django.conf import settings  # type: ignore[import]
+from django.core.cache import cache as djcache  # type: ignore[import]
+from wagtail.search.utils import normalise_query_string  # type: ignore[import]
+
+from api.cache import Generation
+
+generation = Generation(settings.SEARCH_CACHE_GENERATION_FILE)
+
+
+def make_key(kind, query_string):
+    """Return the cache key of a query for the current generation."""
+    query_hash = hashlib.sha1(  # noqa: S303
+        normalise_query_string(query_string).encode('utf-8'),
+    ).hexdigest()
+    current = generation.current()
+    version = 'none' if current is None else '{0}.{1}'.format(*current)
+    return f'search:{kind}:{version}:{query_hash}'
+
+
+def get_count(query_string, results):
+    """Return the total number of results, cached per query."""
+    key = make_key('count', query_string)
+    count = djcache.get(key)
+    if count is None:
+        count = results.count()
+        djcache.set(key, count, settings.SEARCH_RESULT_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def is_popular(query_string):
+    """Count a search of the query, return whether it is searched often."""
+    key = make_key('searches', query_string)
+    timeout = settings.SEARCH_FIRST_PAGE_CACHE_TIMEOUT
+    djcache.add(key, 0, timeout)
+    try:
+        searches = djcache.incr(key)
+    except ValueError:
+        # Expired between add and incr.
+        return False
+    return searches >= settings.SEARCH_FIRST_PAGE_CACHE_MIN_HITS
+
+
+def get_first_page(query_string, paginate):
+    """Return the first page of a query, cached if the query is popular."""
+    timeout = settings.SEARCH_FIRST_PAGE_CACHE_TIMEOUT
+    if not timeout:
+        return paginate()
+    key = make_key('first-page', query_string)
+    page = djcache.get(key)
+    if page is not None:
+        return page
+    page = paginate()
+    if is_popular(query_string):
+        djcache.set(key, page, timeout)
+    return page
+
+
+def invalidate():
+    """Drop the cached counts and pages of all processes."""
+    generation.bump()
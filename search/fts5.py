@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+
+"""
+Wagtail search backend on SQLite FTS5.
+
+The default database backend turns every search into ``LIKE '%term%'``
+scans of the searched tables. This backend keeps the searchable text of
+every indexed object in :class:`search.models.IndexEntry`, with an FTS5
+table over it, and ranks matches with BM25::
+
+    WAGTAILSEARCH_BACKENDS = {
+        'default': {
+            'BACKEND': 'search.fts5',
+            'TITLE_WEIGHT': 2.0,
+        },
+    }
+
+Titles and the other search fields go into separate columns, the title
+column weighing ``TITLE_WEIGHT`` times as much. Wagtail updates the index
+whenever an indexed object is saved or deleted, which includes publishing
+and unpublishing pages. ``manage.py rebuild_search_index`` (or Wagtail's
+``update_index``) indexes existing objects.
+"""
+
+import warnings
+
+from django.contrib.contenttypes import models as djctm  # type: ignore[import]
+from django.db import NotSupportedError  # type: ignore[import]
+from django.db import connection as djconnection  # type: ignore[import]
+from django.db import models as djm  # type: ignore[import]
+from django.db import transaction  # type: ignore[import]
+from django.db.models.functions import Cast  # type: ignore[import]
+from django.utils.encoding import force_str  # type: ignore[import]
+from django.utils.html import strip_tags  # type: ignore[import]
+from wagtail.search import index as wsi  # type: ignore[import]
+from wagtail.search import query as wsq  # type: ignore[import]
+from wagtail.search.backends import base as wsbb  # type: ignore[import]
+
+from search.models import IndexEntry
+
+FTS_TABLE = 'search_indexentry_fts'
+RANK_FIELD = '_fts_rank'
+MATCH_ALL = '_ALL_'
+MATCH_NONE = '_NONE_'
+
+
+def get_root_model(model):
+    """Return the topmost concrete model, whose primary keys are shared."""
+    model = model._meta.concrete_model
+    parents = model._meta.get_parent_list()
+    return parents[-1] if parents else model
+
+
+def get_content_type_id(model):
+    """Return id of the content type index entries of the model are under."""
+    return djctm.ContentType.objects.get_for_model(get_root_model(model)).pk
+
+
+def prepare_value(value):
+    """Return the indexed text of a search field value."""
+    if isinstance(value, (list, tuple)):
+        return ' '.join(prepare_value(item) for item in value)
+    if isinstance(value, dict):
+        return ' '.join(prepare_value(item) for item in value.values())
+    if value is None:
+        return ''
+    return strip_tags(force_str(value))
+
+
+def iter_field_texts(obj, search_fields):
+    """Yield ``(field name, text)`` of the search fields of an object."""
+    for field in search_fields:
+        if isinstance(field, wsi.SearchField):
+            yield field.field_name, prepare_value(field.get_value(obj))
+        elif isinstance(field, wsi.RelatedFields):
+            related = field.get_value(obj)
+            if related is None:
+                continue
+            if isinstance(related, djm.Manager):
+                related_objects = related.all()
+            else:
+                related_objects = [related() if callable(related) else related]
+            for related_object in related_objects:
+                yield from iter_field_texts(related_object, field.fields)
+
+
+def get_document(obj):
+    """Return the ``(title, body)`` texts of an object."""
+    titles = []
+    bodies = []
+    for field_name, text in iter_field_texts(obj, obj.get_search_fields()):
+        text = text.strip()
+        if text:
+            (titles if field_name == 'title' else bodies).append(text)
+    return '\n'.join(titles), '\n'.join(bodies)
+
+
+class FTS5Index(object):
+    """The one index of all models, on ``IndexEntry`` and its FTS5 table."""
+
+    name = 'search_indexentry'
+
+    def __init__(self, backend):  # noqa: D107
+        if djconnection.vendor != 'sqlite':
+            raise NotSupportedError(
+                'The FTS5 search backend needs an SQLite database.',
+            )
+        self.backend = backend
+
+    def add_model(self, model):  # noqa: D102
+        pass  # noqa: WPS420
+
+    def refresh(self):  # noqa: D102
+        pass  # noqa: WPS420
+
+    def add_item(self, obj):  # noqa: D102
+        self.add_items(type(obj), [obj])
+
+    def add_items(self, model, objs):
+        """Insert or update the entries of the objects."""
+        if not model.get_search_fields():
+            return
+        content_type_id = get_content_type_id(model)
+        documents = {force_str(obj.pk): get_document(obj) for obj in objs}
+        if not documents:
+            return
+        entries = {
+            entry.object_id: entry
+            for entry in IndexEntry.objects.filter(
+                content_type_id=content_type_id,
+                object_id__in=documents,
+            )
+        }
+        changed = []
+        for object_id, entry in entries.items():
+            # Rewriting unchanged text would only churn the FTS index.
+            if (entry.title, entry.body) != documents[object_id]:
+                entry.title, entry.body = documents[object_id]
+                changed.append(entry)
+        with transaction.atomic():
+            IndexEntry.objects.bulk_update(changed, ['title', 'body'])
+            IndexEntry.objects.bulk_create([
+                IndexEntry(
+                    content_type_id=content_type_id,
+                    object_id=object_id,
+                    title=title,
+                    body=body,
+                )
+                for object_id, (title, body) in documents.items()
+                if object_id not in entries
+            ])
+
+    def delete_item(self, obj):  # noqa: D102
+        IndexEntry.objects.filter(
+            content_type_id=get_content_type_id(type(obj)),
+            object_id=force_str(obj.pk),
+        ).delete()
+
+    def delete_stale_entries(self):
+        """Delete the entries of objects that do not exist anymore."""
+        deleted = 0
+        for model in wsi.get_indexed_models():
+            if model._meta.parents:
+                continue
+            deleted += IndexEntry.objects.filter(
+                content_type_id=get_content_type_id(model),
+            ).exclude(
+                object_id__in=model._default_manager.annotate(
+                    indexed_id=Cast('pk', djm.TextField()),
+                ).values('indexed_id'),
+            ).delete()[0]
+        return deleted
+
+    def execute_command(self, command):
+        """Run an FTS5 command like ``optimize`` or ``rebuild``."""
+        with djconnection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES (%s)',
+                [command],
+            )
+
+    def rebuild(self, chunk_size=1000):
+        """Index all indexed objects again and return how many there are."""
+        self.delete_stale_entries()
+        indexed = 0
+        for model in wsi.get_indexed_models():
+            queryset = model.get_indexed_objects().order_by('pk')
+            last_pk = None
+            while True:  # noqa: WPS457
+                chunk = queryset
+                if last_pk is not None:
+                    chunk = chunk.filter(pk__gt=last_pk)
+                objs = list(chunk[:chunk_size])
+                if not objs:
+                    break
+                self.add_items(model, objs)
+                indexed += len(objs)
+                last_pk = objs[-1].pk
+        self.execute_command('optimize')
+        return indexed
+
+
+class FTS5SearchRebuilder(object):
+    """Rebuild the index in place, so searches keep working meanwhile."""
+
+    def __init__(self, index):  # noqa: D107
+        self.index = index
+
+    def start(self):  # noqa: D102
+        self.index.delete_stale_entries()
+        return self.index
+
+    def finish(self):  # noqa: D102
+        self.index.execute_command('optimize')
+
+
+def quote(term):
+    """Return term as an FTS5 string, so it is never parsed as syntax."""
+    return '"{0}"'.format(term.replace('"', '""'))
+
+
+class FTS5SearchQueryCompiler(wsbb.BaseSearchQueryCompiler):
+    """Compile Wagtail search queries to FTS5 MATCH expressions."""
+
+    DEFAULT_OPERATOR = 'and'
+
+    def _process_lookup(self, field, lookup, value):
+        # Filters are applied by the queryset itself, this only validates.
+        return djm.Q(**{
+            f'{field.get_attname(self.queryset.model)}__{lookup}': value,
+        })
+
+    def _connect_filters(self, filters, connector, negated):
+        return None
+
+    def get_match_expression(self):
+        """Return the MATCH expression, MATCH_ALL or MATCH_NONE."""
+        expression = self.build_match(self.query)
+        if expression in {MATCH_ALL, MATCH_NONE} or not self.fields:
+            return expression
+        columns = {
+            'title' if field_name == 'title' else 'body'
+            for field_name in self.fields
+        }
+        return '{{{0}}} : ({1})'.format(' '.join(sorted(columns)), expression)
+
+    def build_match(self, query):  # noqa: C901, WPS212, WPS231
+        """Return the MATCH expression of a query node."""
+        if isinstance(query, wsq.MatchAll):
+            return MATCH_ALL
+        if isinstance(query, wsq.PlainText):
+            terms = [quote(term) for term in query.query_string.split()]
+            if not terms:
+                return MATCH_NONE
+            if self.partial_match:
+                # Search as you type: the last term may be incomplete.
+                terms[-1] = f'{terms[-1]} *'
+            operator = ' AND ' if query.operator == 'and' else ' OR '
+            return '({0})'.format(operator.join(terms))
+        if isinstance(query, wsq.Phrase):
+            return quote(query.query_string)
+        if isinstance(query, wsq.Boost):
+            warnings.warn(
+                'The FTS5 search backend does not support boosting queries.',
+                RuntimeWarning,
+            )
+            return self.build_match(query.subquery)
+        if isinstance(query, wsq.Not):
+            if self.build_match(query.subquery) == MATCH_ALL:
+                return MATCH_NONE
+            raise NotImplementedError(
+                '`Not` is only supported within `And` by the FTS5 backend.',
+            )
+        if isinstance(query, wsq.And):
+            return self.build_and(query.subqueries)
+        if isinstance(query, wsq.Or):
+            subqueries = [self.build_match(sub) for sub in query.subqueries]
+            if MATCH_ALL in subqueries:
+                return MATCH_ALL
+            subqueries = [sub for sub in subqueries if sub != MATCH_NONE]
+            if not subqueries:
+                return MATCH_NONE
+            return '({0})'.format(' OR '.join(subqueries))
+        raise NotImplementedError(
+            '`{0}` is not supported by the FTS5 search backend.'.format(
+                query.__class__.__name__,
+            ),
+        )
+
+    def build_and(self, subqueries):
+        """Return expression of an ``And``, with FTS5's binary NOT."""
+        included = []
+        excluded = []
+        for subquery in subqueries:
+            if isinstance(subquery, wsq.Not):
+                excluded.append(self.build_match(subquery.subquery))
+            else:
+                included.append(self.build_match(subquery))
+        if MATCH_NONE in included or MATCH_ALL in excluded:
+            return MATCH_NONE
+        included = [sub for sub in included if sub != MATCH_ALL]
+        if not included:
+            if excluded:
+                raise NotImplementedError(
+                    'The FTS5 search backend cannot search for `Not` alone.',
+                )
+            return MATCH_ALL
+        expression = '({0})'.format(' AND '.join(included))
+        for sub in excluded:
+            if sub != MATCH_NONE:
+                expression = f'{expression} NOT {sub}'
+        return expression
+
+
+class FTS5SearchResults(wsbb.BaseSearchResults):
+    """Search results ranked by BM25, with keyset pagination."""
+
+    def __init__(self, *args, **kwargs):  # noqa: D107
+        super().__init__(*args, **kwargs)
+        self._seek = None
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._seek = self._seek
+        return clone
+
+    def seek(self, after=None, before=None):
+        """
+        Return the results after or before a ``(rank, pk)`` cursor.
+
+        Results before the cursor come closest first, i.e. in reverse order.
+        Unlike slicing with an offset, seeking costs the same however deep
+        the cursor is.
+
+        """  # noqa: DAR101, DAR201
+        clone = self._clone()
+        if after is not None:
+            clone._seek = ('>', after)
+        elif before is not None:
+            clone._seek = ('<', before)
+        return clone
+
+    def get_queryset(self):
+        """Return the searched queryset joined with the matching entries."""
+        compiler = self.query_compiler
+        queryset = compiler.queryset
+        expression = compiler.get_match_expression()
+        if expression == MATCH_NONE:
+            return queryset.none()
+        if expression == MATCH_ALL:
+            return queryset
+        model = queryset.model
+        pk_column = '"{0}"."{1}"'.format(
+            model._meta.db_table,
+            model._meta.pk.column,
+        )
+        rank = 'bm25({0}, %s, 1.0)'.format(FTS_TABLE)
+        select = {RANK_FIELD: rank}
+        select_params = [self.backend.title_weight]
+        if self._score_field:
+            # BM25 scores are negative, the better the match the lower.
+            select[self._score_field] = f'-{rank}'
+            select_params.append(self.backend.title_weight)
+        where = [
+            f'{FTS_TABLE} MATCH %s',
+            f'{FTS_TABLE}.rowid = search_indexentry.id',
+            # The unary + keeps SQLite from looping over the entries and
+            # evaluating the MATCH once per entry, instead of just once.
+            '+search_indexentry.content_type_id = %s',
+            f'search_indexentry.object_id = {pk_column}',
+        ]
+        params = [expression, get_content_type_id(model)]
+        ordering = [RANK_FIELD, 'pk']
+        if self._seek is not None:
+            operator, (cursor_rank, cursor_pk) = self._seek
+            where.append(
+                f'({rank} {operator} %s OR '
+                f'({rank} = %s AND {pk_column} {operator} %s))',
+            )
+            params.extend([
+                self.backend.title_weight,
+                cursor_rank,
+                self.backend.title_weight,
+                cursor_rank,
+                cursor_pk,
+            ])
+            if operator == '<':
+                ordering = [f'-{RANK_FIELD}', '-pk']
+        queryset = queryset.extra(
+            select=select,
+            select_params=select_params,
+            tables=[IndexEntry._meta.db_table, FTS_TABLE],
+            where=where,
+            params=params,
+        )
+        if compiler.order_by_relevance or self._seek is not None:
+            queryset = queryset.order_by(*ordering)
+        return queryset
+
+    def _do_search(self):
+        queryset = self.get_queryset()[self.start:self.stop]
+        if self._score_field and RANK_FIELD not in queryset.query.extra:
+            queryset = queryset.annotate(**{
+                self._score_field: djm.Value(
+                    None,
+                    output_field=djm.FloatField(),
+                ),
+            })
+        return queryset.iterator()
+
+    def _do_count(self):
+        return self.get_queryset()[self.start:self.stop].count()
+
+
+class FTS5SearchBackend(wsbb.BaseSearchBackend):
+    """Search backend on an SQLite FTS5 index."""
+
+    query_compiler_class = FTS5SearchQueryCompiler
+    results_class = FTS5SearchResults
+    rebuilder_class = FTS5SearchRebuilder
+
+    def __init__(self, params):  # noqa: D107
+        super().__init__(params)
+        self.title_weight = float(params.get('TITLE_WEIGHT', 2.0))
+
+    def get_index_for_model(self, model):  # noqa: D102
+        return FTS5Index(self)
+
+    def get_rebuilder(self):  # noqa: D102
+        return self.rebuilder_class(self.get_index_for_model(None))
+
+    def reset_index(self):  # noqa: D102
+        IndexEntry.objects.all().delete()
+
+
+SearchBackend = FTS5SearchBackend
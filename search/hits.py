@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+"""
+Buffered recording of search hits.
+
+``Query.get(query_string).add_hit()`` costs at least two writes per search.
+Instead, hits are counted in memory per process, by normalised query string
+and day, and a background thread adds them to the ``wagtailsearch`` daily
+hit rows every ``SEARCH_HITS_FLUSH_INTERVAL`` seconds, or as soon as
+``SEARCH_HITS_FLUSH_THRESHOLD`` hits are pending. The buffer is flushed once
+more when the process exits gracefully. Counts of a failed flush are put
+back into the buffer and retried with the next one.
+"""
+
+import atexit
+import collections
+import logging
+import threading
+
+from django.conf import settings  # type: ignore[import]
+from django.db import connection as djconnection  # type: ignore[import]
+from django.db import models as djm  # type: ignore[import]
+from django.db import transaction  # type: ignore[import]
+from django.utils import timezone  # type: ignore[import]
+from wagtail.search import models as wsm  # type: ignore[import]
+from wagtail.search.utils import normalise_query_string  # type: ignore[import]
+
+logger = logging.getLogger(__name__)
+
+
+class HitBuffer(object):
+    """Thread-safe counter of hits by query string and date."""
+
+    def __init__(self):  # noqa: D107
+        self._counts = collections.Counter()
+        self._lock = threading.Lock()
+        self.pending = 0
+
+    def add(self, query_string, date, hits=1):
+        """Count hits and return the number of hits pending."""
+        with self._lock:
+            self._counts[(query_string, date)] += hits
+            self.pending += hits
+            return self.pending
+
+    def take(self):
+        """Return and reset the counted hits."""
+        with self._lock:
+            counts = self._counts
+            self._counts = collections.Counter()
+            self.pending = 0
+        return counts
+
+    def put_back(self, counts):
+        """Add counts that could not be written back to the buffer."""
+        with self._lock:
+            self._counts.update(counts)
+            self.pending += sum(counts.values())
+
+
+buffer = HitBuffer()
+
+
+def is_buffered():
+    """Return whether hits are buffered instead of written per search."""
+    return settings.SEARCH_HITS_BUFFERED
+
+
+def record(query_string):
+    """Record a hit of the query string."""
+    if not is_buffered():
+        wsm.Query.get(query_string).add_hit()
+        return
+    query_string = normalise_query_string(query_string)
+    if not query_string:
+        return
+    pending = buffer.add(query_string, timezone.now().date())
+    flusher = Flusher.ensure_started()
+    if pending >= settings.SEARCH_HITS_FLUSH_THRESHOLD:
+        flusher.wake()
+
+
+def get_query_ids(query_strings):
+    """Return ids of the queries by query string, creating missing ones."""
+    query_ids = dict(
+        wsm.Query.objects.filter(
+            query_string__in=query_strings,
+        ).values_list('query_string', 'pk'),
+    )
+    missing = set(query_strings) - set(query_ids)
+    if missing:
+        # Other processes may create the same queries concurrently.
+        wsm.Query.objects.bulk_create(
+            [wsm.Query(query_string=query_string) for query_string in missing],
+            ignore_conflicts=True,
+        )
+        query_ids.update(
+            wsm.Query.objects.filter(
+                query_string__in=missing,
+            ).values_list('query_string', 'pk'),
+        )
+    return query_ids
+
+
+def write_hits(counts):
+    """Add counted hits to the daily hit rows in one transaction."""
+    with transaction.atomic():
+        query_ids = get_query_ids({query_string for query_string, _ in counts})
+        hits = {
+            (query_ids[query_string], date): count
+            for (query_string, date), count in counts.items()
+        }
+        existing = set(
+            wsm.QueryDailyHits.objects.filter(
+                query_id__in={query_id for query_id, _ in hits},
+                date__in={date for _, date in hits},
+            ).values_list('query_id', 'date'),
+        )
+        for query_id, date in existing & set(hits):
+            wsm.QueryDailyHits.objects.filter(
+                query_id=query_id,
+                date=date,
+            ).update(hits=djm.F('hits') + hits[(query_id, date)])
+        wsm.QueryDailyHits.objects.bulk_create([
+            wsm.QueryDailyHits(query_id=query_id, date=date, hits=count)
+            for (query_id, date), count in hits.items()
+            if (query_id, date) not in existing
+        ])
+
+
+def flush():
+    """Write the buffered hits to the database, return hits written."""
+    counts = buffer.take()
+    if not counts:
+        return 0
+    try:
+        write_hits(counts)
+    except Exception:
+        buffer.put_back(counts)
+        raise
+    return sum(counts.values())
+
+
+class Flusher(threading.Thread):
+    """Background thread that periodically flushes the hit buffer."""
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, interval):  # noqa: D107
+        super().__init__(name='search-hits-flusher', daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.woken = threading.Event()
+
+    @classmethod
+    def ensure_started(cls):
+        """Start the flusher of this process unless it is running already."""
+        instance = cls._instance
+        if instance is not None and instance.is_alive():
+            return instance
+        with cls._lock:
+            if cls._instance is None or not cls._instance.is_alive():
+                cls._instance = cls(settings.SEARCH_HITS_FLUSH_INTERVAL)
+                cls._instance.start()
+                atexit.register(cls._instance.stop)
+        return cls._instance
+
+    def run(self):  # noqa: D102
+        while not self.stopped.is_set():
+            self.woken.wait(self.interval)
+            self.woken.clear()
+            self.flush_once()
+
+    def wake(self):
+        """Flush now instead of at the end of the interval."""
+        self.woken.set()
+
+    def flush_once(self):
+        """Flush the buffer and log instead of dying on errors."""
+        try:
+            flush()
+        except Exception:
+            logger.exception('Flushing search hits failed.')
+        finally:
+            djconnection.close()
+
+    def stop(self):
+        """Stop the loop and flush what is left."""
+        self.stopped.set()
+        self.woken.set()
+        self.join(timeout=self.interval)
+        # Taking the buffer is atomic, so this is safe even if the loop is
+        # still busy flushing.
+        self.flush_once()
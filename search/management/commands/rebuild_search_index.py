@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+"""Rebuild the FTS5 search index."""
+
+from django.core.management.base import BaseCommand  # type: ignore[import]
+from django.core.management.base import CommandError  # type: ignore[import]
+from wagtail.search.backends import get_search_backend  # type: ignore[import]
+
+from search import cache
+from search import fts5
+
+
+class Command(BaseCommand):
+    """Index all indexed objects in the FTS5 search backend again."""
+
+    help = (  # noqa: WPS125
+        'Index all searchable objects in the FTS5 search backend again. '
+        'Searches keep working while the index is rebuilt.'
+    )
+
+    def add_arguments(self, parser):  # noqa: D102
+        parser.add_argument(
+            '--backend',
+            default='default',
+            help='Name of the search backend in WAGTAILSEARCH_BACKENDS.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Objects indexed per transaction.',
+        )
+        parser.add_argument(
+            '--fts-only',
+            action='store_true',
+            help=(
+                'Only rebuild the FTS5 table from the stored entries, e.g. '
+                'after changing the tokenizer.'
+            ),
+        )
+
+    def handle(self, *args, **options):  # noqa: D102
+        backend = get_search_backend(options['backend'])
+        if not isinstance(backend, fts5.FTS5SearchBackend):
+            raise CommandError(
+                f'Search backend {options["backend"]} is not the FTS5 backend.',
+            )
+        index = backend.get_index_for_model(None)
+        if options['fts_only']:
+            index.execute_command('rebuild')
+            index.execute_command('optimize')
+            cache.invalidate()
+            self.stdout.write('Rebuilt the FTS5 table.')
+            return
+        indexed = index.rebuild(chunk_size=options['chunk_size'])
+        cache.invalidate()
+        self.stdout.write(f'Indexed {indexed} objects.')
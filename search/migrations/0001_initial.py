@@ -0,0 +1,87 @@
+# Generated by Django 3.0.14 on 2026-10-18 10:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# External content FTS5 table over search_indexentry, kept in sync by triggers.
+CREATE_FTS_SQL = [
+    """
+    CREATE VIRTUAL TABLE search_indexentry_fts USING fts5(
+        title, body,
+        content='search_indexentry', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER search_indexentry_fts_insert
+    AFTER INSERT ON search_indexentry BEGIN
+        INSERT INTO search_indexentry_fts (rowid, title, body)
+        VALUES (new.id, new.title, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER search_indexentry_fts_delete
+    AFTER DELETE ON search_indexentry BEGIN
+        INSERT INTO search_indexentry_fts (search_indexentry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER search_indexentry_fts_update
+    AFTER UPDATE ON search_indexentry BEGIN
+        INSERT INTO search_indexentry_fts (search_indexentry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO search_indexentry_fts (rowid, title, body)
+        VALUES (new.id, new.title, new.body);
+    END
+    """,
+]
+
+DROP_FTS_SQL = [
+    'DROP TRIGGER IF EXISTS search_indexentry_fts_update',
+    'DROP TRIGGER IF EXISTS search_indexentry_fts_delete',
+    'DROP TRIGGER IF EXISTS search_indexentry_fts_insert',
+    'DROP TABLE IF EXISTS search_indexentry_fts',
+]
+
+
+def execute_on_sqlite(statements):
+    def execute(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return execute
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.CharField(max_length=50)),
+                ('title', models.TextField()),
+                ('body', models.TextField()),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contenttypes.ContentType')),
+            ],
+            options={
+                'verbose_name_plural': 'index entries',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='indexentry',
+            constraint=models.UniqueConstraint(fields=('content_type', 'object_id'), name='unique_search_index_entry'),
+        ),
+        migrations.RunPython(
+            execute_on_sqlite(CREATE_FTS_SQL),
+            execute_on_sqlite(DROP_FTS_SQL),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+"""Define search models."""
+
+from django.contrib.contenttypes import models as djctm  # type: ignore[import]
+from django.db import models as djm  # type: ignore[import]
+
+
+class IndexEntry(djm.Model):
+    """
+    Searchable text of an indexed object, for the FTS5 search backend.
+
+    The ``search_indexentry_fts`` FTS5 table indexes ``title`` and ``body``
+    of these rows as external content. Triggers keep it in sync, so entries
+    are written with the ORM like any other model.
+    """
+
+    # Content type of the topmost concrete model, e.g. Page for all pages.
+    content_type = djm.ForeignKey(
+        djctm.ContentType,
+        on_delete=djm.CASCADE,
+        related_name='+',
+    )
+    object_id = djm.CharField(max_length=50)
+    title = djm.TextField()
+    body = djm.TextField()
+
+    class Meta:  # noqa: D106, WPS306
+        verbose_name_plural = 'index entries'
+        constraints = [
+            djm.UniqueConstraint(
+                fields=['content_type', 'object_id'],
+                name='unique_search_index_entry',
+            ),
+        ]
+
+    def __str__(self):  # noqa: D105
+        return f'{self.content_type_id}:{self.object_id}'
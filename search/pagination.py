@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+"""
+Keyset pagination of search results.
+
+Django's ``Paginator`` counts all results and skips ``OFFSET`` rows on every
+page, so deep pages get slower and slower. Here, pages are addressed by an
+opaque cursor holding the rank and primary key of the result next to them,
+and fetching a page costs the same however deep it is. One extra result is
+fetched to know whether there is another page.
+
+The results of the FTS5 backend ``seek`` to a cursor in rank order. Wagtail's
+database backend does not rank its results: they are ordered by primary key
+and seek on it, with a rank of 0 in their cursors. Results of backends that
+can do neither, e.g. Elasticsearch, are paginated by offset, with cursors
+holding the position of the result next to them.
+"""
+
+import base64
+import binascii
+import json
+
+from search import fts5
+
+
+class KeysetPage(object):
+    """One page of results with cursors to its neighbours."""
+
+    def __init__(  # noqa: D107
+        self,
+        items,
+        next_cursor=None,
+        previous_cursor=None,
+    ):
+        self.object_list = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):  # noqa: D105
+        return iter(self.object_list)
+
+    def __len__(self):  # noqa: D105
+        return len(self.object_list)
+
+    def has_next(self):  # noqa: D102
+        return self.next_cursor is not None
+
+    def has_previous(self):  # noqa: D102
+        return self.previous_cursor is not None
+
+
+def encode_key(key):
+    """Return the cursor of a ``(rank, pk)`` or ``(offset,)`` key."""
+    return base64.urlsafe_b64encode(
+        json.dumps(key, separators=(',', ':')).encode('utf-8'),
+    ).decode('ascii').rstrip('=')
+
+
+def encode_cursor(result):
+    """Return the cursor of a result."""
+    return encode_key([getattr(result, fts5.RANK_FIELD, 0), result.pk])
+
+
+class PrimaryKeySeek(object):
+    """Unranked results of a queryset, seeking on the primary key."""
+
+    def __init__(self, queryset):  # noqa: D107
+        self.queryset = queryset
+
+    def seek(self, after=None, before=None):
+        """Return the results after or before a ``(rank, pk)`` cursor."""
+        if after is not None:
+            return self.queryset.filter(pk__gt=after[1]).order_by('pk')
+        if before is not None:
+            return self.queryset.filter(pk__lt=before[1]).order_by('-pk')
+        return self.queryset.order_by('pk')
+
+
+def get_seekable(results):
+    """Return results that can seek to a cursor, ``None`` if impossible."""
+    if hasattr(results, 'seek'):
+        return results
+    get_queryset = getattr(results, 'get_queryset', None)
+    if get_queryset is None:
+        return None
+    return PrimaryKeySeek(get_queryset())
+
+
+def is_keyset_key(key):  # noqa: D103
+    return (
+        len(key) == 2 and
+        isinstance(key[0], (int, float)) and
+        isinstance(key[1], int)
+    )
+
+
+def is_offset_key(key):  # noqa: D103
+    return len(key) == 1 and isinstance(key[0], int) and key[0] >= 0
+
+
+def decode_cursor(cursor):
+    """
+    Return the key of a cursor, or ``None`` if it is invalid.
+
+    Keys are ``(rank, pk)`` of a result or ``(offset,)`` of a position.
+
+    """  # noqa: DAR101, DAR201
+    if not cursor:
+        return None
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(
+            (cursor + padding).encode('ascii'),
+        ))
+    except (binascii.Error, UnicodeError, ValueError, TypeError):
+        return None
+    if not isinstance(key, list):
+        return None
+    if not is_keyset_key(key) and not is_offset_key(key):
+        return None
+    return tuple(key)
+
+
+def paginate_by_offset(results, per_page, after=None, before=None):
+    """Return the page of results that cannot seek, by position."""
+    if before is not None and is_offset_key(before):
+        end = before[0]
+        start = max(end - per_page, 0)
+        return KeysetPage(
+            list(results[start:end]),
+            next_cursor=encode_key([end]),
+            previous_cursor=encode_key([start]) if start else None,
+        )
+    start = after[0] if after is not None and is_offset_key(after) else 0
+    items = list(results[start:start + per_page + 1])
+    page_items = items[:per_page]
+    return KeysetPage(
+        page_items,
+        next_cursor=(
+            encode_key([start + per_page]) if len(items) > per_page else None
+        ),
+        previous_cursor=encode_key([start]) if start and page_items else None,
+    )
+
+
+def paginate(results, per_page, after=None, before=None):
+    """Return the page of results after or before a decoded cursor."""
+    seekable = get_seekable(results)
+    if seekable is None:
+        return paginate_by_offset(
+            results,
+            per_page,
+            after=after,
+            before=before,
+        )
+    after = after if after is not None and is_keyset_key(after) else None
+    before = before if before is not None and is_keyset_key(before) else None
+    if before is not None:
+        items = list(seekable.seek(before=before)[:per_page + 1])
+        # Seeking backwards returns the closest results first.
+        page_items = items[:per_page][::-1]
+        return KeysetPage(
+            page_items,
+            next_cursor=encode_cursor(page_items[-1]) if page_items else None,
+            previous_cursor=(
+                encode_cursor(page_items[0]) if len(items) > per_page else None
+            ),
+        )
+    items = list(seekable.seek(after=after)[:per_page + 1])
+    page_items = items[:per_page]
+    return KeysetPage(
+        page_items,
+        next_cursor=(
+            encode_cursor(page_items[-1]) if len(items) > per_page else None
+        ),
+        previous_cursor=(
+            encode_cursor(page_items[0])
+            if after is not None and page_items else None
+        ),
+    )
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+"""
+Invalidate cached search results when content changes.
+
+Like the GraphQL cache in :mod:`api.signals`, only after the change commits.
+"""
+
+from django.db import transaction  # type: ignore[import]
+from django.db.models import signals as djsignals  # type: ignore[import]
+from wagtail.core import models as wtm  # type: ignore[import]
+from wagtail.core import signals as wtsignals  # type: ignore[import]
+
+from search import cache
+
+
+def invalidate_result_cache(sender, **kwargs):
+    """Drop cached search results of all processes on commit."""
+    transaction.on_commit(cache.invalidate)
+
+
+def invalidate_on_page_delete(sender, instance, **kwargs):
+    """Drop cached search results when a live page is deleted."""
+    if instance.live:
+        transaction.on_commit(cache.invalidate)
+
+
+wtsignals.page_published.connect(invalidate_result_cache)
+wtsignals.page_unpublished.connect(invalidate_result_cache)
+djsignals.post_delete.connect(invalidate_on_page_delete, sender=wtm.Page)
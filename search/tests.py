@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+
+"""Test for the search app."""
+
+from http import HTTPStatus
+import io
+
+from api.cache import Generation
+from django.core import management as djmgmt  # type: ignore[import]
+from django.core.cache import cache as djcache  # type: ignore[import]
+from django.db.models import Sum  # type: ignore[import]
+import pytest  # type: ignore[import]
+from wagtail.core import models as wtm  # type: ignore[import]
+from wagtail.search import models as wsm  # type: ignore[import]
+from wagtail.search import query as wsq  # type: ignore[import]
+
+from content.models import SomePage
+from home.models import HomePage
+from search import cache
+from search import hits
+from search import pagination
+from search.models import IndexEntry
+
+DATABASE_BACKEND = {
+    'default': {'BACKEND': 'wagtail.search.backends.db'},
+}
+
+
+def get_hits(query_string):  # noqa: D103
+    return wsm.QueryDailyHits.objects.filter(
+        query__query_string=query_string,
+    ).aggregate(total=Sum('hits'))['total']
+
+
+class FakeFlusher(object):
+    """Stands in for the flusher thread, which must not touch the test DB."""
+
+    def __init__(self):  # noqa: D107
+        self.woken = 0
+
+    def wake(self):  # noqa: D102
+        self.woken += 1
+
+
+class TestSearchHits(object):
+    """Test buffered recording of search hits."""
+
+    @pytest.fixture(autouse=True)
+    def flusher(self, monkeypatch):  # noqa: D102
+        hits.buffer.take()
+        flusher = FakeFlusher()
+        monkeypatch.setattr(hits.Flusher, 'ensure_started', lambda: flusher)
+        yield flusher
+        hits.buffer.take()
+
+    def test_search_does_not_write_hits(
+        self,
+        client,
+        db,
+        settings,
+    ):  # noqa: D102
+        # The manifest only exists after collectstatic.
+        settings.STATICFILES_STORAGE = (
+            'django.contrib.staticfiles.storage.StaticFilesStorage'
+        )
+
+        res = client.get('/search/', {'query': 'Contact'})
+
+        assert res.status_code == HTTPStatus.OK
+        assert not wsm.Query.objects.exists()
+        assert hits.buffer.pending == 1
+
+    def test_flush_aggregates_hits(self, db):  # noqa: D102
+        hits.record('Contact')
+        hits.record('  contact ')
+        hits.record('Imprint')
+
+        assert hits.flush() == 3
+
+        assert get_hits('contact') == 2
+        assert get_hits('imprint') == 1
+        assert wsm.QueryDailyHits.objects.count() == 2
+        assert hits.buffer.pending == 0
+
+    def test_flush_adds_to_existing_daily_hits(self, db):  # noqa: D102
+        wsm.Query.get('contact').add_hit()
+        hits.record('Contact')
+
+        hits.flush()
+
+        assert get_hits('contact') == 2
+        assert wsm.QueryDailyHits.objects.count() == 1
+
+    def test_threshold_wakes_flusher(self, flusher, settings):  # noqa: D102
+        settings.SEARCH_HITS_FLUSH_THRESHOLD = 2
+
+        hits.record('contact')
+        assert flusher.woken == 0
+
+        hits.record('imprint')
+        assert flusher.woken == 1
+
+    def test_failed_flush_keeps_hits(self, db, monkeypatch):  # noqa: D102
+        hits.record('contact')
+
+        def fail(counts):  # noqa: WPS430
+            raise RuntimeError()
+
+        with monkeypatch.context() as patch:
+            patch.setattr(hits, 'write_hits', fail)
+            with pytest.raises(RuntimeError):
+                hits.flush()
+
+        assert hits.buffer.pending == 1
+
+    def test_unbuffered_hits_are_written_at_once(
+        self,
+        db,
+        settings,
+    ):  # noqa: D102
+        settings.SEARCH_HITS_BUFFERED = False
+
+        hits.record('Contact')
+
+        assert get_hits('contact') == 1
+        assert hits.buffer.pending == 0
+
+
+@pytest.fixture(autouse=True)
+def fts5_backend(settings):
+    """Search with the FTS5 backend, which is opt-in."""
+    settings.WAGTAILSEARCH_BACKENDS = {
+        'default': settings.SEARCH_FTS5_BACKEND,
+    }
+
+
+@pytest.fixture
+def add_page(db):
+    """Return function that adds a live content page below the home page."""
+    def _add_page(title, intro='<p>Text</p>'):  # noqa: WPS430
+        page = SomePage(title=title, intro=intro)
+        HomePage.objects.first().add_child(instance=page)
+        return page
+    return _add_page
+
+
+def search_titles(query_string, **kwargs):  # noqa: D103
+    return [
+        page.title
+        for page in wtm.Page.objects.live().search(query_string, **kwargs)
+    ]
+
+
+class TestFTS5Backend(object):
+    """Test the FTS5 search backend."""
+
+    def test_saved_pages_are_indexed(self, add_page):  # noqa: D102
+        page = add_page('Contact us')
+
+        entry = IndexEntry.objects.get(object_id=str(page.pk))
+
+        assert entry.title == 'Contact us'
+        assert search_titles('contact') == ['Contact us']
+
+    def test_matches_stems_and_prefixes(self, add_page):  # noqa: D102
+        add_page('Contacting the support team')
+
+        assert search_titles('contacts') == ['Contacting the support team']
+        assert search_titles('supp') == ['Contacting the support team']
+        assert search_titles('supp', partial_match=False) == []
+
+    def test_ranks_by_bm25(self, add_page):  # noqa: D102
+        add_page('Opening hours of the office and the shop')
+        add_page('Office')
+
+        results = wtm.Page.objects.live().search('office').annotate_score(
+            'score',
+        )
+
+        assert [page.title for page in results][0] == 'Office'
+        assert results[0].score > results[1].score > 0
+
+    def test_operators_and_phrases(self, add_page):  # noqa: D102
+        add_page('Contact the office')
+        add_page('Contact the shop')
+
+        assert len(search_titles('contact office')) == 1
+        assert len(search_titles('contact office', operator='or')) == 2
+        assert search_titles(wsq.Phrase('the shop')) == ['Contact the shop']
+        assert search_titles(
+            wsq.PlainText('contact') & ~wsq.PlainText('shop'),
+        ) == ['Contact the office']
+
+    def test_query_syntax_is_not_interpreted(self, add_page):  # noqa: D102
+        add_page('Contact')
+
+        assert search_titles('"contact') == ['Contact']
+        assert search_titles('contact AND NOT (') == []
+
+    def test_unpublished_pages_are_not_found(self, add_page):  # noqa: D102
+        page = add_page('Contact')
+
+        page.unpublish()
+
+        assert search_titles('contact') == []
+        assert wtm.Page.objects.search('contact').count() == 1
+
+    def test_deleted_pages_are_removed(self, add_page):  # noqa: D102
+        page = add_page('Contact')
+
+        page.delete()
+
+        assert not IndexEntry.objects.filter(object_id=str(page.pk)).exists()
+
+    def test_renamed_pages_are_updated(self, add_page):  # noqa: D102
+        page = add_page('Contact')
+
+        page.title = 'Imprint'
+        page.save_revision().publish()
+
+        assert search_titles('contact') == []
+        assert search_titles('imprint') == ['Imprint']
+
+    def test_rebuild_command(self, add_page):  # noqa: D102
+        add_page('Contact')
+        IndexEntry.objects.all().delete()
+        stdout = io.StringIO()
+
+        djmgmt.call_command('rebuild_search_index', stdout=stdout)
+
+        assert 'Indexed' in stdout.getvalue()
+        assert search_titles('contact') == ['Contact']
+
+        djmgmt.call_command('rebuild_search_index', '--fts-only', stdout=stdout)
+
+        assert search_titles('contact') == ['Contact']
+
+
+class CountingResults(object):
+    """Stands in for search results and counts how often they are counted."""
+
+    def __init__(self):  # noqa: D107
+        self.counted = 0
+
+    def count(self):  # noqa: D102
+        self.counted += 1
+        return 42  # noqa: WPS432
+
+
+class TestSearchPagination(object):
+    """Test keyset pagination and cached results of the search view."""
+
+    @pytest.fixture(autouse=True)
+    def search_cache(self, monkeypatch, settings, tmp_path):  # noqa: D102
+        monkeypatch.setattr(
+            cache,
+            'generation',
+            Generation(str(tmp_path / 'generation')),
+        )
+        # The manifest only exists after collectstatic.
+        settings.STATICFILES_STORAGE = (
+            'django.contrib.staticfiles.storage.StaticFilesStorage'
+        )
+        settings.SEARCH_HITS_BUFFERED = False
+        # Unbuffered hits take more queries than the search view budget.
+        settings.MONITORING_QUERY_BUDGETS_STRICT = False
+        djcache.clear()
+        yield
+        djcache.clear()
+
+    def test_cursors_walk_all_results(self, add_page):  # noqa: D102
+        for number in range(5):
+            add_page(f'Contact {number}')
+        results = wtm.Page.objects.live().search('contact')
+        expected = [page.pk for page in results]
+
+        pages = [pagination.paginate(results, 2)]
+        while pages[-1].has_next():
+            after = pagination.decode_cursor(pages[-1].next_cursor)
+            pages.append(pagination.paginate(results, 2, after=after))
+
+        assert [page.pk for page in pages[-1]] == expected[4:]
+        assert [result.pk for page in pages for result in page] == expected
+
+        before = pagination.decode_cursor(pages[-1].previous_cursor)
+        previous = pagination.paginate(results, 2, before=before)
+
+        assert [page.pk for page in previous] == expected[2:4]
+        assert previous.has_previous()
+        assert previous.has_next()
+
+    def test_database_backend_seeks_on_primary_key(
+        self,
+        add_page,
+        settings,
+        django_assert_num_queries,
+    ):  # noqa: D102
+        settings.WAGTAILSEARCH_BACKENDS = DATABASE_BACKEND
+        for number in range(5):
+            add_page(f'Contact {number}')
+        results = wtm.Page.objects.live().search('contact')
+        expected = sorted(page.pk for page in results)
+
+        pages = [pagination.paginate(results, 2)]
+        while pages[-1].has_next():
+            after = pagination.decode_cursor(pages[-1].next_cursor)
+            with django_assert_num_queries(1) as captured:
+                pages.append(pagination.paginate(results, 2, after=after))
+        before = pagination.decode_cursor(pages[-1].previous_cursor)
+        previous = pagination.paginate(results, 2, before=before)
+
+        assert after == (0, expected[3])
+        assert 'OFFSET' not in captured[0]['sql']
+        assert [result.pk for page in pages for result in page] == expected
+        assert [page.pk for page in previous] == expected[2:4]
+        assert previous.has_previous()
+        assert previous.has_next()
+
+    def test_other_backends_page_by_offset(self):  # noqa: D102
+        results = list(range(5))
+
+        first = pagination.paginate(results, 2)
+        after = pagination.decode_cursor(first.next_cursor)
+        second = pagination.paginate(results, 2, after=after)
+        before = pagination.decode_cursor(second.previous_cursor)
+
+        assert after == (2,)
+        assert list(second) == [2, 3]
+        assert list(pagination.paginate(results, 2, before=before)) == [0, 1]
+
+    def test_view_pages_database_backend(self, add_page, client, settings):  # noqa: D102, E501
+        settings.WAGTAILSEARCH_BACKENDS = DATABASE_BACKEND
+        settings.SEARCH_RESULTS_PER_PAGE = 2
+        for number in range(3):
+            add_page(f'Contact {number}')
+
+        first = client.get('/search/', {'query': 'contact'})
+        cursor = first.context['search_results'].next_cursor
+        second = client.get('/search/', {'query': 'contact', 'after': cursor})
+
+        assert first.status_code == HTTPStatus.OK
+        assert len(first.context['search_results']) == 2
+        assert len(second.context['search_results']) == 1
+        assert second.context['search_results'].has_previous()
+
+    def test_view_links_next_page(self, add_page, client, settings):  # noqa: D102
+        settings.SEARCH_RESULTS_PER_PAGE = 2
+        for number in range(3):
+            add_page(f'Contact {number}')
+
+        first = client.get('/search/', {'query': 'contact'})
+        cursor = first.context['search_results'].next_cursor
+        second = client.get('/search/', {'query': 'contact', 'after': cursor})
+
+        assert len(first.context['search_results']) == 2
+        assert len(second.context['search_results']) == 1
+        assert not second.context['search_results'].has_next()
+        assert f'after={cursor}' in first.content.decode()
+
+    def test_invalid_cursor_shows_first_page(self, add_page, client):  # noqa: D102, E501
+        add_page('Contact')
+
+        res = client.get('/search/', {'query': 'contact', 'after': '!!'})
+
+        assert res.status_code == HTTPStatus.OK
+        assert len(res.context['search_results']) == 1
+
+    def test_count_is_cached_per_query(self, db):  # noqa: D102
+        results = CountingResults()
+
+        assert cache.get_count('Contact', results) == 42
+        assert cache.get_count(' contact  ', results) == 42
+        assert results.counted == 1
+
+        cache.invalidate()
+        cache.get_count('contact', results)
+
+        assert results.counted == 2
+
+    def test_view_shows_count_if_enabled(self, add_page, client, settings):  # noqa: D102, E501
+        settings.SEARCH_RESULT_COUNTS = True
+        add_page('Contact')
+
+        res = client.get('/search/', {'query': 'contact'})
+
+        assert res.context['search_count'] == 1
+        assert '1 result' in res.content.decode()
+
+    def test_popular_first_page_is_cached(self, settings):  # noqa: D102
+        settings.SEARCH_FIRST_PAGE_CACHE_MIN_HITS = 2
+        built = []
+
+        def paginate():  # noqa: WPS430
+            built.append(1)
+            return pagination.KeysetPage(['result'])
+
+        for _ in range(3):
+            page = cache.get_first_page('contact', paginate)
+
+        assert list(page) == ['result']
+        assert len(built) == 2
+
+    def test_publishing_invalidates_cache_on_commit(
+        self,
+        add_page,
+        run_on_commit,
+    ):  # noqa: D102
+        page = add_page('Contact')
+        run_on_commit()
+        key = cache.make_key('count', 'contact')
+
+        page.save_revision().publish()
+
+        assert cache.make_key('count', 'contact') == key
+        run_on_commit()
+        assert cache.make_key('count', 'contact') != key
@@ -1,34 +1,50 @@
-from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.conf import settings
 from django.template.response import TemplateResponse
 
 from wagtail.core.models import Page
-from wagtail.search.models import Query
+
+from contact_form_prototype import routers
+from monitoring import metrics
+from search import cache
+from search import hits
+from search import pagination
 
 
 def search(request):
     search_query = request.GET.get('query', None)
-    page = request.GET.get('page', 1)
-
-    # Search
-    if search_query:
-        search_results = Page.objects.live().search(search_query)
-        query = Query.get(search_query)
-
-        # Record hit
-        query.add_hit()
-    else:
-        search_results = Page.objects.none()
-
-    # Pagination
-    paginator = Paginator(search_results, 10)
-    try:
-        search_results = paginator.page(page)
-    except PageNotAnInteger:
-        search_results = paginator.page(1)
-    except EmptyPage:
-        search_results = paginator.page(paginator.num_pages)
+    after = pagination.decode_cursor(request.GET.get('after'))
+    before = pagination.decode_cursor(request.GET.get('before'))
+    search_count = None
+
+    # Search on the read replica, timed without rendering the results
+    with metrics.search_seconds.time(), routers.replica_reads():
+        if search_query:
+            results = Page.objects.live().search(search_query)
+
+            # Record hit, buffered to keep writes off the request path
+            hits.record(search_query)
+
+            # Pagination, by cursor instead of page number and offset
+            def paginate():
+                return pagination.paginate(
+                    results,
+                    settings.SEARCH_RESULTS_PER_PAGE,
+                    after=after,
+                    before=before,
+                )
+
+            if after is None and before is None:
+                search_results = cache.get_first_page(search_query, paginate)
+            else:
+                search_results = paginate()
+
+            if settings.SEARCH_RESULT_COUNTS:
+                search_count = cache.get_count(search_query, results)
+        else:
+            search_results = pagination.KeysetPage([])
 
     return TemplateResponse(request, 'search/search.html', {
         'search_query': search_query,
         'search_results': search_results,
+        'search_count': search_count,
     })